@@ -1,8 +1,6 @@
 #!/usr/bin/python3
 import configargparse
 import sys
-import os.path
-from requests import HTTPError
 from jiradash.loader import run_command
 
 COMMANDS = [
@@ -13,6 +11,15 @@ COMMANDS = [
     "burnup",
     "csvimport",
     "listinput",
+    "serve",
+    "replay",
+    "export",
+    "diff",
+    "matrix",
+    "velocity",
+    "flow",
+    "impact",
+    "search",
 ]
 
 
@@ -48,10 +55,52 @@ class MyConfig:
         p.add('--jira-server', help="Jira server URL", required=True)
         p.add('--jira-project', help="Jira project", required=True, action='append')
         p.add('--jira-filter', help="Filter conditions to add to Jira query. Ex: '--jira-filter fixVersions = alpha1'", action='append')
+        p.add('--local-filter', help="Download all issues of the project(s) once, and evaluate --jira-filter locally when possible", action='store_true')
         p.add('--groupby', help="Group epics or issues by this field in mermaid or csv output. Ex: '--groupby components'", choices=['fixVersions', 'components'])
 
         p.add('--out-dir', '-o', help="Directory where to output graphs", default="mermaid_out")
         p.add('--csvfile', help="CSV input data")
+        p.add('--gzip', help="Also write a gzipped .html.gz next to every html output", action='store_true')
+        p.add('--cache-dir', help="Directory where to cache data fetched from Jira", default="~/.cache/JiraDash")
+        p.add('--no-cache', help="Always query everything from Jira", action='store_true')
+        p.add('--offline', help="Only use cached data, never connect to Jira", action='store_true')
+        p.add('--metadata-ttl', help="Seconds to cache custom field ids, versions and components", type=int, default=86400)
+        p.add('--federate', help="Load each --jira-project in parallel, with its own connection and cache", action='store_true')
+        p.add('--jira-instance', help="Also load the projects of another Jira server. Ex: '--jira-instance other=~/.config/JiraDash-other'", action='append')
+        p.add('--metrics-file', help="Write Prometheus metrics to this file when done, for the node_exporter textfile collector. serve: After every refresh")
+        p.add('--jobs', '-j', help="Number of parallel Jira requests or worker processes", type=int, default=8)
+
+        p.add('--burnup-source', help="burnup: Download all issues, or only run count queries per bucket", choices=['issues', 'count'], default='issues')
+        p.add('--burnup-points', help="burnup: Maximum number of points per line in the html chart", type=int, default=500)
+        p.add('--bucket', help="burnup: Time period of one point in the chart", choices=['day', 'week', 'month', 'sprint'], default='day')
+
+        p.add('--grid-html', help="grid: Write every issue into the html, or compact json that the browser renders as needed", choices=['full', 'compact'], default='full')
+        p.add('--renderer', help="gantt, dependencies: Draw SVG with mermaid-cli, or directly without a browser", choices=['mermaid', 'svg'], default='mermaid')
+        p.add('--resources-by', help="gantt: Limit how many epics each component or assignee works on at a time", choices=['components', 'assignee'])
+        p.add('--capacity', help="gantt: Epics a component or assignee works on in parallel. Default is estimated from history. Ex: '--capacity Core=3'", action='append')
+
+        p.add('--export-format', help="export: File format", choices=['parquet', 'arrow'], default='parquet')
+        p.add('--export-changelog', help="export: Query the full status history of each issue from Jira", action='store_true')
+
+        p.add('--flow-changelog', help="flow: Query the status history of each issue from Jira, for cycle times", action='store_true')
+        p.add('--flow-sketch', help="flow: Merge the quantile sketches of another flow run, can be repeated. Ex: '--flow-sketch other/WID_flow.sketch.json'", action='append')
+
+        p.add('--impact-key', help="impact: Issue or epic to list everything it blocks and waits on, can be repeated. Default is a list of the issues blocking the most unfinished work", action='append')
+
+        p.add('--search', help="search: Words to search in key, summary, components, fix versions and assignee, and field:value filters on key, project, component, fixversion, assignee, status, category, type and epic. Ex: 'timeout* component:Core status:\"In Progress\"'")
+        p.add('--search-limit', help="search: Number of results to list", type=int, default=50)
+
+        p.add('--since', help="diff: Compare with the snapshot of this day or the latest before it, YYYY-MM-DD. Default is the latest before today")
+
+        p.add('--matrix-command', help="matrix: Command to draw, can be repeated. Default is grid, gantt, dependencies and burnup", choices=['grid', 'gantt', 'dependencies', 'burnup', 'export'], action='append')
+        p.add('--matrix-groupby', help="matrix: --groupby to draw each command with, can be repeated. Default is all", choices=['none', 'fixVersions', 'components'], action='append')
+        p.add('--matrix-filter', help="matrix: Filter added to --jira-filter, can be repeated to draw a report per filter. Ex: '--matrix-filter \"fixVersion = 1.0\"'", action='append')
+
+        p.add('--bind', help="serve: Address to listen on", default="127.0.0.1")
+        p.add('--port', help="serve: Port to listen on", type=int, default=8080)
+        p.add('--refresh-interval', help="serve: Seconds between incremental refreshes from Jira", type=int, default=300)
+        p.add('--webhook-dir', help="serve: Save received Jira webhook payloads here. replay: Apply the payloads saved here")
+        p.add('--webhook-secret', help="serve: Only accept webhooks posted to /webhook?secret=<this>")
 
         p.add('command', help="command to execute", nargs=1, choices=COMMANDS)
 
@@ -2,20 +2,28 @@
 """
 Create a burnup chart using nvd3.
 
+The per day counts behind the chart are saved next to the cached issues. On the next run only the
+issues that changed in between are subtracted and added back, instead of counting everything again.
+
+With `--burnup-source count` no issues are downloaded at all. Instead each point of the chart is
+a few JQL queries that only return the number of matching issues. That works for projects that are
+too big to download, but only issue counts can be plotted this way.
+
+The html chart has at most --burnup-points points per line. The series are step functions, so
+most days can be dropped without changing the shape: only the days where a value changes are kept,
+and if that is still too many, Largest-Triangle-Three-Buckets picks the visually important ones.
+The csv has every day.
+
+With `--bucket sprint` there is a point per sprint of the project's main scrum board, with the
+values at the end of the sprint (see jiradash.sprints).
+
 """
-import dateutil.parser
-import dateutil.relativedelta
+from concurrent.futures import ThreadPoolExecutor
 import datetime
-import errno
-from jiradash.jira_model import JiraModel
+import sys
+from jiradash.jira_model import create_model
 from jiradash.io import Writer
 import json
-from requests import HTTPError
-import os
-import re
-import subprocess
-import sys
-import time
 
 def entry_point(my_config):
     print(f"Printing a grid grouping of Epics in project(s): {my_config['jira_project']}")
@@ -23,27 +31,19 @@ def entry_point(my_config):
     b.get_and_draw()
 
 class Burnup:
-    def __init__(self, my_config):
+    def __init__(self, my_config, model=None):
         self.conf = my_config
-        self.model = JiraModel(my_config)
+        self.model = model if model else create_model(my_config)
         self.writer = Writer(my_config)
         self.project = self.writer.project
         self.base = self.writer.base
 
     def get_and_draw(self):
-        project = "JiraDash"
-        projects = self.conf['jira_project'] if self.conf['jira_project'] else []
-        if len(projects) >= 1:
-            project = "_".join(projects)
-
-        base = project
-        for jira_filter in self.conf['jira_filter'] if self.conf['jira_filter'] else []:
-            base += "_" + self.model.safe_chars(jira_filter).replace(" ", "_")
-        if self.conf.args.groupby:
-            base += "_" + self.conf.args.groupby
-
-        issues = self.model.get_issues()
-        series, date_range = self.generate_series(issues)
+        if self.conf['burnup_source'] == "count":
+            series, date_range = self.count_series()
+        else:
+            series, date_range = self.issue_series()
+        series, date_range = rebucket(series, date_range, self.conf['bucket'], self.sprint_windows())
 
         csv = self.burnup_csv(series, date_range, self.project)
         self.writer.csv(csv)
@@ -51,6 +51,77 @@ class Burnup:
         html = self.burnup_html(series, date_range, self.project)
         self.writer.html(html)
 
+    def issue_series(self):
+        counters = self.load_counters()
+        self.model.listeners.append(counters.update)
+        issues = self.model.get_issues()
+
+        if counters.synced_at is None or counters.synced_at != self.model.cached_synced_at.get('issues'):
+            print("Counting burnup for all issues")
+            counters.rebuild(issues)
+        counters.synced_at = self.model.synced_at['issues']
+        self.save_counters(counters)
+        return counters.series()
+
+    def count_series(self):
+        """
+        Same series as issue_series(), but computed with count queries, one per series per bucket.
+        The queries run in --jobs parallel threads.
+        """
+        if self.conf['bucket'] == "sprint":
+            windows = self.sprint_windows()
+            starts = [start for _, start, _ in windows]
+            ends = [end + datetime.timedelta(days=1) for _, _, end in windows]
+        else:
+            first = self.model.first_created('issues')
+            if first is None:
+                sys.exit("--burnup-source count: No issues match the query.")
+            starts = bucket_starts(first.date(), datetime.date.today(), self.conf['bucket'])
+            ends = [next_bucket(start, self.conf['bucket']) for start in starts]
+
+        clauses = []
+        for end in ends:
+            end = end.strftime("%Y-%m-%d")
+            clauses.append(f"created < \"{end}\"")
+            clauses.append(f"statusCategory = \"In Progress\" AND statusCategoryChangedDate < \"{end}\"")
+            clauses.append(f"resolved < \"{end}\"")
+
+        print(f"Running {len(clauses)} count queries")
+        with ThreadPoolExecutor(max_workers=self.conf['jobs']) as pool:
+            counts = list(pool.map(lambda clause: self.model.count('issues', clause), clauses))
+
+        resolved = counts[2::3]
+        series = {
+            'issues': counts[0::3],
+            # For inprogress, we also want to add already resolved count
+            'inprogress': [started + done for started, done in zip(counts[1::3], resolved)],
+            'resolved': resolved,
+        }
+        date_range = {'min': starts[0], 'max': starts[-1], 'days': len(starts) - 1, 'dates': starts}
+        return series, date_range
+
+    def sprint_windows(self):
+        """
+        :return: list of (name, start, end) of the sprints, with --bucket sprint. Else None.
+        """
+        if self.conf['bucket'] != "sprint":
+            return None
+        windows = self.model.get_sprints().windows()
+        if not windows:
+            sys.exit("--bucket sprint: No sprints found on the scrum boards of the project(s).")
+        return windows
+
+    def load_counters(self):
+        if self.model.cache:
+            cached = self.model.cache.load_json(self.model.cache_file('issues', 'burnup'))
+            if cached:
+                return BurnupCounters.from_json(cached)
+        return BurnupCounters()
+
+    def save_counters(self, counters):
+        if self.model.cache:
+            self.model.cache.save_json(self.model.cache_file('issues', 'burnup'), counters.to_json())
+
     def get_minmax(self, issues):
         created_dates = [obj['created_date'] for obj in issues.values() if obj['created_date']]
         start_dates = [obj['start_date'] for obj in issues.values() if obj['start_date']]
@@ -60,12 +131,10 @@ class Burnup:
         return {'max': max_date, 'min': min_date}
 
     def burnup_csv(self, series, date_range, project):
-        days = date_range['days']
-
         title = " AND ".join(self.conf.args.jira_filter) if self.conf.args.jira_filter else project
 
         csv = title
-        for day in (date_range['min'] + datetime.timedelta(d+1) for d in range(days)):
+        for day in date_range['dates']:
             day_str = day.strftime("%Y-%m-%d")
             csv += f"\t{day_str}"
         csv += "\n"
@@ -77,30 +146,9 @@ class Burnup:
         return csv
 
     def generate_series(self, issues):
-        date_range = self.get_minmax(issues)
-        days = date_range['max'] - date_range['min']
-        days = max(days.days,1)
-        date_range['days'] = days
-
-        # 3 arrays that have one element per day in date_range
-        series = {'issues': [0]*(days+1), 'inprogress': [0]*(days+1), 'resolved': [0]*(days+1)}
-        for obj in issues.values():
-            series['issues'][ (obj['created_date']-date_range['min']).days] += 1
-            if obj['start_date']:
-                series['inprogress'][ (obj['start_date']-date_range['min']).days] += 1
-            if obj['resolution_date']:
-                series['resolved'][ (obj['resolution_date']-date_range['min']).days] += 1
-
-        # Now recode arrays so that each element includes the sum of previous days
-        for i in range(1, days+1):
-            series['issues'][i] = series['issues'][i-1] + series['issues'][i]
-            series['inprogress'][i] = series['inprogress'][i-1] + series['inprogress'][i]
-            series['resolved'][i] = series['resolved'][i-1] + series['resolved'][i]
-        # For inprogress, we also want to add already resolved count
-        for i in range(1, days+1):
-            series['inprogress'][i] = series['inprogress'][i] + series['resolved'][i]
-
-        return series, date_range
+        counters = BurnupCounters()
+        counters.rebuild(issues)
+        return counters.series()
 
     def burnup_html(self, series, date_range, project):
         days = date_range['days']
@@ -118,6 +166,18 @@ class Burnup:
 <svg width="960" height="500" id="chart"></svg>
 </div>
 <script>
+// Points are stored as columns: x is days since start, delta encoded
+expand = function(data) {
+  return data.series.map(function(s) {
+    var day = 0;
+    var values = s.x.map(function(dx, i) {
+      day += dx;
+      return {x: new Date(data.start[0], data.start[1], data.start[2] + day).getTime(), y: s.y[i]};
+    });
+    return {values: values, key: s.key, color: s.color, area: true};
+  });
+};
+
 generateGraph = function() {
   var chart = nv.models.lineChart()
                 .margin({left: 100})  //Adjust chart margins to give the x-axis some breathing room.
@@ -135,7 +195,7 @@ generateGraph = function() {
       .axisLabel('Issues')
       .tickFormat(d3.format('.02f'));
 
-  var myData = """ + input_data + """
+  var myData = expand(""" + input_data + """);
 
   d3.select('#chart svg')    //Select the <svg> element you want to render the chart in.   
       .datum(myData)         //Populate the <svg> element with chart data...
@@ -153,21 +213,217 @@ nv.addGraph(generateGraph);
         return head + style + "</head>\n<body>\n" + d3graph + "</body>\n</html>"
 
     def format_nvd3_data(self, series, date_range):
-        issues = []
-        inprogress = []
-        resolved = []
-        for d in range(date_range['days']+1):
-            date = date_range['min']+datetime.timedelta(days=d)
-            #date = date.strftime("%Y-%m-%d")
-            date = int(time.mktime(date.timetuple())) * 1000
-
-            issues.append({'x': date, 'y': series['issues'][d]})
-            inprogress.append({'x': date, 'y': series['inprogress'][d]})
-            resolved.append({'x': date, 'y': series['resolved'][d]})
-
-        data = [
-            {'values': issues, 'key': 'Issues', 'color': '#ffff00', 'area': 'true'},
-            {'values': inprogress, 'key': 'In progress', 'color': '#00aa00', 'area': 'true'},
-            {'values': resolved, 'key': 'Resolved', 'color': '#111111', 'area': 'true'},
-        ]
-        return json.dumps(data)
+        """
+        :return: json with the downsampled series as columns, expanded by expand() in the page.
+        """
+        dates = date_range['dates']
+        start = dates[0]
+        days = [(date - start).days for date in dates]
+        lines = [('issues', 'Issues', '#ffff00'), ('inprogress', 'In progress', '#00aa00'),
+                 ('resolved', 'Resolved', '#111111')]
+
+        data = {'start': [start.year, start.month - 1, start.day], 'series': []}
+        for name, label, color in lines:
+            values = series[name]
+            keep = downsample(days, values, self.conf['burnup_points'])
+            x = [days[i] for i in keep]
+            data['series'].append({
+                'key': label,
+                'color': color,
+                'x': [x[0]] + [b - a for a, b in zip(x, x[1:])] if x else [],
+                'y': [values[i] for i in keep],
+            })
+        return json.dumps(data, separators=(",", ":"))
+
+
+
+def bucket_starts(first, last, bucket="day"):
+    """
+    :return: list of the first days of each bucket, from the one containing first to the one
+             containing last.
+    """
+    if bucket == "week":
+        day = first - datetime.timedelta(days=first.weekday())
+    elif bucket == "month":
+        day = first.replace(day=1)
+    else:
+        day = first
+    starts = []
+    while day <= last:
+        starts.append(day)
+        day = next_bucket(day, bucket)
+    return starts
+
+def next_bucket(day, bucket="day"):
+    if bucket == "week":
+        return day + datetime.timedelta(days=7)
+    if bucket == "month":
+        return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return day + datetime.timedelta(days=1)
+
+def downsample(xs, ys, max_points):
+    """
+    :return: Sorted indexes of the points to draw, at most max_points of them.
+    """
+    keep = change_points(ys)
+    if len(keep) > max_points:
+        kept = lttb([xs[i] for i in keep], [ys[i] for i in keep], max_points)
+        keep = [keep[i] for i in kept]
+    return keep
+
+def change_points(ys):
+    """
+    Indexes of the points a step function can be drawn with: first and last, and on both sides
+    of each change of value.
+    """
+    if len(ys) <= 2:
+        return list(range(len(ys)))
+    keep = [0]
+    for i in range(1, len(ys)):
+        if ys[i] != ys[i-1]:
+            if keep[-1] != i - 1:
+                keep.append(i - 1)
+            keep.append(i)
+    if keep[-1] != len(ys) - 1:
+        keep.append(len(ys) - 1)
+    return keep
+
+def lttb(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling (Steinarsson 2013).
+
+    :return: Indexes of threshold points, including the first and last one.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    keep = [0]
+    a = 0
+    for b in range(threshold - 2):
+        start = int(b * every) + 1
+        end = int((b + 1) * every) + 1
+        # Average of the next bucket is the third corner of the triangle
+        next_start, next_end = end, min(int((b + 2) * every) + 1, n)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+        best, best_area = start, -1
+        for i in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[i] - ys[a]) - (xs[a] - xs[i]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = i, area
+        keep.append(best)
+        a = best
+    keep.append(n - 1)
+    return keep
+
+def rebucket(series, date_range, bucket="day", sprints=None):
+    """
+    Turn a cumulative series with a value per day into one with a value per bucket. Each bucket
+    gets the value of the last day in it.
+
+    :param sprints: With bucket "sprint", list of (name, start, end) dates of the sprints.
+    """
+    dates = date_range['dates']
+    if bucket == "day" or (len(dates) > 1 and (dates[1] - dates[0]).days > 1):
+        return series, date_range
+
+    if bucket == "sprint":
+        starts = [start for _, start, _ in sprints]
+        last_index = [max(min((end - dates[0]).days, len(dates) - 1), 0) for _, _, end in sprints]
+    else:
+        starts = bucket_starts(dates[0], dates[-1], bucket)
+        last_index = [min((next_bucket(start, bucket) - dates[0]).days - 1, len(dates) - 1) for start in starts]
+    new_series = {name: [values[i] for i in last_index] for name, values in series.items()}
+    new_range = {'min': starts[0], 'max': starts[-1], 'days': len(starts) - 1, 'dates': starts}
+    return new_series, new_range
+
+
+class BurnupCounters:
+    """
+    Number of issues created, started and resolved per calendar day.
+
+    The days each issue was counted on are remembered, so that a changed issue can be subtracted
+    and added back without recounting the others. update() has the signature of a JiraModel
+    listener.
+    """
+    def __init__(self):
+        # "YYYY-MM-DD" -> [created, started, resolved]
+        self.days = {}
+        # key -> [created day, started day, resolved day], days are None if not applicable
+        self.contrib = {}
+        # JiraModel.synced_at of the issues these counts are for
+        self.synced_at = None
+
+    def rebuild(self, issues):
+        self.days = {}
+        self.contrib = {}
+        for key, obj in issues.items():
+            self.add(key, obj)
+
+    def add(self, key, obj):
+        dates = [obj['created_date'], obj['start_date'], obj['resolution_date']]
+        contrib = [d.strftime("%Y-%m-%d") if d else None for d in dates]
+        for i, day in enumerate(contrib):
+            if day:
+                self.days.setdefault(day, [0, 0, 0])[i] += 1
+        self.contrib[key] = contrib
+
+    def remove(self, key):
+        contrib = self.contrib.pop(key, None)
+        if not contrib:
+            return
+        for i, day in enumerate(contrib):
+            if day:
+                counts = self.days[day]
+                counts[i] -= 1
+                if not any(counts):
+                    del self.days[day]
+
+    def update(self, kind, key, old, new):
+        if kind != 'issues':
+            return
+        self.remove(key)
+        if new is not None:
+            self.add(key, new)
+
+    def series(self):
+        """
+        :return: tuple (series, date_range). series has cumulative 'issues', 'inprogress' and
+                 'resolved' lists with one element per day in date_range.
+        """
+        min_day = datetime.date.fromisoformat(min(self.days))
+        max_day = datetime.date.fromisoformat(max(self.days))
+        days = max((max_day - min_day).days, 1)
+        date_range = {'min': min_day, 'max': max_day, 'days': days,
+                      'dates': [min_day + datetime.timedelta(days=d) for d in range(days+1)]}
+
+        # 3 arrays that have one element per day in date_range
+        series = {'issues': [0]*(days+1), 'inprogress': [0]*(days+1), 'resolved': [0]*(days+1)}
+        for day, (created, started, resolved) in self.days.items():
+            d = (datetime.date.fromisoformat(day) - min_day).days
+            series['issues'][d] += created
+            series['inprogress'][d] += started
+            series['resolved'][d] += resolved
+
+        # Now recode arrays so that each element includes the sum of previous days
+        for i in range(1, days+1):
+            series['issues'][i] = series['issues'][i-1] + series['issues'][i]
+            series['inprogress'][i] = series['inprogress'][i-1] + series['inprogress'][i]
+            series['resolved'][i] = series['resolved'][i-1] + series['resolved'][i]
+        # For inprogress, we also want to add already resolved count
+        for i in range(1, days+1):
+            series['inprogress'][i] = series['inprogress'][i] + series['resolved'][i]
+
+        return series, date_range
+
+    def to_json(self):
+        return {'synced_at': self.synced_at, 'days': self.days, 'contrib': self.contrib}
+
+    @classmethod
+    def from_json(cls, cached):
+        counters = cls()
+        counters.synced_at = cached['synced_at']
+        counters.days = cached['days']
+        counters.contrib = cached['contrib']
+        return counters
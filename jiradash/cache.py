@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+"""
+Local on-disk cache for data fetched from Jira.
+
+Files live in `--cache-dir`, in a subdirectory per Jira server so that configs pointing to
+different servers don't mix their data. Writes go to a temp file that is then renamed, so a
+crashed or concurrent run never sees a half written file.
+
+"""
+import hashlib
+import json
+import os
+import tempfile
+from urllib.parse import urlparse
+from jiradash.io import mkdir_p
+
+
+class Cache:
+    def __init__(self, my_config):
+        self.conf = my_config
+        cache_dir = os.path.expanduser(my_config['cache_dir'])
+        server = urlparse(my_config['jira_server']).netloc or my_config['jira_server']
+        self.dir = os.path.join(cache_dir, server.replace(":", "_"))
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def load_json(self, name):
+        """
+        :return: The cached object, or None if there is no such file or it is unreadable.
+        """
+        try:
+            with open(self.path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            print(f"Ignoring corrupt cache file {self.path(name)}: {e}")
+            return None
+
+    def save_json(self, name, obj):
+        self.save_bytes(name, json.dumps(obj).encode("utf-8"))
+
+    def save_bytes(self, name, content):
+        mkdir_p(self.dir)
+        fd, tmp_name = tempfile.mkstemp(dir=self.dir, prefix=f".{name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_name, self.path(name))
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        return self.path(name)
+
+
+def cache_name(*parts):
+    """
+    Derive a short file name from for example a jql query string.
+    """
+    digest = hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+    return digest[:16]
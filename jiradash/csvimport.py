@@ -6,9 +6,9 @@ TODO:
 """
 
 import csv
-from jiradash.jira_client import JiraClient, CUSTOM_FIELD
+from jiradash.jira_client import JiraClient
+from jiradash.metadata import Metadata
 from requests import HTTPError
-import sys
 
 def entry_point(my_config):
     print(f"Create new issues from csv file {my_config['csvfile']} in {my_config['jira_project']}.")
@@ -21,6 +21,7 @@ class CsvImport:
         self.jira_client = JiraClient(my_config)
         self.jira_client.conn()
         self.jira = self.jira_client.jira
+        self.fields = Metadata(my_config, self.jira_client).fields()
 
         self.project = self.conf['jira_project'][0]
 
@@ -75,7 +76,7 @@ class CsvImport:
         issue['issuetype'] = {'name': "Bug"}
         issue['project'] = {'key': self.project}
         issue['summary'] = f"Port bug: {DB_issue} - {row['Summary']}"
-        issue[CUSTOM_FIELD['Epic']] = "STAR-99"
+        issue[self.fields['Epic']] = "STAR-99"
         issue['labels'] = ['db-stargazer-port', 'db-stargazer-port-bug', 'db-stargazer-bulk-created']
         issue['description'] = """Please port the bug fix from https://datastax.jira.com/browse/""" + DB_issue + """
             
@@ -2,15 +2,13 @@
 """
 Create a graph using the "depends on" links and draw a SVG using mermaid-cli syntax.
 
+Epics that transitively wait on unfinished epics or issues get a dashed red border.
+
 """
 
-import errno
-from jiradash.jira_model import JiraModel
+from jiradash.jira_model import create_model
 from jiradash.mermaid_wrapper import Mermaid
-from requests import HTTPError
-import os
-import re
-import sys
+from jiradash.svg import Svg
 
 def entry_point(my_config):
     print(f"Creating dependency diagram of Epics in project(s): {my_config['jira_project']}")
@@ -21,19 +19,24 @@ class Dependencies:
     styles = """    classDef ToDo fill:#fff,stroke:#999,stroke-width:1px,color:#777;
     classDef InProgress fill:#7a7,stroke:#060,stroke-width:3px,color:#000;
     classDef Done fill:#999,stroke:#222,stroke-width:3px,color:#000;
+    classDef Blocked stroke:#c00,stroke-dasharray:5 5;
     """
-    def __init__(self, my_config):
+    def __init__(self, my_config, model=None):
         self.conf = my_config
-        self.model = JiraModel(my_config)
+        self.model = model if model else create_model(my_config)
         self.mermaid = Mermaid(my_config)
+        self.svg = Svg(my_config)
         self.project = self.mermaid.project
         self.base = self.mermaid.base
 
     def get_and_draw(self):
         epics = self.model.get_epics()
 
-        markup = self.draw_group(epics)
-        self.mermaid.exec_mermaid(markup)
+        if self.conf['renderer'] == "svg":
+            self.svg.write_file(self.svg.dependencies(epics, self.conf.args.groupby, self.blocked()), extension="svg")
+        else:
+            markup = self.draw_group(epics)
+            self.mermaid.exec_mermaid(markup)
 
     def draw_group(self, graph):
         output = "graph RL;\n"
@@ -45,6 +48,7 @@ class Dependencies:
 
         urls = ""
         classes = ""
+        blocked = self.blocked()
         start_node = "start"
 
         for component in groups:
@@ -58,6 +62,8 @@ class Dependencies:
 
                 urls += f"    click {key} \"{obj['url']}\" \"{obj['summary']}\"\n"
                 classes += f"    class {key} {self._get_css_class(obj)}\n"
+                if key in blocked:
+                    classes += f"    class {key} Blocked\n"
                 if obj['deps']:
                     for dep in obj['deps']:
                         output += f"    {key}[{key} {obj['epic_name']}]-->{dep}\n"
@@ -70,6 +76,12 @@ class Dependencies:
         #print(output)
         return output
 
+    def blocked(self):
+        """
+        :return: Unfinished epics (and issues) that transitively wait on unfinished work.
+        """
+        return self.model.get_reachability().blocked()
+
     def _get_css_class(self, obj):
         css_class = obj['statusCategory'].replace(" ", "")
         return css_class
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+"""
+Report what changed in the issues and epics since an earlier day.
+
+Every run of this command archives the normalized issues and epics as a dated snapshot in the
+cache (see jiradash.snapshot), and compares them with the latest archived snapshot from before
+today, or from --since. Each archived issue is stored with a hash of its normalized fields, so
+unchanged issues are skipped by comparing two integers, and only issues that actually changed are
+looked at in detail. Archives written without hashes, or with other fields, are compared field by
+field, leaving out the fields they don't have.
+
+    ./JiraDash.py diff
+    ./JiraDash.py diff --since 2024-05-01
+
+"""
+import datetime
+import glob
+import hashlib
+import html
+import json
+import os
+import sys
+from jiradash import snapshot
+from jiradash.io import Writer
+from jiradash.jira_model import create_model
+
+# Fields issue_hash() covers: all archived fields. deps isn't archived, it's derived from all_deps.
+HASHED = list(snapshot.COLUMNS)
+
+def entry_point(my_config):
+    print(f"Listing changes in project(s): {my_config['jira_project']}")
+    diff = Diff(my_config)
+    diff.get_and_draw()
+
+class Diff:
+    def __init__(self, my_config, model=None):
+        self.conf = my_config
+        self.model = model if model else create_model(my_config)
+        self.writer = Writer(my_config)
+        self.project = self.writer.project
+
+    def get_and_draw(self):
+        if not self.model.cache:
+            sys.exit("The diff command keeps its history in the cache, it can't be used with --no-cache.")
+        objs = {**self.model.get_epics(), **self.model.get_issues()}
+        hashes = {key: issue_hash(obj) for key, obj in objs.items()}
+        today = datetime.date.today()
+        self.archive(objs, hashes, today)
+
+        since, old, old_hashes = self.load_archive(today)
+        if old is None:
+            print("No earlier snapshot to compare with yet. Run this again tomorrow.")
+            return
+        print(f"Comparing with {since}")
+
+        changes = diff_objs(old, objs, old_hashes, hashes)
+        scope = epic_scope(old, objs)
+        self.writer.csv(self.diff_csv(changes, scope, since))
+        self.writer.html(self.diff_html(changes, scope, since))
+
+    def archive_name(self, day):
+        return self.model.cache_file('issues', 'history', extension=f"{day}.snapshot")
+
+    def archive(self, objs, hashes, day):
+        content = snapshot.dump(objs, self.model.synced_at.get('issues', 0), hashes=hashes, hashed=HASHED)
+        if content is not None:
+            self.model.cache.save_bytes(self.archive_name(day), content)
+
+    def load_archive(self, today):
+        """
+        :return: tuple (day, objs, hashes) of the snapshot to compare with, or (None, None, None).
+                 hashes is None if they weren't computed from the same fields as issue_hash().
+        """
+        pattern = self.model.cache.path(self.archive_name("*"))
+        days = sorted(os.path.basename(path).split(".")[-2] for path in glob.glob(pattern))
+        if self.conf['since']:
+            days = [day for day in days if day <= self.conf['since']]
+        else:
+            days = [day for day in days if day < today.isoformat()]
+        if not days:
+            return None, None, None
+        with snapshot.Snapshot(self.model.cache.path(self.archive_name(days[-1]))) as snap:
+            hashes = snap.hashes() if snap.header.get('hashed') == HASHED else None
+            return days[-1], snap.objs(strict=False), hashes
+
+    def diff_csv(self, changes, scope, since):
+        csv = f"{self.project} changes since {since}\n"
+        csv += "Key\tChange\tOld\tNew\tSummary\n"
+        for key, change, old, new, summary in changes:
+            csv += f"{key}\t{change}\t{old}\t{new}\t{summary}\n"
+        csv += "\nEpic\tIssues added\tIssues removed\tPoints added\n"
+        for epic, (added, removed, points) in scope.items():
+            csv += f"{epic}\t{added}\t{removed}\t{points}\n"
+        return csv
+
+    def diff_html(self, changes, scope, since):
+        title = html.escape(f"{self.project} changes since {since}")
+        browse = self.conf['jira_server'] + "/browse/"
+        rows = ""
+        for key, change, old, new, summary in changes:
+            rows += (f"<tr><td><a href=\"{html.escape(browse + key)}\">{html.escape(key)}</a></td>"
+                     f"<td>{change}</td><td>{html.escape(str(old))}</td><td>{html.escape(str(new))}</td>"
+                     f"<td>{html.escape(summary)}</td></tr>\n")
+        scope_rows = ""
+        for epic, (added, removed, points) in scope.items():
+            scope_rows += (f"<tr><td><a href=\"{html.escape(browse + epic)}\">{html.escape(epic)}</a></td>"
+                           f"<td>{added}</td><td>{removed}</td><td>{points:+g}</td></tr>\n")
+
+        style = """<style type="text/css">
+    table {border-collapse: collapse; font-family: sans-serif; margin-bottom: 2em;}
+    td, th {padding: 3px 8px; border-top: 1px solid #ddd; text-align: left;}
+</style>
+"""
+        return (f"<html>\n<head><title>{title}</title>\n{style}</head>\n<body>\n<h1>{title}</h1>\n"
+                f"<table>\n<tr><th>Key</th><th>Change</th><th>Old</th><th>New</th><th>Summary</th></tr>\n{rows}</table>\n"
+                f"<h2>Scope per epic</h2>\n<table>\n<tr><th>Epic</th><th>Issues added</th><th>Issues removed</th>"
+                f"<th>Points added</th></tr>\n{scope_rows}</table>\n</body>\n</html>")
+
+
+def issue_hash(obj):
+    """
+    :return: 64 bit hash of the HASHED fields of a normalized issue.
+    """
+    fields = json.dumps([obj.get(name) for name in HASHED], default=str).encode("utf-8")
+    return int.from_bytes(hashlib.sha1(fields).digest()[:8], "little")
+
+
+def unchanged(old, new):
+    """
+    :return: True if the normalized fields are equal. deps is left out, it only depends on what else
+             is loaded, and so are fields that an older archive doesn't have yet.
+    """
+    return all(old[name] == value for name, value in new.items() if name != 'deps' and name in old)
+
+
+def diff_objs(old, new, old_hashes=None, new_hashes=None):
+    """
+    :param dict old_hashes: key -> issue_hash() of the old issues, if the archive has them.
+    :param dict new_hashes: key -> issue_hash() of the new issues.
+    :return: list of (key, change, old value, new value, summary), sorted by key.
+    """
+    hashed = old_hashes is not None and new_hashes is not None
+    changes = []
+    for key in sorted(old.keys() | new.keys()):
+        if key not in old:
+            changes.append((key, "Added", "", new[key]['status'], new[key]['summary']))
+            continue
+        if key not in new:
+            changes.append((key, "Removed", old[key]['status'], "", old[key]['summary']))
+            continue
+        a, b = old[key], new[key]
+        same = old_hashes.get(key) == new_hashes[key] if hashed else unchanged(a, b)
+        if same:
+            continue
+
+        summary = b['summary']
+        if a['status'] != b['status']:
+            changes.append((key, "Status", a['status'], b['status'], summary))
+        if a['all_fixVersions'] != b['all_fixVersions']:
+            changes.append((key, "Fix version", " ".join(a['all_fixVersions']), " ".join(b['all_fixVersions']), summary))
+        if a.get('epic') != b.get('epic'):
+            changes.append((key, "Epic", a.get('epic', ""), b.get('epic', ""), summary))
+        if a['points'] != b['points']:
+            changes.append((key, "Points", a['points'], b['points'], summary))
+        for dep in sorted(set(b['all_deps']) - set(a['all_deps'])):
+            changes.append((key, "Dependency added", "", dep, summary))
+        for dep in sorted(set(a['all_deps']) - set(b['all_deps'])):
+            changes.append((key, "Dependency removed", dep, "", summary))
+    return changes
+
+
+def epic_scope(old, new):
+    """
+    Scope change of each epic: issues that were added to it (created or moved in), issues that
+    were removed from it, and the net change of story points.
+
+    :return: dict epic -> [added, removed, points], only epics whose scope changed
+    """
+    scope = {}
+    def count(epic, added, removed, points):
+        s = scope.setdefault(epic, [0, 0, 0.0])
+        s[0] += added
+        s[1] += removed
+        s[2] += points
+
+    for key in old.keys() | new.keys():
+        a, b = old.get(key), new.get(key)
+        old_epic = a.get('epic') if a else None
+        new_epic = b.get('epic') if b else None
+        if old_epic == new_epic:
+            if old_epic and a['points'] != b['points']:
+                count(old_epic, 0, 0, b['points'] - a['points'])
+            continue
+        if old_epic:
+            count(old_epic, 0, 1, -a['points'])
+        if new_epic:
+            count(new_epic, 1, 0, b['points'])
+    return {epic: s for epic, s in sorted(scope.items()) if any(s)}
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+"""
+Export the normalized model as Parquet or Arrow IPC files, for analysis in pandas, DuckDB etc.
+
+Three tables are written to --out-dir:
+
+    <base>_issues.parquet       One row per issue and epic, dates as timestamps, categorical
+                                columns like status and components dictionary encoded.
+    <base>_deps.parquet         One row per "Depends on" link. resolved tells whether the target
+                                issue is part of the export.
+    <base>_transitions.parquet  Status changes. With --export-changelog these are queried from the
+                                Jira changelog, otherwise only the latest known status change of
+                                each issue is included.
+
+    ./JiraDash.py export --export-format arrow
+
+Needs pyarrow, which is only imported by this command: `pip install pyarrow`
+
+"""
+import importlib.util
+import sys
+from jiradash.io import Writer
+from jiradash.jira_model import create_model
+
+# Columns of the issues table: name -> type. "dict" is a dictionary encoded string.
+ISSUE_COLUMNS = {
+    "key": "string",
+    "kind": "dict",
+    "project": "dict",
+    "issuetype": "dict",
+    "summary": "string",
+    "status": "dict",
+    "statusCategory": "dict",
+    "resolution": "dict",
+    "components": "dict",
+    "all_components": "list",
+    "fixVersions": "dict",
+    "all_fixVersions": "list",
+    "assignee": "dict",
+    "assignee_id": "dict",
+    "epic": "dict",
+    "epic_name": "string",
+    "points": "float",
+    "created_date": "timestamp",
+    "start_date": "timestamp",
+    "statuscategorychangedate": "timestamp",
+    "resolution_date": "timestamp",
+    "url": "string",
+}
+
+def entry_point(my_config):
+    print(f"Exporting project(s): {my_config['jira_project']}")
+    export = Export(my_config)
+    export.run()
+
+class Export(Writer):
+    def __init__(self, my_config, model=None):
+        super().__init__(my_config)
+        self.model = model if model else create_model(my_config)
+
+    def run(self):
+        # Checked before loading the issues, which can take long
+        if importlib.util.find_spec("pyarrow") is None:
+            sys.exit("The export command needs pyarrow: pip install pyarrow")
+
+        epics = self.model.get_epics()
+        issues = self.model.get_issues()
+        objs = list(epics.values()) + list(issues.values())
+
+        tables = {
+            "issues": self.issues_table(objs),
+            "deps": self.deps_table(objs, {**epics, **issues}),
+            "transitions": self.transitions_table(objs),
+        }
+        for name, table in tables.items():
+            self.write_table(table, name)
+
+    def write_table(self, table, name):
+        extension = "parquet" if self.conf['export_format'] == "parquet" else "arrow"
+        file_name = self.path(extension, base=f"{self.base}_{name}")
+        print(f"{table.num_rows} rows in {name}")
+        import pyarrow
+        buf = pyarrow.BufferOutputStream()
+        if extension == "parquet":
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(table, buf)
+        else:
+            import pyarrow.feather
+            pyarrow.feather.write_feather(table, buf, compression="uncompressed")
+        # Through write_bytes(), so that unchanged tables aren't rewritten
+        self.write_bytes(file_name, buf.getvalue().to_pybytes())
+        return file_name
+
+    def issues_table(self, objs):
+        columns = {name: [] for name in ISSUE_COLUMNS}
+        for obj in objs:
+            for name in ISSUE_COLUMNS:
+                columns[name].append(obj.get(name))
+        columns["kind"] = ["epic" if "epic_name" in obj else "issue" for obj in objs]
+        return _table(columns, ISSUE_COLUMNS)
+
+    def deps_table(self, objs, all_objs):
+        columns = {"key": [], "depends_on": [], "resolved": []}
+        for obj in objs:
+            for dep_key in obj['all_deps']:
+                columns["key"].append(obj['key'])
+                columns["depends_on"].append(dep_key)
+                columns["resolved"].append(dep_key in all_objs)
+        return _table(columns, {"key": "string", "depends_on": "string", "resolved": "bool"})
+
+    def transitions_table(self, objs):
+        columns = {"key": [], "at": [], "from_status": [], "to_status": []}
+        if self.conf['export_changelog']:
+            rows = self.model.changelog_transitions()
+        else:
+            rows = [(obj['key'], obj['statuscategorychangedate'], None, obj['status']) for obj in objs]
+        for row in rows:
+            for name, value in zip(columns, row):
+                columns[name].append(value)
+        types = {"key": "string", "at": "timestamp", "from_status": "dict", "to_status": "dict"}
+        return _table(columns, types)
+
+
+def _table(columns, types):
+    import pyarrow as pa
+    arrow_types = {
+        "string": pa.string(),
+        "dict": pa.string(),
+        "list": pa.list_(pa.string()),
+        "float": pa.float64(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    arrays = {}
+    for name, values in columns.items():
+        array = pa.array(values, type=arrow_types[types[name]])
+        arrays[name] = array.dictionary_encode() if types[name] == "dict" else array
+    return pa.table(arrays)
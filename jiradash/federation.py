@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+"""
+Load many projects, possibly from several Jira servers, in parallel into one model.
+
+With --federate, each --jira-project is loaded by its own JiraModel in its own thread, with its
+own connection and cache. Additional Jira servers are given as --jira-instance NAME=CONFIGFILE,
+where CONFIGFILE has the same format as ~/.config/JiraDash:
+
+    [DEFAULT]
+    jira-server=https://other.example.com
+    jira-user=firstname.lastname@example.com
+    jira-token=XXXXXXXXXXXXXXXX
+    jira-project=FOO,BAR
+
+Issues from those servers get keys prefixed with NAME, for example NAME_FOO-123, so they can't
+collide with keys of the main server. A link to an issue in a project that isn't loaded from the
+same server, but is loaded from another one, is resolved to that other server's issue.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import configparser
+from functools import partial
+import os
+from urllib.parse import urlparse
+from jiradash.jira_model import JiraModel
+from jiradash.util import ConfigOverride
+from jiradash.versions import VersionIndex
+
+
+class FederatedModel(JiraModel):
+    def __init__(self, my_config):
+        super().__init__(my_config)
+        # Filters are evaluated by the members
+        self.local_filter = None
+
+        # list of (namespace, JiraModel), namespace is "" for the main server
+        self.members = []
+        for project in my_config['jira_project']:
+            self.members.append(("", JiraModel(ConfigOverride(my_config, jira_project=[project]))))
+        for spec in my_config['jira_instance'] or []:
+            name, path = spec.split("=", 1)
+            instance_config = _instance_config(my_config, path)
+            for project in instance_config['jira_project']:
+                member_config = ConfigOverride(instance_config, jira_project=[project])
+                self.members.append((name, JiraModel(member_config)))
+
+        # namespace -> set of projects loaded from that server
+        self.projects = {}
+        for namespace, member in self.members:
+            self.projects.setdefault(namespace, set()).add(member.conf['jira_project'][0])
+            member.listeners.append(partial(self._member_changed, namespace))
+
+    def _load(self, kind):
+        with ThreadPoolExecutor(max_workers=self.conf['jobs']) as pool:
+            loaded = list(pool.map(lambda m: m[1].get_issues() if kind == 'issues' else m[1].get_epics(), self.members))
+
+        objs = {}
+        for (namespace, member), member_objs in zip(self.members, loaded):
+            for obj in member_objs.values():
+                obj = self._namespaced(namespace, obj)
+                objs[obj['key']] = obj
+        objs = self.remove_dead_end_links(objs)
+        if kind == 'issues':
+            self._issues = objs
+        else:
+            self._epics = objs
+        self.version += 1
+        self._merge_synced_at(kind)
+
+    def _merge_synced_at(self, kind):
+        """
+        The federation is as recent as its least recent member. cached_synced_at is only set when
+        every member was loaded from its cache.
+        """
+        self.synced_at[kind] = min(member.synced_at[kind] for namespace, member in self.members)
+        cached = [member.cached_synced_at.get(kind) for namespace, member in self.members]
+        if None not in cached:
+            self.cached_synced_at[kind] = min(cached)
+
+    def resolve(self, namespace, key):
+        """
+        :return: The key in the merged model for key as seen from the server namespace.
+        """
+        project = key.split("-")[0]
+        if project not in self.projects.get(namespace, ()):
+            for other, projects in self.projects.items():
+                if project in projects:
+                    namespace = other
+                    break
+        return f"{namespace}_{key}" if namespace else key
+
+    def _namespaced(self, namespace, obj):
+        obj = dict(obj)
+        obj['instance'] = namespace
+        obj['key'] = self.resolve(namespace, obj['key'])
+        obj['all_deps'] = [self.resolve(namespace, dep_key) for dep_key in obj['all_deps']]
+        obj['deps'] = list(obj['all_deps'])
+        if 'epic' in obj and obj['epic'] != "No Epic":
+            obj['epic'] = self.resolve(namespace, obj['epic'])
+        if namespace:
+            obj['sprints'] = [f"{namespace}_{sprint_id}" for sprint_id in obj['sprints']]
+        return obj
+
+    def sprint_info(self):
+        sprints = {}
+        for namespace, member in self.members:
+            for sprint_id, info in member.sprint_info().items():
+                if namespace:
+                    sprint_id = f"{namespace}_{sprint_id}"
+                    info = {**info, 'board': f"{namespace}_{info['board']}"}
+                sprints[sprint_id] = info
+        return sprints
+
+    def status_categories(self):
+        categories = {}
+        for namespace, member in self.members:
+            categories.update(member.status_categories())
+        return categories
+
+    def _count_loaded(self, kind, obj, n):
+        # The members count their own issues
+        pass
+
+    def _member_changed(self, namespace, kind, key, old, new):
+        # Members are only loaded by _load(), until then there is nothing to update
+        if self._objects(kind) is None:
+            return
+        key = self.resolve(namespace, key)
+        if new is None:
+            self._remove(kind, key)
+        else:
+            self._put_obj(kind, key, self._namespaced(namespace, new))
+
+    def fetch_changes(self):
+        with ThreadPoolExecutor(max_workers=self.conf['jobs']) as pool:
+            return list(pool.map(lambda m: m[1].fetch_changes(), self.members))
+
+    def apply_changes(self, changes):
+        changed = False
+        for (namespace, member), member_changes in zip(self.members, changes):
+            changed = member.apply_changes(member_changes) or changed
+        for kind in set().union(*changes):
+            self._merge_synced_at(kind)
+        if changed:
+            self.version += 1
+        return changed
+
+    def apply_webhook(self, payload):
+        record = payload.get('issue') or {}
+        if not isinstance(record, dict):
+            raise ValueError("Webhook issue is not an object")
+        host = urlparse(record.get('self', "")).netloc
+        project = record.get('key', "").split("-")[0]
+        changed = False
+        for namespace, member in self.members:
+            same_server = not host or urlparse(member.conf['jira_server']).netloc == host
+            if same_server and member.conf['jira_project'] == [project]:
+                changed = member.apply_webhook(payload) or changed
+        if changed:
+            self.version += 1
+        return changed
+
+    def save_cache(self):
+        for namespace, member in self.members:
+            member.save_cache()
+
+    def count(self, kind, clause=None):
+        return sum(member.count(kind, clause) for namespace, member in self.members)
+
+    def first_created(self, kind):
+        dates = [member.first_created(kind) for namespace, member in self.members]
+        dates = [d for d in dates if d]
+        return min(dates) if dates else None
+
+    def changelog_transitions(self, kinds=('epics', 'issues')):
+        for namespace, member in self.members:
+            for key, at, from_status, to_status in member.changelog_transitions(kinds):
+                yield self.resolve(namespace, key), at, from_status, to_status
+
+    def get_version_index(self):
+        if self._version_index is None:
+            sequences = [[v['name'] for v in member.metadata.versions()] for _, member in self.members]
+            self._version_index = VersionIndex([v for _, member in self.members for v in member.metadata.versions()], sequences)
+        return self._version_index
+
+
+def _instance_config(my_config, path):
+    parser = configparser.ConfigParser()
+    if not parser.read(os.path.expanduser(path)):
+        raise FileNotFoundError(f"--jira-instance config file {path} not found")
+    section = parser['DEFAULT']
+    projects = [p.strip() for p in section.get('jira-project', "").split(",") if p.strip()]
+    return ConfigOverride(my_config,
+                          jira_server=section['jira-server'],
+                          jira_user=section.get('jira-user', my_config['jira_user']),
+                          jira_token=section.get('jira-token', my_config['jira_token']),
+                          jira_project=projects)
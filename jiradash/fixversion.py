@@ -12,9 +12,9 @@ TODO:
    both the old and new version.
 """
 
-from jiradash.jira_client import JiraClient, CUSTOM_FIELD
+from jiradash.jira_client import JiraClient
+from jiradash.metadata import Metadata
 from requests import HTTPError
-import sys
 
 def entry_point(my_config):
     print(f"Setting fixversion on all issues in {my_config['jira_project']} to match Epic fixversion.")
@@ -27,6 +27,7 @@ class SetFixVersion:
         self.jira_client = JiraClient(my_config)
         self.jira_client.conn()
         self.jira = self.jira_client.jira
+        self.fields = Metadata(my_config, self.jira_client).fields()
 
     def set_fixversion(self):
         for project in self.conf['jira_project']:
@@ -36,7 +37,7 @@ class SetFixVersion:
         jql = f"type = Epic AND project = {project} AND statusCategory != Done"
         epics = self.jira.jql(jql, limit=10000)
         for epic in epics['issues']:
-            epic_name = epic['fields'][CUSTOM_FIELD['Epic Name']]
+            epic_name = epic['fields'][self.fields['Epic Name']]
             epic_fixversions = epic['fields']['fixVersions']
             jql = f"type != Epic AND project = {project} AND 'Epic Link' = '{epic_name}' AND statusCategory != Done"
             issues_in_epic = self.jira.jql(jql, limit=100000)
@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+"""
+Flow metrics: lead time, cycle time, age of work in progress and throughput, in total and per
+project, component, fix version and assignee.
+
+    ./JiraDash.py flow
+    ./JiraDash.py flow --flow-sketch other/WID_flow.sketch.json
+
+Lead time is from created to resolved, cycle time from the first move out of a "To Do" status to
+resolved, and WIP age is how long in progress issues have been in progress. All in days.
+Throughput is resolved issues per week, averaged over the last THROUGHPUT_WEEKS full weeks.
+
+Jira only tells when a resolved issue was started in its changelog, so cycle times need
+--flow-changelog, which queries the status history of every issue.
+
+Percentiles are estimated with t-digests (see jiradash.quantiles) in one pass over the issues, so
+memory doesn't grow with the number of issues. The digests are saved as <base>.sketch.json next to
+the report. --flow-sketch merges the sketches of other runs, for example of other projects or
+of earlier days, into the report.
+
+"""
+import datetime
+import html
+import json
+from collections import Counter
+from jiradash.io import Writer
+from jiradash.jira_model import create_model
+from jiradash.quantiles import TDigest
+
+FLOW_METRICS = [("lead_time", "Lead time"), ("cycle_time", "Cycle time"), ("wip_age", "WIP age")]
+QUANTILES = (0.5, 0.85, 0.95)
+# Dimension -> label. Issues with several components or fix versions count in each of them.
+DIMENSIONS = {"all": "All", "project": "Project", "components": "Component", "fixVersions": "Fix version",
+              "assignee": "Assignee"}
+THROUGHPUT_WEEKS = 12
+
+def entry_point(my_config):
+    print(f"Computing flow metrics of project(s): {my_config['jira_project']}")
+    flow = Flow(my_config)
+    flow.get_and_draw()
+
+
+class FlowGroup:
+    """
+    Digests of the flow metrics of one group of issues, and resolved issues per week.
+    """
+    def __init__(self):
+        self.digests = {name: TDigest() for name, _ in FLOW_METRICS}
+        # Monday of the week, as YYYY-MM-DD -> resolved issues
+        self.throughput = Counter()
+
+    def add(self, values):
+        for name, _ in FLOW_METRICS:
+            if values.get(name) is not None:
+                self.digests[name].add(values[name])
+        if values.get('resolved_week'):
+            self.throughput[values['resolved_week']] += 1
+
+    def merge(self, other):
+        for name, _ in FLOW_METRICS:
+            self.digests[name].merge(other.digests[name])
+        self.throughput.update(other.throughput)
+
+    def weekly_throughput(self, today):
+        """
+        :return: Average resolved issues per week over the THROUGHPUT_WEEKS weeks before this one.
+        """
+        monday = today - datetime.timedelta(days=today.weekday())
+        weeks = [(monday - datetime.timedelta(weeks=n)).isoformat() for n in range(1, THROUGHPUT_WEEKS + 1)]
+        return sum(self.throughput[week] for week in weeks) / THROUGHPUT_WEEKS
+
+    def to_dict(self):
+        data = {name: self.digests[name].to_dict() for name, _ in FLOW_METRICS}
+        data['throughput'] = dict(sorted(self.throughput.items()))
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        group = cls()
+        for name, _ in FLOW_METRICS:
+            group.digests[name] = TDigest.from_dict(data[name])
+        group.throughput = Counter(data['throughput'])
+        return group
+
+
+class Flow:
+    def __init__(self, my_config, model=None):
+        self.conf = my_config
+        self.model = model if model else create_model(my_config)
+        self.writer = Writer(my_config)
+        self.project = self.writer.project
+        # (dimension, group name) -> FlowGroup
+        self.groups = {}
+
+    def get_and_draw(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        issues = self.model.get_issues()
+        starts = self.started_dates(issues) if self.conf['flow_changelog'] else None
+        if starts is None:
+            print("No cycle times without --flow-changelog, Jira only has the start date of issues in progress")
+        self.collect(issues, starts, now)
+        for file_name in self.conf['flow_sketch'] or []:
+            self.merge_file(file_name)
+
+        self.writer.write_file(json.dumps(self.sketch_dict()), extension="sketch.json")
+        rows = self.rows(now.date())
+        self.writer.csv(self.flow_csv(rows))
+        self.writer.html(self.flow_html(rows))
+
+    def started_dates(self, issues):
+        """
+        :return: dict of issue key -> first time it moved to a status that isn't "To Do", from the
+                 changelogs. Transitions to statuses of unknown category are skipped.
+        """
+        categories = {obj['status']: obj['statusCategory'] for obj in issues.values()}
+        categories.update(self.model.status_categories())
+        starts = {}
+        for key, at, _, to_status in self.model.changelog_transitions(kinds=('issues',)):
+            category = categories.get(to_status)
+            if category is not None and category != "To Do" and (key not in starts or at < starts[key]):
+                starts[key] = at
+        return starts
+
+    def measure(self, obj, started, now):
+        """
+        :return: dict of the flow metrics of one issue, None for those that don't apply to it.
+        """
+        days = lambda delta: delta.total_seconds() / 86400
+        resolved = obj['resolution_date']
+        values = {'lead_time': None, 'cycle_time': None, 'wip_age': None, 'resolved_week': None}
+        if resolved:
+            values['resolved_week'] = (resolved.date() - datetime.timedelta(days=resolved.weekday())).isoformat()
+            if obj['created_date']:
+                values['lead_time'] = max(days(resolved - obj['created_date']), 0.0)
+            if started:
+                values['cycle_time'] = max(days(resolved - started), 0.0)
+        elif obj['statusCategory'] == "In Progress" and obj['start_date']:
+            values['wip_age'] = max(days(now - obj['start_date']), 0.0)
+        return values
+
+    def group_keys(self, obj):
+        keys = [("all", ""), ("project", obj['project'])]
+        keys += [("components", c) for c in obj['all_components'] or ["General"]]
+        keys += [("fixVersions", v) for v in obj['all_fixVersions'] or ["never"]]
+        keys.append(("assignee", obj['assignee'] or "Unassigned"))
+        return keys
+
+    def group(self, key):
+        if key not in self.groups:
+            self.groups[key] = FlowGroup()
+        return self.groups[key]
+
+    def collect(self, issues, starts, now):
+        starts = starts or {}
+        for key, obj in issues.items():
+            values = self.measure(obj, starts.get(key), now)
+            for group_key in self.group_keys(obj):
+                self.group(group_key).add(values)
+
+    def sketch_dict(self):
+        return {'groups': [dict(dimension=dimension, group=name, **group.to_dict())
+                           for (dimension, name), group in sorted(self.groups.items())]}
+
+    def merge_file(self, file_name):
+        print(f"Merging flow sketches from {file_name}")
+        with open(file_name) as f:
+            data = json.load(f)
+        for entry in data['groups']:
+            self.group((entry['dimension'], entry['group'])).merge(FlowGroup.from_dict(entry))
+
+    def rows(self, today):
+        """
+        :return: list of (dimension, group name, dict of column values), by dimension and name.
+        """
+        order = list(DIMENSIONS)
+        rows = []
+        for (dimension, name), group in sorted(self.groups.items(), key=lambda g: (order.index(g[0][0]), g[0][1])):
+            values = {'resolved': group.digests['lead_time'].count, 'wip': group.digests['wip_age'].count,
+                      'throughput': group.weekly_throughput(today)}
+            for metric, _ in FLOW_METRICS:
+                for q in QUANTILES:
+                    values[f"{metric}_p{round(q * 100)}"] = group.digests[metric].quantile(q)
+            rows.append((dimension, name, values))
+        return rows
+
+    def columns(self):
+        """
+        :return: list of (column name, label)
+        """
+        columns = [("resolved", "Resolved")]
+        for metric, label in FLOW_METRICS:
+            if metric == "wip_age":
+                columns.append(("wip", "WIP"))
+            columns += [(f"{metric}_p{round(q * 100)}", f"{label} p{round(q * 100)}") for q in QUANTILES]
+        columns.append(("throughput", f"Throughput/week, last {THROUGHPUT_WEEKS}"))
+        return columns
+
+    def flow_csv(self, rows):
+        columns = self.columns()
+        csv = f"{self.project}\tGroup\t" + "\t".join(label for _, label in columns) + "\n"
+        for dimension, name, values in rows:
+            csv += f"{DIMENSIONS[dimension]}\t{name}\t" + "\t".join(_format(values[c]) for c, _ in columns) + "\n"
+        return csv
+
+    def flow_html(self, rows):
+        columns = self.columns()
+        title = html.escape(f"{self.project} flow metrics")
+        head = "<tr><th></th><th>Group</th>" + "".join(f"<th>{html.escape(label)}</th>" for _, label in columns) + "</tr>\n"
+        body = ""
+        for dimension, name, values in rows:
+            body += (f"<tr class=\"{dimension}\"><td>{DIMENSIONS[dimension]}</td><td>{html.escape(name)}</td>"
+                     + "".join(f"<td>{_format(values[c])}</td>" for c, _ in columns) + "</tr>\n")
+        style = """<style type="text/css">
+    table {border-collapse: collapse; font-family: sans-serif;}
+    td, th {padding: 3px 8px; border-top: 1px solid #ddd; text-align: right;}
+    td:nth-child(-n+2), th:nth-child(-n+2) {text-align: left;}
+    tr.all {font-weight: bold;}
+</style>
+"""
+        return (f"<html>\n<head><title>{title}</title>\n{style}</head>\n<body>\n<h1>{title}</h1>\n"
+                f"<p>Times in days.</p>\n<table>\n{head}{body}</table>\n</body>\n</html>")
+
+
+def _format(value):
+    if value is None:
+        return ""
+    return str(value) if isinstance(value, int) else f"{value:.1f}"
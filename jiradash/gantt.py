@@ -2,18 +2,23 @@
 """
 Create a graph using the "depends on" links and draw a SVG using mermaid-cli syntax.
 
+Epics are scheduled with the critical path method (see jiradash.schedule) and given to mermaid
+with explicit start and end dates. Epics on the critical path are highlighted. The duration of an
+epic is estimated from the story points of its child issues that aren't done yet, or from the
+epic's own story points if the children aren't estimated.
+
+With --resources-by, each component (or assignee) works on a limited number of epics at a time.
+The capacity is given with --capacity, or estimated from who resolved issues recently.
+
+The csv outputs have a column per sprint, from the active sprint of the project's scrum board up to
+the last scheduled end date, with the story points each epic is expected to burn in that sprint.
+
 """
-import dateutil.parser
-import dateutil.relativedelta
 import datetime
-import errno
-from jiradash.jira_model import JiraModel
+from jiradash.jira_model import create_model
 from jiradash.mermaid_wrapper import Mermaid
-from requests import HTTPError
-import os
-import re
-import subprocess
-import sys
+from jiradash.schedule import critical_path, historical_capacity, resource_schedule
+from jiradash.svg import Svg
 
 def entry_point(my_config):
     print(f"Creating gantt chart of Epics in project(s): {my_config['jira_project']}")
@@ -25,28 +30,126 @@ class Gantt:
     classDef InProgress fill:#7a7,stroke:#060,stroke-width:3px,color:#000;
     classDef Done fill:#999,stroke:#222,stroke-width:3px,color:#000;
     """
-    def __init__(self, my_config):
+    def __init__(self, my_config, model=None):
         self.conf = my_config
-        self.model = JiraModel(my_config)
+        self.model = model if model else create_model(my_config)
         self.mermaid = Mermaid(my_config)
+        self.svg = Svg(my_config)
         self.writer = self.mermaid
         self.project = self.mermaid.project
         self.base = self.mermaid.base
 
     def get_and_draw(self):
         epics = self.model.get_epics()
+        # Scheduled once for the chart and both csv files
+        schedule = self.schedule(epics)
+        sprints = self.sprint_points(epics, schedule)
 
-        markup = self.draw_group(epics, self.project)
-        self.mermaid.exec_mermaid(markup)
+        if self.conf['renderer'] == "svg":
+            self.svg.write_file(self.draw_svg(epics, self.project, schedule), extension="svg")
+        else:
+            markup = self.draw_group(epics, self.project, schedule)
+            self.mermaid.exec_mermaid(markup)
 
-        csv = self.gantt_csv(epics, self.project)
+        csv = self.gantt_csv(epics, self.project, schedule, sprints)
         self.writer.csv(csv)
 
-        csv = self.groups_csv(epics, self.project)
+        csv = self.groups_csv(epics, self.project, sprints)
         self.writer.csv(csv, base=f"{self.base}_components")
 
 
-    def draw_group(self, graph, project):
+    def capacity(self):
+        """
+        :return: dict resource -> number of epics it can work on in parallel
+        """
+        resources_by = self.conf['resources_by']
+        capacity = historical_capacity(self.model.get_issues(), resources_by)
+        for spec in self.conf['capacity'] or []:
+            name, value = spec.split("=", 1)
+            capacity[name] = int(value)
+        print(f"Capacity per {resources_by}: {capacity}")
+        return capacity
+
+    def remaining(self, graph):
+        """
+        :return: dict epic key -> story points of its child issues that aren't done, for epics
+                 whose children are estimated.
+        """
+        rollups = self.model.get_rollups()
+        remaining = {}
+        for key in graph:
+            rollup = rollups.get(key)
+            if rollup and rollup['points']:
+                remaining[key] = rollup['remaining_points']
+        return remaining
+
+    def schedule(self, graph):
+        remaining = self.remaining(graph)
+        if self.conf['resources_by']:
+            schedule = resource_schedule(graph, self.conf['resources_by'], self.capacity(), remaining=remaining)
+        else:
+            schedule = critical_path(graph, remaining=remaining)
+        cycle = sorted(key for key, s in schedule.items() if s['cycle'])
+        if cycle:
+            print(f"Epics in or after a dependency cycle, scheduled ignoring the cycle: {cycle}")
+        return schedule
+
+    def sprint_points(self, graph, schedule, today=None):
+        """
+        Spread the story points each epic has left over the sprints it is scheduled in, in
+        proportion to the days of each sprint it covers.
+
+        :return: tuple (sprint names, dict epic key -> list of points per sprint). Both are empty
+                 if the project has no sprints.
+        """
+        sprints = self.model.get_sprints()
+        if not sprints.sprints:
+            return [], {}
+        today = today if today else datetime.date.today()
+        plan = sprints.plan(max([s['end'] for s in schedule.values()], default=today), today)
+        remaining = self.remaining(graph)
+
+        per_epic = {}
+        for key, s in schedule.items():
+            if graph[key]['statusCategory'] == "Done":
+                continue
+            points = remaining.get(key, graph[key]['points'])
+            start = max(s['start'], today)
+            days = (s['end'] - start).days
+            allocated = []
+            for _, sprint_start, sprint_end in plan:
+                if days > 0:
+                    overlap = (min(s['end'], sprint_end) - max(start, sprint_start)).days
+                    allocated.append(points * max(overlap, 0) / days)
+                else:
+                    allocated.append(points if sprint_start <= s['end'] < sprint_end else 0.0)
+            per_epic[key] = allocated
+        return [name for name, _, _ in plan], per_epic
+
+    def sections(self, graph):
+        """
+        :return: list of (group, [epic keys]) in the order they are drawn
+        """
+        groupby = self.conf.args.groupby
+        # Mermaid Gantt chart must have sections. Default section name when no grouping used.
+        groups = {"Epics"}
+        if groupby:
+            groups = self.model.get_groups(groupby=groupby)
+        sections = []
+        for group in groups:
+            keys = self.model.get_epics_by_depth(group, groupby=groupby)
+            sections.append((group, [key for key in keys if not groupby or graph[key][groupby] == group]))
+        return sections
+
+    def draw_svg(self, graph, project, schedule=None):
+        schedule = schedule if schedule is not None else self.schedule(graph)
+        return self.svg.gantt(self.sections(graph), graph, schedule, project)
+
+    def draw_group(self, graph, project, schedule=None):
+        """
+        :param dict schedule: Output of self.schedule(graph), computed if not given.
+        """
+        schedule = schedule if schedule is not None else self.schedule(graph)
         output = """gantt
     dateFormat  YYYY-MM-DD
     title       """ + project + """
@@ -77,30 +180,13 @@ class Gantt:
                 elif obj['statusCategory'] == "In Progress":
                     status = "active, "
 
-                line += "%-10s" % status
-                line += key + ", "
+                if schedule[key]['critical']:
+                    status = "crit, " + status
 
-                deps = ""
-                if obj['deps']:
-                    deps += "after"
-                    for dep in obj['deps']:
-                        deps += " " + dep
-                    deps += ", "
-                line += deps
-
-                if not deps:
-                    if obj['start_date']:
-                        line += obj['start_date'].strftime("%Y-%m-%d") + ", "
-                        #line += datetime.datetime.isoformat(obj['start_date']) + ", "
-                        if obj['resolution_date']:
-                            line += obj['resolution_date'].strftime("%Y-%m-%d")
-                            #line += datetime.datetime.isoformat(obj['resolution_date'])
-                        else:
-                            line += str(int(obj['points']*30)) + "d"
-                    else:
-                        line += str(int(obj['points']*30)) + "d"
-                else:
-                    line += str(int(obj['points']*30)) + "d"
+                line += "%-16s" % status
+                line += key + ", "
+                line += schedule[key]['start'].strftime("%Y-%m-%d") + ", "
+                line += schedule[key]['end'].strftime("%Y-%m-%d")
 
                 output += line + "\n"
 
@@ -116,49 +202,62 @@ class Gantt:
         css_class = obj['statusCategory'].replace(" ", "")
         return css_class
 
-    def gantt_csv(self, graph, project):
+    def gantt_csv(self, graph, project, schedule=None, sprints=None):
+        """
+        :param dict schedule: Output of self.schedule(graph), computed if not given.
+        :param tuple sprints: Output of self.sprint_points(graph, schedule), computed if not given.
+        """
         groupby = self.conf.args.groupby
         groups = {"Epics"}
         if groupby:
             groups = self.model.get_groups(groupby=groupby)
 
-        head = f"{project}\n{groupby}\tEpic\tFix version\tEstimate\tResources allocated\tSprints->\n"
-        sprints ="\t\t\t\t\n"  # Add sprints when we know how many there are
+        schedule = schedule if schedule is not None else self.schedule(graph)
+        sprint_names, sprint_points = sprints if sprints is not None else self.sprint_points(graph, schedule)
+        head = f"{project}\n{groupby}\tEpic\tFix version\tEstimate\tStart\tEnd\tSlack\tCritical\tResources allocated\tSprints->\n"
+        sprints ="\t\t\t\t\t\t\t\t" + "".join(f"\t{name}" for name in sprint_names) + "\n"
 
         body = ""
         for group in groups:
             body += f"\n{group}\n"
             for key in self.model.get_epics_by_depth(group, groupby=groupby):
                 obj = graph[key]
-                line = f"\t{key} {obj['epic_name']}\t{str(obj['fixVersions'])}\t{obj['points']}\n"
-                body += line
+                s = schedule[key]
+                critical = "cycle" if s['cycle'] else ("yes" if s['critical'] else "")
+                line = f"\t{key} {obj['epic_name']}\t{str(obj['fixVersions'])}\t{obj['points']}"
+                line += f"\t{s['start']}\t{s['end']}\t{s['slack']}\t{critical}\t{s.get('resource', '')}"
+                line += "".join(f"\t{points:.1f}" if round(points, 1) else "\t" for points in sprint_points.get(key, []))
+                body += line + "\n"
 
         return head + sprints + body
 
-    def groups_csv(self, graph, project):
+    def groups_csv(self, graph, project, sprints=None):
+        """
+        :param tuple sprints: Output of self.sprint_points(), computed if not given.
+        """
         groupby = self.conf.args.groupby
         groups = {"Epics"}
         if groupby:
             groups = self.model.get_groups(groupby=groupby)
         print(groups)
 
+        if sprints is None:
+            sprints = self.sprint_points(graph, self.schedule(graph))
+        sprint_names, sprint_points = sprints
         head = f"{project}\n{groupby}\tEstimate\tResources allocated\tSprints->\n"
-        sprints ="\t\t\t\t\n"  # Add sprints when we know how many there are
+        sprints ="\t\t" + "".join(f"\t{name}" for name in sprint_names) + "\n" if sprint_names else "\t\t\t\t\n"
 
         body = "Totals:\n"
         for group in groups:
             points = 0.0
+            per_sprint = [0.0] * len(sprint_names)
             for key in self.model.get_epics_by_depth(group, groupby=groupby):
                 points += graph[key]['points']
-            body += f"{group}\t{points}\n"
+                for i, allocated in enumerate(sprint_points.get(key, [])):
+                    per_sprint[i] += allocated
+            body += f"{group}\t{points}"
+            if sprint_names:
+                body += "\t" + "".join(f"\t{p:.1f}" if round(p, 1) else "\t" for p in per_sprint)
+            body += "\n"
 
         return head + sprints + body
-
-def mkdir_p(path):
-    try:
-        os.makedirs(path)
-    except OSError as exc:
-        if exc.errno == errno.EEXIST and os.path.isdir(path):
-            pass
-        else:
-            raise
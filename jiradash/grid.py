@@ -2,16 +2,16 @@
 """
 Create a graph using the "depends on" links and draw a SVG using mermaid-cli syntax.
 
+With --grid-html compact, the html page embeds the grid as compact json and renders it in the
+browser, only the rows near the visible part of the page.
+
+Epics and issues that transitively wait on unfinished work are underlined in dashed red.
+
 """
-import dateutil.parser
-import dateutil.relativedelta
-import datetime
-from jiradash.jira_model import JiraModel
+import html
+import json
+from jiradash.jira_model import create_model
 from jiradash.io import Writer
-from requests import HTTPError
-import re
-import subprocess
-import sys
 
 def entry_point(my_config):
     print(f"Printing a grid grouping of Epics in project(s): {my_config['jira_project']}")
@@ -19,9 +19,9 @@ def entry_point(my_config):
     deps.get_and_draw()
 
 class Grid:
-    def __init__(self, my_config):
+    def __init__(self, my_config, model=None):
         self.conf = my_config
-        self.model = JiraModel(my_config)
+        self.model = model if model else create_model(my_config)
         self.releases = self.model.get_versions()
         self.writer = Writer(my_config)
         self.project = self.writer.project
@@ -87,11 +87,10 @@ class Grid:
 
         return csv
 
-    def grid_html(self, grid, by_epic, project):
+    def grid_style(self):
         colwidth = 15
         tablewidth = str(int(colwidth*(len(self.releases)+1)))
-        head = f"<html>\n<head><title>{project}</title>\n"
-        style = """<style type="text/css">
+        return """<style type="text/css">
     table {width: """ + tablewidth + """em;}
     table td {padding: 5px; font-family: sans-serif; border-top: 1px solid #ddd; width: """ + str(colwidth) + """em;}
     foo td div {overflow: hidden; height: 2em;}
@@ -105,9 +104,20 @@ class Grid:
     td div span.InProgress {border: solid 1px #090; background-color: #090;margin-bottom: 2px;}
     td div span.Done {border: solid 1px #333; background-color: #333;margin-bottom: 2px;}
     td div span a {text-decoration: none;}
+    td div.progress {width: 12em; height: 3px; background-color: #ddd; margin: 1px 0 3px 0;}
+    td div.progress div {height: 3px; background-color: #090;}
+    a.Blocked {border-bottom: 2px dashed #c00;}
+    td div span.Blocked {border-color: #c00;}
 </style>
 """
 
+    def grid_html(self, grid, by_epic, project):
+        if self.conf['grid_html'] == "compact":
+            return self.grid_compact_html(grid, by_epic, project)
+
+        head = f"<html>\n<head><title>{project}</title>\n"
+        style = self.grid_style()
+        blocked = self.model.get_reachability().blocked()
         table = f"<table>\n<tr><th>{project}</th><th>" + "</th><th>".join(self.releases) + "</th></tr>\n"
 
         for component in grid.keys():
@@ -118,8 +128,13 @@ class Grid:
                     obj = grid[component][rel][key]
 
                     table += "<div>\n"
-                    table += f"<a href=\"{obj['url']}\" title=\"{obj['summary']}\" class=\"{obj['statusCategory'].replace(' ','')}\">{obj['key']} {obj['epic_name']}</a><br>\n"
-                    table += self._grid_issues(by_epic, key)
+                    title, css_class = obj['summary'], obj['statusCategory'].replace(' ','')
+                    if key in blocked:
+                        title += f" (waits on {blocked[key]} unfinished)"
+                        css_class += " Blocked"
+                    table += f"<a href=\"{obj['url']}\" title=\"{title}\" class=\"{css_class}\">{obj['key']} {obj['epic_name']}</a><br>\n"
+                    table += self._progress_bar(key)
+                    table += self._grid_issues(by_epic, key, blocked)
                     table += "</div>\n"
 
                 table += "</td>\n"
@@ -127,14 +142,155 @@ class Grid:
 
         return head + style + "</head>\n<body style=\"overflow-x: auto;\">\n" + table + "</body>\n</html>"
 
-    def _grid_issues(self, by_epic, epic_key):
+    def _progress(self, epic_key):
+        """
+        :return: Percentage of the epic's issues (or points) that are done, or None without issues.
+        """
+        progress = self.model.get_rollups().progress(epic_key)
+        return None if progress is None else int(round(progress * 100))
+
+    def _progress_bar(self, epic_key):
+        progress = self._progress(epic_key)
+        if progress is None:
+            return ""
+        return f"<div class=\"progress\" title=\"{progress}% done\"><div style=\"width: {progress}%\"></div></div>\n"
+
+    def _grid_issues(self, by_epic, epic_key, blocked):
         html = ""
         if epic_key in by_epic:
             for issue in by_epic[epic_key]:
                 title = f"{issue['key']} {issue['summary']} [{issue['assignee']}]"
-                html += f"<span class=\"{issue['statusCategory'].replace(' ', '')}\" title=\"{title}\"><a href=\"{issue['url']}\">&nbsp;</a></span>"
+                css_class = issue['statusCategory'].replace(' ', '')
+                if issue['key'] in blocked:
+                    title += f" (waits on {blocked[issue['key']]} unfinished)"
+                    css_class += " Blocked"
+                html += f"<span class=\"{css_class}\" title=\"{title}\"><a href=\"{issue['url']}\">&nbsp;</a></span>"
 
         return html
 
+    def grid_json(self, grid, by_epic):
+        """
+        Compact form of the grid for grid_compact_html(). Strings that repeat are interned and
+        child issues are stored as columns:
+
+            epics:  [key, epic_name, status, summary, first issue, last issue + 1, % done or -1,
+                     unfinished issues it waits on]
+            rows:   [component, [[epic index, ...] per release]]
+            issue_keys, issue_status, issue_assignee, issue_blocked: one entry per child issue,
+                    grouped by epic
+        """
+        blocked = self.model.get_reachability().blocked()
+        status = {}
+        assignees = {}
+        data = {
+            "browse": self.conf['jira_server'] + "/browse/",
+            "releases": self.releases,
+            "epics": [], "rows": [],
+            "issue_keys": [], "issue_status": [], "issue_assignee": [], "issue_blocked": [],
+        }
+        for component in grid.keys():
+            cells = []
+            for rel in self.releases:
+                cell = []
+                for key in sorted(grid[component][rel].keys()):
+                    obj = grid[component][rel][key]
+                    first = len(data["issue_keys"])
+                    for issue in by_epic.get(key, []):
+                        data["issue_keys"].append(issue['key'])
+                        data["issue_status"].append(status.setdefault(issue['statusCategory'], len(status)))
+                        data["issue_assignee"].append(assignees.setdefault(issue['assignee'], len(assignees)))
+                        data["issue_blocked"].append(blocked.get(issue['key'], 0))
+                    cell.append(len(data["epics"]))
+                    progress = self._progress(key)
+                    data["epics"].append([key, obj['epic_name'], status.setdefault(obj['statusCategory'], len(status)),
+                                          obj['summary'], first, len(data["issue_keys"]),
+                                          progress if progress is not None else -1,
+                                          blocked.get(key, 0)])
+                cells.append(cell)
+            data["rows"].append([component, cells])
+        data["status"] = [name.replace(" ", "") for name in status]
+        data["assignees"] = list(assignees)
+        return data
+
+    def grid_compact_html(self, grid, by_epic, project):
+        """
+        Same as grid_html(), but the page only embeds grid_json() and renders the rows that are
+        scrolled into view. The page is a fraction of the size, and rendering time doesn't grow with
+        the number of issues.
+        """
+        payload = json.dumps(self.grid_json(grid, by_epic), separators=(",", ":")).replace("</", "<\\/")
+        head = f"<html>\n<head><title>{html.escape(project)}</title>\n"
+        header = "</th><th>".join(html.escape(rel) for rel in self.releases)
+        body = f"<table id=\"grid\">\n<tr><th>{html.escape(project)}</th><th>{header}</th></tr>\n</table>\n"
+        body += f"<script type=\"application/json\" id=\"grid-data\">{payload}</script>\n"
+        body += "<script>\n" + GRID_JS + "</script>\n"
+        return head + self.grid_style() + "</head>\n<body style=\"overflow-x: auto;\">\n" + body + "</body>\n</html>"
+
+
+# Renders the rows of grid_compact_html() when they come near the viewport, and empties them again
+# when they are far out of view.
+GRID_JS = r"""const data = JSON.parse(document.getElementById("grid-data").textContent);
+const table = document.getElementById("grid");
+const esc = s => String(s).replace(/[&<>"]/g, c => ({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})[c]);
 
+function epicHtml(e) {
+    const [key, name, status, summary, first, end, progress, blocked] = data.epics[e];
+    const title = blocked ? `${summary} (waits on ${blocked} unfinished)` : summary;
+    let html = `<div>\n<a href="${data.browse}${key}" title="${esc(title)}" class="${data.status[status]}${blocked ? " Blocked" : ""}">${key} ${esc(name)}</a><br>\n`;
+    if (progress >= 0) {
+        html += `<div class="progress" title="${progress}% done"><div style="width: ${progress}%"></div></div>\n`;
+    }
+    for (let i = first; i < end; i++) {
+        html += `<span class="${data.status[data.issue_status[i]]}${data.issue_blocked[i] ? " Blocked" : ""}" data-i="${i}"></span>`;
+    }
+    return html + "</div>\n";
+}
 
+function rowHtml(row) {
+    const [component, cells] = data.rows[row];
+    return `<th>${esc(component)}</th>` + cells.map(cell => "<td>" + cell.map(epicHtml).join("") + "</td>").join("");
+}
+
+function estimatedHeight(row) {
+    const heights = data.rows[row][1].map(cell => cell.reduce((sum, e) =>
+        sum + 24 + 9 * Math.ceil((data.epics[e][5] - data.epics[e][4]) / 20), 10));
+    return Math.max(30, ...heights);
+}
+
+const observer = new IntersectionObserver(entries => {
+    for (const entry of entries) {
+        const tr = entry.target;
+        const row = Number(tr.dataset.row);
+        if (entry.isIntersecting && !tr.dataset.rendered) {
+            tr.innerHTML = rowHtml(row);
+            tr.style.height = "";
+            tr.dataset.rendered = "1";
+        } else if (!entry.isIntersecting && tr.dataset.rendered) {
+            tr.style.height = tr.offsetHeight + "px";
+            tr.innerHTML = `<th>${esc(data.rows[row][0])}</th>`;
+            delete tr.dataset.rendered;
+        }
+    }
+}, {rootMargin: "1000px 0px"});
+
+data.rows.forEach((row, i) => {
+    const tr = table.insertRow();
+    tr.dataset.row = i;
+    tr.style.height = estimatedHeight(i) + "px";
+    tr.innerHTML = `<th>${esc(row[0])}</th>`;
+    observer.observe(tr);
+});
+
+table.addEventListener("mouseover", event => {
+    const i = event.target.dataset.i;
+    if (i !== undefined && !event.target.title) {
+        event.target.title = `${data.issue_keys[i]} [${data.assignees[data.issue_assignee[i]]}]`;
+    }
+});
+table.addEventListener("click", event => {
+    const i = event.target.dataset.i;
+    if (i !== undefined) {
+        window.open(data.browse + data.issue_keys[i]);
+    }
+});
+"""
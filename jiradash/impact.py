@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+"""
+What an issue or epic transitively blocks, and what it transitively waits on.
+
+    ./JiraDash.py impact
+    ./JiraDash.py impact --impact-key WID-12 --impact-key WID-40
+
+Without --impact-key, lists the unfinished issues and epics that block other unfinished work, the
+ones blocking the most first. With --impact-key, lists everything that depends on each of the
+given keys, directly or through other issues, and everything they wait on.
+
+Follows "Depends on" links between epics and issues alike, see jiradash.reachability.
+
+"""
+import html
+from jiradash.io import Writer
+from jiradash.jira_model import create_model
+from jiradash.util import safe_chars
+
+def entry_point(my_config):
+    print(f"Listing dependency impact in project(s): {my_config['jira_project']}")
+    impact = Impact(my_config)
+    impact.get_and_draw()
+
+class Impact:
+    def __init__(self, my_config, model=None):
+        self.conf = my_config
+        self.model = model if model else create_model(my_config)
+        self.writer = Writer(my_config)
+        self.project = self.writer.project
+
+    def get_and_draw(self):
+        self.objs = {**self.model.get_epics(), **self.model.get_issues()}
+        self.reach = self.model.get_reachability()
+        if self.conf['impact_key']:
+            missing = [key for key in self.conf['impact_key'] if key not in self.objs]
+            if missing:
+                print(f"Not in the loaded issues and epics: {missing}")
+            keys = [key for key in self.conf['impact_key'] if key in self.objs]
+            base = f"{self.writer.base}_{'_'.join(safe_chars(key).replace(' ', '_') for key in keys)}"
+            self.writer.csv(self.keys_csv(keys), base=base)
+            self.writer.html(self.keys_html(keys), base=base)
+        else:
+            rows = self.top_rows()
+            self.writer.csv(self.top_csv(rows))
+            self.writer.html(self.top_html(rows))
+
+    def top_rows(self):
+        """
+        :return: list of (key, unfinished keys it blocks, unfinished keys it waits on), most
+                 blocking first.
+        """
+        blocking = self.reach.blocking()
+        blocked = self.reach.blocked()
+        return sorted(((key, n, blocked.get(key, 0)) for key, n in blocking.items()), key=lambda row: (-row[1], row[0]))
+
+    def _unfinished(self, keys, key):
+        return [k for k in keys if k != key and self.objs[k]['statusCategory'] != "Done"]
+
+    def _describe(self, key):
+        obj = self.objs[key]
+        name = obj.get('epic_name') or obj['summary']
+        return f"{obj['statusCategory']}\t{name}"
+
+    def top_csv(self, rows):
+        csv = f"{self.project}\tStatus\tSummary\tBlocks\tWaits on\tIn a cycle\n"
+        for key, blocks, waits in rows:
+            csv += f"{key}\t{self._describe(key)}\t{blocks}\t{waits}\t{'yes' if self.reach.in_cycle(key) else ''}\n"
+        return csv
+
+    def keys_csv(self, keys):
+        csv = f"{self.project}\tStatus\tSummary\tRelation\tOf\n"
+        for key in keys:
+            for other in sorted(k for k in self.reach.blocks(key) if k != key):
+                csv += f"{other}\t{self._describe(other)}\twaits on\t{key}\n"
+            for other in sorted(k for k in self.reach.waits_on(key) if k != key):
+                csv += f"{other}\t{self._describe(other)}\tblocks\t{key}\n"
+        return csv
+
+    def _link(self, key):
+        obj = self.objs[key]
+        name = obj.get('epic_name') or obj['summary']
+        css_class = obj['statusCategory'].replace(" ", "")
+        return f"<a href=\"{html.escape(obj['url'])}\" class=\"{css_class}\">{html.escape(key)}</a> {html.escape(name)}"
+
+    def _page(self, title, body):
+        title = html.escape(title)
+        style = """<style type="text/css">
+    body {font-family: sans-serif;}
+    table {border-collapse: collapse;}
+    td, th {padding: 3px 8px; border-top: 1px solid #ddd; text-align: left;}
+    a.ToDo {color: #666;}
+    a.InProgress {color: #090;}
+    a.Done {text-decoration: line-through; color: #333;}
+</style>
+"""
+        return f"<html>\n<head><title>{title}</title>\n{style}</head>\n<body>\n<h1>{title}</h1>\n{body}</body>\n</html>"
+
+    def top_html(self, rows):
+        body = "<table>\n<tr><th>Issue</th><th>Status</th><th>Blocks</th><th>Waits on</th><th></th></tr>\n"
+        for key, blocks, waits in rows:
+            cycle = "in a dependency cycle" if self.reach.in_cycle(key) else ""
+            body += (f"<tr><td>{self._link(key)}</td><td>{self.objs[key]['statusCategory']}</td>"
+                     f"<td>{blocks}</td><td>{waits}</td><td>{cycle}</td></tr>\n")
+        body += "</table>\n<p>Unfinished issues and epics that transitively depend on, or are depended on by, each issue.</p>\n"
+        return self._page(f"{self.project} dependency impact", body)
+
+    def keys_html(self, keys):
+        body = ""
+        for key in keys:
+            blocks = sorted(k for k in self.reach.blocks(key) if k != key)
+            waits = sorted(k for k in self.reach.waits_on(key) if k != key)
+            body += f"<h2>{self._link(key)}</h2>\n"
+            if self.reach.in_cycle(key):
+                body += "<p>Part of a dependency cycle.</p>\n"
+            for label, found in ((f"Blocks {len(self._unfinished(blocks, key))} unfinished of", blocks),
+                                 (f"Waits on {len(self._unfinished(waits, key))} unfinished of", waits)):
+                body += f"<h3>{label} {len(found)}</h3>\n<ul>\n"
+                body += "".join(f"<li>{self._link(k)}</li>\n" for k in found)
+                body += "</ul>\n"
+        return self._page(f"{self.project} dependency impact of {', '.join(keys)}", body)
@@ -2,16 +2,26 @@
 """
 Read and write files. Mostly write I guess.
 
+Output files are only written when their content changed, so their mtimes stay put and rsync,
+publishing jobs and mmdc can skip them. The sha256 of every file written to --out-dir is kept in
+a manifest there, see Manifest.
+
 """
 import errno
-# TODO: Really just using safe_chars(). It could be a utility module?
-from jiradash.jira_model import JiraModel
+import gzip
+import hashlib
+import json
+from jiradash.util import safe_chars
 import os
+import tempfile
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 class Writer:
     def __init__(self, my_config):
         self.conf = my_config
-        self.model = JiraModel(my_config)
 
         self.project = "JiraDash"  # default title for a lot of output
         self.command = self.conf['command'][0]
@@ -23,7 +33,7 @@ class Writer:
             self.project = "_".join(projects)
         self.base = self.project
         for jira_filter in self.conf['jira_filter'] if self.conf['jira_filter'] else []:
-            self.base += "_" + self.model.safe_chars(jira_filter).replace(" ", "_")
+            self.base += "_" + safe_chars(jira_filter).replace(" ", "_")
         if self.conf.args.groupby:
             self.base += "_" + self.conf.args.groupby
         self.base = f"{self.base}_{self.command}"
@@ -33,20 +43,128 @@ class Writer:
         self.write_file(csv, extension="csv", base=base)
 
     def html(self, html, base=None):
-        self.write_file(html, extension="html", base=base)
+        file_name = self.write_file(html, extension="html", base=base)
+        if self.conf['gzip']:
+            # For web servers that can serve precompressed files, like nginx gzip_static
+            self.write_bytes(file_name + ".gz", gzip.compress(html.encode("utf-8"), mtime=0))
+        return file_name
 
-    def write_file(self, content, extension="", base=None):
+    def path(self, extension="", base=None):
+        """
+        :return: Path of the output file, after creating --out-dir if needed.
+        """
         if base is None:
             base = self.base
 
         out_dir = self.conf['out_dir']
         mkdir_p(out_dir)
+        return os.path.join(out_dir, f"{base}.{extension}")
 
-        file_name = os.path.join(out_dir, f"{base}.{extension}")
+    def manifest(self):
+        return Manifest(self.conf['out_dir'])
+
+    def write_file(self, content, extension="", base=None):
+        file_name = self.path(extension, base)
+        self.write_bytes(file_name, content.encode("utf-8"))
+        return file_name
+
+    def write_bytes(self, file_name, content):
+        """
+        Atomically replace file_name with content, unless it already has that content.
+
+        :return: True if the file was written.
+        """
+        manifest = self.manifest()
+        digest = hashlib.sha256(content).hexdigest()
+        entry = manifest.get(file_name)
+        if entry and entry['sha256'] == digest:
+            print(f"Unchanged {file_name}")
+            return False
         print(f"Writing {file_name}")
-        with open(file_name, "w") as f:
+        atomic_write(file_name, content)
+        manifest.update(file_name, sha256=digest)
+        return True
+
+
+class Manifest:
+    """
+    sha256 of the files in an output directory, stored in .jiradash-manifest.json in it:
+
+        {"WID_grid.html": {"sha256": "...", "size": 1234, "mtime_ns": ...}, ...}
+
+    Files derived from another output, like the SVG mmdc renders from a .mermaid file, also store
+    the sha256 of their "source", so rendering can be skipped when the source didn't change. An
+    entry is only trusted while the file's size and mtime are what they were when it was recorded.
+    """
+    NAME = ".jiradash-manifest.json"
+
+    def __init__(self, out_dir):
+        self.dir = out_dir
+        self.file = os.path.join(out_dir, self.NAME)
+
+    def load(self):
+        try:
+            with open(self.file) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, file_name):
+        """
+        :return: The manifest entry of file_name, or None if it isn't known or was modified since.
+        """
+        entry = self.load().get(os.path.basename(file_name))
+        try:
+            st = os.stat(file_name)
+        except FileNotFoundError:
+            return None
+        if not entry or entry.get('size') != st.st_size or entry.get('mtime_ns') != st.st_mtime_ns:
+            return None
+        return entry
+
+    def is_current(self, file_name, source):
+        """
+        :return: True if file_name exists unmodified and was derived from content with sha256 source.
+        """
+        entry = self.get(file_name)
+        return bool(entry) and entry.get('source') == source
+
+    def update(self, file_name, sha256=None, source=None):
+        """
+        Record file_name as it is now on disk. sha256 is computed from the file if not given.
+        """
+        if sha256 is None:
+            with open(file_name, "rb") as f:
+                sha256 = hashlib.sha256(f.read()).hexdigest()
+        st = os.stat(file_name)
+        entry = {'sha256': sha256, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        if source:
+            entry['source'] = source
+        mkdir_p(self.dir)
+        # Several commands may write to the same --out-dir at the same time
+        with open(self.file + ".lock", "w") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self.load()
+            manifest[os.path.basename(file_name)] = entry
+            atomic_write(self.file, json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+
+
+def atomic_write(file_name, content):
+    """
+    Write to a temp file in the same directory and rename it over file_name, so that readers never
+    see a half written file.
+    """
+    directory, name = os.path.split(file_name)
+    fd, tmp_name = tempfile.mkstemp(dir=directory or ".", prefix=f".{name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
             f.write(content)
-        return file_name
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
 
 
 def mkdir_p(path):
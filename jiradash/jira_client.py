@@ -1,9 +1,17 @@
 #!/bin/python3
+"""
+Thin wrapper around atlassian-python-api.
 
-from atlassian import Jira
-from requests import HTTPError
+atlassian and requests are imported only when a connection is actually opened. Importing them
+takes longer than everything else JiraDash does before it needs them.
 
-# Probably I can query these from Jira somehow, but for now it is easiest to just hard code the ones we use:
+Every API call goes through InstrumentedJira, which retries throttled and failed calls and counts
+and times them in jiradash.metrics.
+"""
+import time
+from jiradash.metrics import REGISTRY
+
+# Defaults for when the field ids can't be looked up from Jira by name. See jiradash.metadata.
 CUSTOM_FIELD = {
     "Epic": "customfield_10840",
     "Epic Name": "customfield_10841",
@@ -17,14 +25,25 @@ class JiraClient:
         self.conf = my_config
         self.jira = None
 
+    def connection(self):
+        """
+        :return: The Jira connection. Connects on first call.
+        """
+        if self.jira is None:
+            self.conn()
+        return self.jira
+
     def conn(self):
+        from atlassian import Jira
+        from requests import HTTPError
+
         print("connecting jira...")
-        self.jira = Jira(
+        self.jira = InstrumentedJira(Jira(
             url=self.conf['jira_server'],
             username=self.conf['jira_user'],
             password=self.conf['jira_token'],
             cloud=True
-        )
+        ))
         # Test query to ensure login succeeded
         try:
             jql = f"project = {self.conf['jira_project'][0]}"
@@ -35,6 +54,8 @@ class JiraClient:
             print(e.response.text)
 
     def get_all_issues(self):
+        from requests import HTTPError
+
         for project in self.conf['jira_project']:
             jql = f"project = {project}"
             print(jql)
@@ -44,3 +65,63 @@ class JiraClient:
             except HTTPError as e:
                 print(e)
                 print(e.response.text)
+
+
+class InstrumentedJira:
+    """
+    Proxy for an atlassian Jira object. Calls its methods, for example jql(), and:
+
+    - retries calls that got 429 Too Many Requests, after the Retry-After the response asked for
+    - retries reads (get_*, jql) that failed with a connection error or 502, 503, 504
+    - counts and times calls per method in jiradash.metrics
+    """
+    max_retries = 5
+    # Longest Retry-After to honor, in seconds
+    max_wait = 60
+
+    def __init__(self, jira):
+        self._jira = jira
+
+    def __getattr__(self, name):
+        attr = getattr(self._jira, name)
+        if not callable(attr):
+            return attr
+        return lambda *args, **kwargs: self._call(name, attr, args, kwargs)
+
+    def _call(self, endpoint, method, args, kwargs):
+        from requests import ConnectionError, HTTPError, Timeout
+
+        idempotent = endpoint.startswith("get") or endpoint == "jql"
+        start = time.monotonic()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = method(*args, **kwargs)
+                    REGISTRY.inc("jiradash_jira_requests", endpoint=endpoint, outcome="ok")
+                    return result
+                except (HTTPError, ConnectionError, Timeout) as e:
+                    status = e.response.status_code if getattr(e, 'response', None) is not None else None
+                    if status == 429:
+                        REGISTRY.inc("jiradash_jira_throttled", endpoint=endpoint)
+                        outcome = "throttled"
+                    elif idempotent and (status is None or status in (502, 503, 504)):
+                        outcome = "retry"
+                    else:
+                        outcome = "error"
+                    REGISTRY.inc("jiradash_jira_requests", endpoint=endpoint, outcome=outcome)
+                    if outcome == "error" or attempt == self.max_retries:
+                        raise
+                    REGISTRY.inc("jiradash_jira_retries", endpoint=endpoint)
+                    wait = _retry_after(e.response) if status == 429 else None
+                    wait = min(wait if wait is not None else 2 ** attempt, self.max_wait)
+                    print(f"Jira {endpoint} failed ({status or e.__class__.__name__}), retrying in {wait}s")
+                    time.sleep(wait)
+        finally:
+            REGISTRY.observe("jiradash_jira_request_seconds", time.monotonic() - start, endpoint=endpoint)
+
+
+def _retry_after(response):
+    try:
+        return max(float(response.headers.get("Retry-After")), 0)
+    except (TypeError, ValueError):
+        return None
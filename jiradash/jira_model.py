@@ -2,186 +2,685 @@
 """
 Data abstraction layer for jira queries
 
+Raw Jira records are kept in a local cache (see jiradash.cache). When a cache exists for a query,
+only records updated since the previous run are fetched from Jira. With --offline, Jira isn't
+contacted at all.
+
+With --local-filter, all issues of the project(s) are downloaded and cached, and --jira-filter is
+evaluated locally (see jiradash.jql). Reports for different filters then share one download.
+
+Next to the cache, the normalized issues are saved as a binary snapshot (see jiradash.snapshot),
+so that a run which finds nothing changed in Jira doesn't need to parse the raw records at all.
+
 """
 
-import dateutil.parser
-import dateutil.relativedelta
-import datetime
-import errno
-import json
-from requests import HTTPError
+from collections import Counter
 from operator import itemgetter
 import os
-import re
-import subprocess
 import sys
 import time
 
-from .jira_client import JiraClient, CUSTOM_FIELD
+from . import snapshot
+from .cache import Cache, cache_name
+from .metadata import Metadata
+from .reachability import Reachability
+from .rollup import EpicRollups
+from .sprints import SprintIndex, sprint_ids
+from .jira_client import JiraClient
+from .jql import FilterIndex, UnsupportedQuery, matches, parse_filters
+from .metrics import REGISTRY
+from .util import safe_chars, parse_date
+from .versions import VersionIndex
+
+# Only these fields, and the custom fields from Metadata.fields(), are requested from Jira and kept
+# in the cache
+FIELDS = ["summary", "assignee", "status", "components", "fixVersions", "created", "updated",
+          "statuscategorychangedate", "resolutiondate", "resolution", "issuelinks", "issuetype",
+          "project"]
+
+# The same as _skip(), for use in queries
+SKIP_CLAUSE = "(resolution IS EMPTY OR resolution NOT IN (Duplicate, \"Won't Fix\"))"
+
+WEBHOOK_EVENTS = ("jira:issue_created", "jira:issue_updated", "jira:issue_deleted")
 
 class JiraModel:
     def __init__(self, my_config):
         self.conf = my_config
         self.jira_client = JiraClient(my_config)
-        self.jira_client.conn()
-        self.jira = self.jira_client.jira
+        self.metadata = Metadata(my_config, self.jira_client)
+        self.cache = None if my_config['no_cache'] else Cache(my_config)
+        self.offline = my_config['offline']
+        # VersionIndex of the project(s), built on first use by get_version_index()
+        self._version_index = None
+        self.local_filter = self._parse_local_filter()
 
         self._issues = None
         self._epics = None
+        # The raw Jira records behind _issues and _epics, as stored in the cache. None while they
+        # are still only in the cache, because the model was loaded from a snapshot. See records().
+        self._records = {'issues': {}, 'epics': {}}
+        # Number of records, for kinds loaded from a snapshot
+        self._record_count = {}
+        # Kinds loaded from the json cache, which don't have an up to date snapshot yet
+        self._snapshot_stale = set()
+        # Incremented whenever the loaded issues or epics change. Lets callers cache derived output.
+        self.version = 0
+        # Time of the last sync with Jira, per kind. cached_synced_at is what the cache had when
+        # it was loaded, before any refresh. Anything derived from the cache and saved alongside
+        # it can use that to tell whether it is still in sync with it.
+        self.synced_at = {}
+        self.cached_synced_at = {}
+        self._dirty = set()
+
+        # Derived structures, kept up to date by _put() and _delete()
+        self._depths = {'issues': {}, 'epics': {}}
+        self._group_index = {}
+        # With --local-filter: FilterIndex over all issues/epics of the project(s), per kind
+        self.filter_index = {}
+        # EpicRollups over the issues, built on first use by get_rollups()
+        self._rollups = None
+        # SprintIndex over the issues, built on first use by get_sprints()
+        self._sprints = None
+        # (version, Reachability) over issues and epics, see get_reachability()
+        self._reachability = None
+        # Called as listener(kind, key, old_obj, new_obj) for every change after the initial load.
+        # old_obj is None for new issues, new_obj is None for removed issues.
+        self.listeners = []
+
+    @property
+    def jira(self):
+        """
+        The Jira connection is opened on first use, not when the model is created.
+        """
+        return self.jira_client.connection()
 
-    def _build_issues_query(self):
-        jql = f"type != Epic"
+    @property
+    def custom_fields(self):
+        """
+        dict of logical field name -> custom field id, for example "Story Points" -> "customfield_10013"
+        """
+        return self.metadata.fields()
+
+    @property
+    def query_fields(self):
+        return FIELDS + sorted(set(self.custom_fields.values()))
+
+    def _parse_local_filter(self):
+        if not self.conf['local_filter'] or not self.conf['jira_filter']:
+            return None
+        try:
+            return parse_filters(self.conf['jira_filter'], versions=self.get_version_index)
+        except UnsupportedQuery as e:
+            print(f"Letting Jira evaluate --jira-filter: {e}")
+            return None
+
+    def _build_query(self, kind, updated_minutes=None, keys=None, clause=None, order_by="key", log=True,
+                     server_filter=None):
+        """
+        :param bool server_filter: Include --jira-filter in the query. By default it is included,
+                                   unless it is evaluated locally.
+        """
+        if server_filter is None:
+            server_filter = self.local_filter is None
+        jql = f"type = Epic" if kind == 'epics' else f"type != Epic"
         if self.conf['jira_project']:
             jql += f" AND project IN({', '.join(self.conf['jira_project'])})"
-        if self.conf['jira_filter']:
+        if self.conf['jira_filter'] and server_filter:
             for filter in self.conf['jira_filter']:
                 jql += f" AND {filter}"
-        jql += " ORDER BY key"
-        print("Jira query: " + jql)
+        if updated_minutes:
+            jql += f" AND updated >= \"-{updated_minutes}m\""
+        if keys:
+            jql += f" AND key IN({', '.join(keys)})"
+        if clause:
+            jql += f" AND {clause}"
+        if order_by:
+            jql += f" ORDER BY {order_by}"
+        if log:
+            print("Jira query: " + jql)
         return jql
 
-    def _query_issues(self):
-        jql = self._build_issues_query()
-        new_issues = self.jira.jql(jql, start=0, limit=100)
+    def _query(self, jql, fields=None, expand=None):
+        trim = fields is None
+        fields = self.query_fields if trim else fields
+        new_issues = self.jira.jql(jql, fields=fields, start=0, limit=100, expand=expand)
         start_at = 100
         while new_issues['issues']:
             print(len(new_issues['issues']))
             for issue in new_issues['issues']:
-                yield issue
-            new_issues = self.jira.jql(jql, start=start_at, limit=100)
+                yield _trim(issue, fields) if trim else issue
+            new_issues = self.jira.jql(jql, fields=fields, start=start_at, limit=100, expand=expand)
             start_at += 100
 
+    def count(self, kind, clause=None):
+        """
+        Number of issues (or epics) matching the query and clause, without downloading them.
+        Issues that _skip() would skip are not counted.
+        """
+        clause = f"{clause} AND {SKIP_CLAUSE}" if clause else SKIP_CLAUSE
+        jql = self._build_query(kind, clause=clause, order_by=None, log=False, server_filter=True)
+        return self.jira.jql(jql, fields="key", limit=0)['total']
+
+    def first_created(self, kind):
+        """
+        :return: The created date of the oldest issue (or epic) matching the query, or None.
+        """
+        jql = self._build_query(kind, clause=SKIP_CLAUSE, order_by="created ASC", server_filter=True)
+        found = self.jira.jql(jql, fields="created", limit=1)['issues']
+        return parse_date(found[0]['fields']['created']) if found else None
+
+    def changelog_transitions(self, kinds=('epics', 'issues')):
+        """
+        Query the status history of all issues and epics. Jira includes the changelog in search
+        results, but only the fields needed here are fetched.
+
+        :return: Generator of (key, date, from status, to status)
+        """
+        for kind in kinds:
+            jql = self._build_query(kind)
+            for record in self._query(jql, fields="key", expand="changelog"):
+                for history in record.get('changelog', {}).get('histories', []):
+                    for item in history['items']:
+                        if item['field'] == "status":
+                            yield record['key'], parse_date(history['created']), item['fromString'], item['toString']
+
+    def _skip(self, issue):
+        # Skip issues that are closed as duplicates of other epics or won't fix
+        return issue['fields']['resolution'] and (
+            issue['fields']['resolution']['name'] == "Duplicate" or
+            issue['fields']['resolution']['name'] == "Won't Fix")
+
+    def _issue_fields(self, issue):
+        key, obj = self._get_fields(issue)
+        epic = issue['fields'].get(self.custom_fields['Epic'])
+        epic = epic if epic else "No Epic"
+        obj['epic'] = epic
+        return key, obj
+
+    def _epic_fields(self, epic):
+        key, obj = self._get_fields(epic)
+
+        epic_name = epic['fields'].get(self.custom_fields['Epic Name'])
+        epic_name = self.safe_chars(epic_name if epic_name else epic['fields']['summary'])
+        obj['epic_name'] = epic_name
+        return key, obj
+
+    def _fields_function(self, kind):
+        return self._issue_fields if kind == 'issues' else self._epic_fields
+
+    def _objects(self, kind):
+        return self._issues if kind == 'issues' else self._epics
+
     def issues(self):
-        for issue in self._query_issues():
-            # Skip issues that are closed as duplicates of other epics or won't fix
-            if issue['fields']['resolution'] and (
-                issue['fields']['resolution']['name'] == "Duplicate" or 
-                issue['fields']['resolution']['name'] == "Won't Fix"):
-               continue
-
-            key, obj = self._get_fields(issue)
-            epic = issue['fields'][CUSTOM_FIELD['Epic']]
-            epic = epic if epic else "No Epic"
-            obj['epic'] = epic
-            yield key, obj
+        for issue in self.records('issues').values():
+            if not self._skip(issue):
+                yield self._issue_fields(issue)
 
     def get_issues(self):
         if self._issues:
             return self._issues
 
-        issues = {k:v for k,v in self.issues()}
-        self._issues = self.remove_dead_end_links(issues)
+        self._load('issues')
         return self._issues
 
-    def _build_epics_query(self):
-        jql = f"type = Epic"
-        if self.conf['jira_project']:
-            jql += f" AND project IN({', '.join(self.conf['jira_project'])})"
-        if self.conf['jira_filter']:
-            for filter in self.conf['jira_filter']:
-                jql += f" AND {filter}"
-        jql += " ORDER BY key"
-        print("Jira query: " + jql)
-        return jql
-
-    def _query_epics(self):
-        jql = self._build_epics_query()
-        new_issues = self.jira.jql(jql, start=0, limit=100)
-        start_at = 101
-        while new_issues['issues']:
-            print(len(new_issues['issues']))
-            for epic in new_issues['issues']:
-                yield epic
-            new_issues = self.jira.jql(jql, start=start_at, limit=100)
-            start_at += 100
-
     def epics(self):
-        for epic in self._query_epics():
-            # Skip epics that are closed as duplicates of other epics or won't fix
-            if epic['fields']['resolution'] and (
-                epic['fields']['resolution']['name'] == "Duplicate" or 
-                epic['fields']['resolution']['name'] == "Won't Fix"):
-               continue
-
-            key, obj = self._get_fields(epic)
-
-            epic_name = epic['fields'][CUSTOM_FIELD['Epic Name']]
-            epic_name = self.safe_chars(epic_name)
-            obj['epic_name'] = epic_name
-
-            yield key, obj
+        for epic in self.records('epics').values():
+            if not self._skip(epic):
+                yield self._epic_fields(epic)
 
     def get_epics(self):
         if self._epics:
             return self._epics
 
-        epics = {k:v for k, v in self.epics()}
-        self._epics = self.remove_dead_end_links(epics)
+        self._load('epics')
         return self._epics
 
+    def _load(self, kind):
+        jql = self._build_query(kind)
+        objs = self._load_snapshot(kind) if self.cache else None
+        cached = objs is not None
+        if cached:
+            print(f"Using {len(objs)} {kind} from snapshot in {self.cache.dir}")
+            REGISTRY.inc("jiradash_cache_lookups", kind=kind, result="snapshot")
+        else:
+            cached = self.cache.load_json(self.cache_file(kind)) if self.cache else None
+            REGISTRY.inc("jiradash_cache_lookups", kind=kind, result="json" if cached else "miss")
+            if cached:
+                print(f"Using {len(cached['records'])} cached {kind} from {self.cache.dir}")
+                self._records[kind] = cached['records']
+                self.synced_at[kind] = cached['synced_at']
+                self.cached_synced_at[kind] = cached['synced_at']
+                self._snapshot_stale.add(kind)
+            elif self.offline:
+                sys.exit(f"No cached {kind} for '{jql}' and --offline was given.")
+            else:
+                self.synced_at[kind] = time.time()
+                self._records[kind] = {record['key']: record for record in self._query(jql)}
+                self._dirty.add(kind)
+            objs = {k: v for k, v in (self.issues() if kind == 'issues' else self.epics())}
+
+        if self.local_filter is not None:
+            self.filter_index[kind] = FilterIndex(objs)
+            keys = self.filter_index[kind].select(self.local_filter)
+            print(f"{len(keys)} of {len(objs)} {kind} match --jira-filter")
+            # Copies, because deps are pruned differently than in the index
+            objs = {key: dict(objs[key]) for key in keys}
+        objs = self.remove_dead_end_links(objs)
+        if kind == 'issues':
+            self._issues = objs
+        else:
+            self._epics = objs
+        self.version += 1
+        loaded = Counter(obj['project'] for obj in objs.values())
+        for project in loaded.keys() | set(self.conf['jira_project'] or []):
+            REGISTRY.set("jiradash_issues_loaded", loaded[project], project=project, kind=kind)
+
+        if cached and not self.offline:
+            self.apply_changes({kind: self._fetch_updated(kind)})
+        self.save_cache()
+
+    def cache_file(self, kind, suffix=None, extension="json"):
+        """
+        :return: Name of the cache file for this query. Use suffix for data derived from it, which
+                 is then specific to --jira-filter even if the filter is evaluated locally.
+        """
+        jql = self._build_query(kind, server_filter=True if suffix else None, log=False)
+        return f"{cache_name(jql, *self.query_fields)}-{suffix or kind}.{extension}"
+
+    def records(self, kind):
+        """
+        :return: dict of key -> raw Jira record. After loading from a snapshot, they are read from
+                 the json cache only when first needed, which is when something changed.
+        """
+        if self._records[kind] is None:
+            self._records[kind] = self.cache.load_json(self.cache_file(kind))['records']
+        return self._records[kind]
+
+    def _record_count_of(self, kind):
+        if self._records[kind] is None:
+            return self._record_count[kind]
+        return len(self._records[kind])
+
+    def save_cache(self):
+        """
+        Write the raw records of everything that changed since the last save to the cache, and a
+        snapshot of the normalized issues next to them.
+        """
+        if not self.cache:
+            return
+        for kind in list(self._dirty):
+            self._dirty.discard(kind)
+            if self._records[kind] is None:
+                # Records not read from the cache since loading a snapshot haven't changed. Only
+                # the sync time did, and the snapshot has that too.
+                snapshot.set_synced_at(self.cache.path(self.cache_file(kind, extension="snapshot")),
+                                       self.synced_at[kind])
+                continue
+            cached = {'synced_at': self.synced_at[kind], 'records': self._records[kind]}
+            self.cache.save_json(self.cache_file(kind), cached)
+            self._snapshot_stale.add(kind)
+        for kind in list(self._snapshot_stale):
+            self._save_snapshot(kind)
+            self._snapshot_stale.discard(kind)
+
+    def _save_snapshot(self, kind):
+        # With --local-filter the snapshot has all issues, the filter is applied after loading it
+        objs = self.filter_index[kind].objs if kind in self.filter_index else self._objects(kind)
+        if objs is None:
+            return
+        source = os.stat(self.cache.path(self.cache_file(kind)))
+        content = snapshot.dump(objs, synced_at=self.synced_at[kind], records=self._record_count_of(kind),
+                                source=[source.st_mtime_ns, source.st_size])
+        if content is not None:
+            self.cache.save_bytes(self.cache_file(kind, extension="snapshot"), content)
+
+    def _load_snapshot(self, kind):
+        """
+        :return: dict of normalized issues from the snapshot, or None if there is no snapshot of
+                 the current json cache file.
+        """
+        try:
+            source = os.stat(self.cache.path(self.cache_file(kind)))
+            with snapshot.Snapshot(self.cache.path(self.cache_file(kind, extension="snapshot"))) as snap:
+                if snap.header['source'] != [source.st_mtime_ns, source.st_size]:
+                    return None
+                objs = snap.objs()
+                header = snap.header
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            print(f"Ignoring snapshot: {e}")
+            return None
+
+        self._records[kind] = None
+        self._record_count[kind] = header['records']
+        self.synced_at[kind] = header['synced_at']
+        self.cached_synced_at[kind] = header['synced_at']
+        return objs
+
+    def refresh(self):
+        """
+        Merge issues and epics that were updated in Jira since the last load or refresh.
+
+        Only what was already loaded is refreshed. Deleted issues are noticed by comparing issue
+        counts with Jira, which costs a full list of keys, so apply_webhook() is quicker for those.
+
+        :return: True if anything in the model changed.
+        """
+        return self.apply_changes(self.fetch_changes())
+
+    def fetch_changes(self):
+        """
+        Query Jira for records updated since the last sync. Does not modify the model.
+
+        :return: dict of {'issues'|'epics': (sync_time, [raw jira records], keys)}
+        """
+        changes = {}
+        if self.offline:
+            return changes
+        if self._issues is not None:
+            changes['issues'] = self._fetch_updated('issues')
+        if self._epics is not None:
+            changes['epics'] = self._fetch_updated('epics')
+        return changes
+
+    def _fetch_updated(self, kind):
+        """
+        :return: tuple (sync_time, records, keys). keys is None, unless the number of issues in
+                 Jira doesn't match what the cache will have after merging records. Then it's the
+                 set of all keys currently matching the query.
+        """
+        sync_time = time.time()
+        # Jira only understands minutes here. Overlap is harmless, records are just merged again.
+        minutes = int((sync_time - self.synced_at[kind]) / 60) + 2
+        records = list(self._query(self._build_query(kind, updated_minutes=minutes)))
+
+        # Issues that were deleted, or no longer match --jira-filter, don't show up as updated.
+        # Comparing counts is a cheap way to notice them.
+        jql = self._build_query(kind)
+        total = self.jira.jql(jql, fields="key", limit=0)['total']
+        expected = self._record_count_of(kind)
+        if records:
+            known = self.records(kind)
+            expected = len(known) + len([r for r in records if r['key'] not in known])
+        if total == expected:
+            return sync_time, records, None
+
+        keys = {issue['key'] for issue in self._query(jql, fields="key")}
+        known = self.records(kind)
+        missing = [key for key in keys if key not in known]
+        for i in range(0, len(missing), 100):
+            records += self._query(self._build_query(kind, keys=missing[i:i+100]))
+        return sync_time, records, keys
+
+    def apply_changes(self, changes):
+        """
+        Merge the output of fetch_changes() into the model.
+
+        :return: True if anything in the model changed.
+        """
+        changed = False
+        for kind, (sync_time, records, keys) in changes.items():
+            for record in records:
+                changed = self._put(kind, record) or changed
+            if keys is not None:
+                for key in [key for key in self.records(kind) if key not in keys]:
+                    changed = self._delete(kind, key) or changed
+            self.synced_at[kind] = sync_time
+            self._dirty.add(kind)
+
+        if changed:
+            self.version += 1
+        return changed
+
+    def apply_webhook(self, payload):
+        """
+        Apply a Jira webhook payload to the loaded issues or epics.
+
+        Created and updated issues are normalized with _get_fields() exactly like queried ones. If
+        --jira-filter is used, Jira is asked whether this one issue still matches the filter.
+
+        :param dict payload: The json body Jira posted, one of WEBHOOK_EVENTS.
+        :return: True if the model changed.
+        :raises ValueError: if the issue in the payload is malformed. The model isn't changed then.
+        """
+        event = payload.get('webhookEvent')
+        record = payload.get('issue')
+        if event not in WEBHOOK_EVENTS or not record:
+            return False
+        if not isinstance(record, dict) or not isinstance(record.get('key'), str) or not isinstance(record.get('fields'), dict):
+            raise ValueError("Webhook issue has no key or fields")
+        key = record['key']
+        if self.conf['jira_project'] and key.split("-")[0] not in self.conf['jira_project']:
+            return False
+
+        issuetype = record['fields'].get('issuetype')
+        if not isinstance(issuetype, dict) or not isinstance(issuetype.get('name'), str):
+            raise ValueError(f"Webhook issue {key} has no issuetype")
+        kind = 'epics' if issuetype['name'] == "Epic" else 'issues'
+        if event != "jira:issue_deleted":
+            record = _trim(record, self.query_fields)
+            # Normalized once before anything is changed, so that a malformed record can't be half applied
+            try:
+                self._skip(record)
+                self._fields_function(kind)(record)
+            except (KeyError, TypeError, AttributeError) as e:
+                raise ValueError(f"Webhook issue {key} can't be read: {e!r}")
+        other_kind = 'issues' if kind == 'epics' else 'epics'
+        changed = False
+        # Issue type was changed to or from Epic
+        if self._objects(other_kind) is not None:
+            changed = self._delete(other_kind, key)
+
+        if self._objects(kind) is not None:
+            if event == "jira:issue_deleted" or not self._matches_filter(kind, key):
+                changed = self._delete(kind, key) or changed
+            else:
+                changed = self._put(kind, record) or changed
+
+        if changed:
+            self.version += 1
+            self._dirty.add(kind)
+        return changed
+
+    def _matches_filter(self, kind, key):
+        # A local filter is evaluated in _put()
+        if not self.conf['jira_filter'] or self.offline or self.local_filter is not None:
+            return True
+        found = self.jira.jql(self._build_query(kind, keys=[key]), fields="key", limit=1)
+        return len(found['issues']) > 0
+
+    def _put(self, kind, record):
+        """
+        Add or replace one raw Jira record in the model.
+
+        :return: True if the normalized issue changed.
+        """
+        # Skipped records are kept, so that the cache has the same number of records as Jira
+        self.records(kind)[record['key']] = record
+        if self._skip(record):
+            if kind in self.filter_index:
+                self.filter_index[kind].update(record['key'], None)
+            return self._remove(kind, record['key'])
+
+        key, obj = self._fields_function(kind)(record)
+        if self.local_filter is not None:
+            self.filter_index[kind].update(key, obj)
+            if not matches(self.local_filter, obj):
+                return self._remove(kind, key)
+            obj = dict(obj)
+        return self._put_obj(kind, key, obj)
+
+    def _put_obj(self, kind, key, obj):
+        """
+        Add or replace one normalized issue in the model.
+
+        :return: True if it changed.
+        """
+        objs = self._objects(kind)
+        obj['deps'] = [dep_key for dep_key in obj['all_deps'] if dep_key in objs]
+        old = objs.get(key)
+        if old == obj:
+            return False
+
+        objs[key] = obj
+        if old is None:
+            self._relink(objs, key)
+        self._changed(kind, key, old, obj)
+        return True
+
+    def _delete(self, kind, key):
+        self.records(kind).pop(key, None)
+        if kind in self.filter_index:
+            self.filter_index[kind].update(key, None)
+        return self._remove(kind, key)
+
+    def _remove(self, kind, key):
+        objs = self._objects(kind)
+        old = objs.pop(key, None)
+        if old is None:
+            return False
+
+        self._relink(objs, key)
+        self._changed(kind, key, old, None)
+        return True
+
+    def _relink(self, objs, key):
+        # Links to an issue that just appeared or disappeared become live or dead
+        for obj in objs.values():
+            if key in obj['all_deps']:
+                obj['deps'] = [dep_key for dep_key in obj['all_deps'] if dep_key in objs]
+
+    def _count_loaded(self, kind, obj, n):
+        REGISTRY.inc("jiradash_issues_loaded", n, project=obj['project'], kind=kind)
+
+    def _changed(self, kind, key, old, new):
+        if old is not None:
+            self._count_loaded(kind, old, -1)
+        if new is not None:
+            self._count_loaded(kind, new, 1)
+        # Depth follows chains of links, so any change can move others. It's cheap to recompute.
+        self._depths[kind].clear()
+        for (index_kind, groupby), index in self._group_index.items():
+            if index_kind != kind:
+                continue
+            if old is not None:
+                index[old[groupby]].discard(key)
+                if not index[old[groupby]]:
+                    del index[old[groupby]]
+            if new is not None:
+                index.setdefault(new[groupby], set()).add(key)
+
+        for listener in self.listeners:
+            listener(kind, key, old, new)
+
     def _get_fields(self, issue):
         key = issue['key']
-        points = issue['fields'][CUSTOM_FIELD['Story Points']]
+        points = issue['fields'].get(self.custom_fields['Story Points'])
         points = points if points else 0.0
         summary = issue['fields']['summary']
         assignee = issue['fields']['assignee']
+        assignee_id = assignee.get('accountId', assignee.get('name', "")) if assignee else ""
         assignee = assignee['displayName'] if assignee else ""
-        status_category = issue['fields']['status']['statusCategory']['name']
+        status = issue['fields']['status']
+        status_category = status['statusCategory']['name']
+        status = status.get('name', status_category)
+        issuetype = issue['fields']['issuetype']
+        issuetype = issuetype['name'] if issuetype else ""
+        resolution = issue['fields']['resolution']
+        resolution = resolution['name'] if resolution else ""
         url = self.conf['jira_server'] + "/browse/" + key
-        component = issue['fields']['components']
-        component = component.pop() if component else {'name': "General"}
-        component = component['name'].replace(" ", "_")
-        fixVersions = issue['fields']['fixVersions']
-        fixVersions = [v['name'] for v in fixVersions]
-        fixVersions = fixVersions.pop() if fixVersions else "never"
-
-        created = issue['fields']['created']
-        created = dateutil.parser.parse(created) if created else None
-        statuscategorychangedate = issue['fields']['statuscategorychangedate']
-        statuscategorychangedate = dateutil.parser.parse(statuscategorychangedate) if statuscategorychangedate else None
-        resolution_date = issue['fields']['resolutiondate']
-        resolution_date = dateutil.parser.parse(resolution_date) if resolution_date else None
+        all_components = [c['name'] for c in issue['fields']['components']]
+        component = all_components[-1] if all_components else "General"
+        component = component.replace(" ", "_")
+        all_fixVersions = [v['name'] for v in issue['fields']['fixVersions']]
+        fixVersions = all_fixVersions[-1] if all_fixVersions else "never"
+        sprint_field = self.custom_fields.get('Sprint')
+        sprints = sprint_ids(issue['fields'].get(sprint_field)) if sprint_field else []
+
+        created = parse_date(issue['fields']['created'])
+        statuscategorychangedate = parse_date(issue['fields']['statuscategorychangedate'])
+        resolution_date = parse_date(issue['fields']['resolutiondate'])
         start_date = None
         if status_category == "In Progress":
-            start_date = dateutil.parser.parse(issue['fields']['statuscategorychangedate'])
+            start_date = statuscategorychangedate
 
-        obj = {"url":url, "deps":[], "summary": summary, "statusCategory": status_category, "components":component, "points": points, "fixVersions": fixVersions,
+        obj = {"url":url, "deps":[], "all_deps":[], "summary": summary, "statusCategory": status_category, "components":component, "points": points, "fixVersions": fixVersions,
                         "start_date": start_date, "created_date": created, "statuscategorychangedate": statuscategorychangedate, "resolution_date": resolution_date, 
-                        "assignee": assignee, "key": key}
+                        "assignee": assignee, "key": key,
+                        "project": key.split("-")[0], "status": status, "issuetype": issuetype, "resolution": resolution,
+                        "assignee_id": assignee_id, "all_components": all_components, "all_fixVersions": all_fixVersions,
+                        "sprints": sprints}
         issuelinks = issue['fields']['issuelinks']
 
         for link in issuelinks:
             if link['type']['outward'] == 'Depends on' and 'outwardIssue' in link:
                 dep_key = link['outwardIssue']['key']
+                obj['all_deps'].append(dep_key)
                 obj['deps'].append(dep_key)
 
         return key, obj
 
     def remove_dead_end_links(self, issues):
+        """
+        Drop links to issues that aren't in this set. obj['all_deps'] keeps the original links, so
+        this can be run again after issues were added.
+        """
         all_removed = []
         for key, obj in issues.items():
-            to_remove = []
-            for dep_key in obj['deps']:
-                if not dep_key in issues:
-                    to_remove.append(dep_key)
-            for dead_key in to_remove:
-                obj['deps'].remove(dead_key)
-            all_removed += to_remove
+            obj['deps'] = [dep_key for dep_key in obj['all_deps'] if dep_key in issues]
+            all_removed += [dep_key for dep_key in obj['all_deps'] if not dep_key in issues]
         print(f"Ignoring dependencies not in this set: {all_removed}")
+        REGISTRY.inc("jiradash_dead_links_pruned", len(all_removed))
         return issues
 
+    def get_rollups(self):
+        """
+        :return: EpicRollups of the issues, kept up to date when issues change.
+        """
+        if self._rollups is None:
+            rollups = EpicRollups()
+            rollups.rebuild(self.get_issues())
+            self.listeners.append(rollups.update)
+            self._rollups = rollups
+        return self._rollups
+
+    def sprint_info(self):
+        """
+        :return: dict of sprint id -> sprint metadata, see Metadata.sprints()
+        """
+        return self.metadata.sprints()
+
+    def status_categories(self):
+        """
+        :return: dict of status name -> status category name, see Metadata.status_categories()
+        """
+        return self.metadata.status_categories()
+
+    def get_sprints(self):
+        """
+        :return: SprintIndex of the issues, kept up to date when issues change.
+        """
+        if self._sprints is None:
+            sprints = SprintIndex(self.sprint_info())
+            sprints.rebuild(self.get_issues())
+            self.listeners.append(sprints.update)
+            self._sprints = sprints
+        return self._sprints
+
+    def get_reachability(self):
+        """
+        :return: Reachability over the "Depends on" links of the issues and epics together, rebuilt
+                 when they changed since the last call.
+        """
+        objs = {**self.get_epics(), **self.get_issues()}
+        if self._reachability is None or self._reachability[0] != self.version:
+            self._reachability = (self.version, Reachability(objs))
+        return self._reachability[1]
+
     def get_issues_per_epic(self):
-        by_epic = {}
-        count = 0
-        for obj in self.get_issues().values():
-            count += 1
-            epic = obj['epic']
-            if not epic in by_epic:
-                by_epic[epic] = []
-            by_epic[epic].append(obj)
-
-        print(count)
-        return by_epic
+        rollups = self.get_rollups()
+        return {epic: list(members.values()) for epic, members in rollups.members.items()}
 
     def get_groups(self, groupby="components", issue_type="epic", sort="depth"):
         """
@@ -192,58 +691,148 @@ class JiraModel:
         :param str sort:    Method to sort with.
         :return:            set() of strings that are the groups found, for example the Jira components.
         """
-        issues = self._issues if issue_type == "issue" else self._epics
+        kind = "issues" if issue_type == "issue" else "epics"
         assert sort == 'depth', "Only 'depth' is supported as sort method."
 
-        groups = set()
-        for obj in issues.values():
-            groups.add(obj[groupby])
-        return _sort_groups_by_depth(groups, groupby, issues)
+        index = self._get_group_index(kind, groupby)
+        return _sort_groups_by_depth(index, groupby, self._objects(kind), self._depths[kind])
 
     def get_epics_by_depth(self, group, groupby="components"):
-        return _sort_epics_by_depth(group, groupby, self._epics)
+        keys = self._get_group_index("epics", groupby).get(group, ()) if groupby else self._epics.keys()
+        return _sort_epics_by_depth(keys, self._epics, self._depths["epics"])
+
+    def _get_group_index(self, kind, groupby):
+        """
+        :return: dict of {group: set(keys)}. Built on first use, then kept up to date by _changed().
+        """
+        index = self._group_index.get((kind, groupby))
+        if index is None:
+            index = {}
+            for key, obj in self._objects(kind).items():
+                index.setdefault(obj[groupby], set()).add(key)
+            self._group_index[(kind, groupby)] = index
+        return index
+
+    def get_version_index(self):
+        """
+        :return: VersionIndex of the versions of the project(s), built once.
+        """
+        if self._version_index is None:
+            sequences = [[v['name'] for v in self.metadata.versions(project)] for project in self.conf['jira_project'] or []]
+            self._version_index = VersionIndex(self.metadata.versions(), sequences)
+        return self._version_index
 
     def get_versions(self):
-        versions = []
-        for project in self.conf['jira_project']:
-            versions += self.jira.get_project_versions(project)
-        #versions.sort(key=lambda v: v['releaseDate'] if 'releaseDate' in v else "9")
-        versions = [v['name'] for v in versions]
+        """
+        :return: list of version names, in release order.
+        """
+        versions = self.get_version_index().names
         print(versions)
         return versions
 
     def safe_chars(self, string):
-        return re.sub(r'\W', " ", string)
+        return safe_chars(string)
+
+
+def create_model(my_config):
+    """
+    :return: A JiraModel, or with --federate or --jira-instance, a FederatedModel.
+    """
+    if my_config['federate'] or my_config['jira_instance']:
+        from .federation import FederatedModel
+        return FederatedModel(my_config)
+    return JiraModel(my_config)
+
+class ModelView(JiraModel):
+    """
+    A read only model over some of the issues and epics of an already loaded model. The objects
+    are shared with it, not loaded or copied again, so many reports can be drawn from one load.
+    """
+    def __init__(self, model, my_config, keys=None):
+        """
+        :param JiraModel model: Loaded model to take the issues and epics from.
+        :param my_config: Config of the reports drawn from this view.
+        :param dict keys: kind -> keys to include. Default is everything in model.
+        """
+        # Before JiraModel.__init__, which may need the versions to parse the filter
+        self.model = model
+        super().__init__(my_config)
+        self.metadata = model.metadata
+        self.jira_client = model.jira_client
+        self.cache = None
+        self.offline = True
+        self.local_filter = None
+        self.synced_at = dict(model.synced_at)
+        for kind in ('issues', 'epics'):
+            objs = model.get_issues() if kind == 'issues' else model.get_epics()
+            if keys is not None:
+                # Copies, because deps are pruned to the subset
+                objs = self.remove_dead_end_links({key: dict(objs[key]) for key in keys[kind]})
+            if kind == 'issues':
+                self._issues = objs
+            else:
+                self._epics = objs
 
+    def get_issues(self):
+        return self._issues
+
+    def get_epics(self):
+        return self._epics
 
-def _depth(issues, issue, d=0):
-    if issue['deps']:
-        return _depth(issues, issues[issue['deps'][0]], d+1)
-    return d
+    def get_version_index(self):
+        return self.model.get_version_index()
 
-def _group_depth(group, groupby, epics):
+    def get_versions(self):
+        return self.model.get_versions()
+
+    def sprint_info(self):
+        return self.model.sprint_info()
+
+    def status_categories(self):
+        return self.model.status_categories()
+
+def _trim(record, query_fields):
+    """
+    Keep only the fields JiraModel uses. Queried records and webhook payloads end up in the same shape.
+    """
+    fields = record['fields']
+    return {'key': record['key'], 'fields': {name: fields.get(name) for name in query_fields}}
+
+def _depth(issues, issue, memo=None):
+    """
+    Number of links to follow, using the first dependency of each issue, to reach an issue that
+    doesn't depend on anything. Results are stored in memo. A cycle counts as depth 0.
+    """
+    memo = {} if memo is None else memo
+    chain = []
+    while issue['deps'] and issue['key'] not in memo and issue['key'] not in chain:
+        chain.append(issue['key'])
+        issue = issues[issue['deps'][0]]
+
+    d = memo.get(issue['key'], 0)
+    memo[issue['key']] = d
+    for key in reversed(chain):
+        d += 1
+        memo[key] = d
+    return memo[chain[0]] if chain else d
+
+def _group_depth(keys, groupby, epics, memo=None):
     use_shortest = True if groupby != "fixVersions" else False
     depth = 9999 if use_shortest else -9999
-    for key, obj in epics.items():
-        if (not groupby) or group == obj[groupby]:
-            new_depth = _depth(epics, obj)
-            if new_depth < depth and use_shortest:
-                depth = new_depth
-            elif new_depth > depth and not use_shortest:
-                depth = new_depth
+    for key in keys:
+        new_depth = _depth(epics, epics[key], memo)
+        if new_depth < depth and use_shortest:
+            depth = new_depth
+        elif new_depth > depth and not use_shortest:
+            depth = new_depth
     return depth
 
-def _sort_epics_by_depth(group, groupby, epics):
-    pairs = []
-    for key, obj in epics.items():
-        if groupby and obj[groupby] != group:
-            continue
-        pairs.append((key, _depth(epics, obj)))
-
+def _sort_epics_by_depth(keys, epics, memo=None):
+    pairs = [(key, _depth(epics, epics[key], memo)) for key in keys]
     pairs.sort(key = itemgetter(1, 0))
     return [epic[0] for epic in pairs]
 
-def _sort_groups_by_depth(groups, groupby, epics):
-    pairs = [(group, _group_depth(group, groupby, epics)) for group in groups]
+def _sort_groups_by_depth(index, groupby, epics, memo=None):
+    pairs = [(group, _group_depth(keys, groupby, epics, memo)) for group, keys in index.items()]
     pairs.sort(key = itemgetter(1, 0))
     return [group[0] for group in pairs]
@@ -0,0 +1,378 @@
+#!/usr/bin/python3
+"""
+Evaluate a subset of JQL locally, against issues normalized by JiraModel._get_fields().
+
+This allows downloading all issues of a project once, and then produce reports for many different
+--jira-filter variants from that same data.
+
+Supported:
+
+    field = value, field != value, field IN (a, b), field NOT IN (a, b), field IS [NOT] EMPTY,
+    resolution = Unresolved, date < "2024-01-31", date >= "-2w", fixVersion >= "2.0", AND, OR, NOT,
+    parenthesis
+
+for the fields listed in FIELDS. Anything else raises UnsupportedQuery, and the caller should let
+Jira evaluate the filter instead. Fix version ranges are turned into IN lists of the versions in
+the range, in the version sequence of the project(s) in Jira, see jiradash.versions.
+
+"""
+import bisect
+import datetime
+import re
+
+# JQL field name -> (key in normalized issue, type)
+FIELDS = {
+    "project": ("project", "str"),
+    "key": ("key", "str"),
+    "issuekey": ("key", "str"),
+    "status": ("status", "str"),
+    "statuscategory": ("statusCategory", "str"),
+    "type": ("issuetype", "str"),
+    "issuetype": ("issuetype", "str"),
+    "resolution": ("resolution", "str"),
+    "component": ("all_components", "list"),
+    "components": ("all_components", "list"),
+    "fixversion": ("all_fixVersions", "list"),
+    "fixversions": ("all_fixVersions", "list"),
+    "assignee": ("assignee", "user"),
+    "epic link": ("epic", "str"),
+    "created": ("created_date", "date"),
+    "createddate": ("created_date", "date"),
+    "resolved": ("resolution_date", "date"),
+    "resolutiondate": ("resolution_date", "date"),
+    "statuscategorychangeddate": ("statuscategorychangedate", "date"),
+}
+
+# Placeholders _get_fields() uses for fields that are empty in Jira
+EMPTY_VALUES = {"", "No Epic", None}
+# resolution = Unresolved is JQL for an empty resolution
+UNRESOLVED = "unresolved"
+
+TOKEN = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'|(!=|<=|>=|=|<|>|\(|\)|,)|([^\s=!<>(),"\']+))')
+RELATIVE_DATE = re.compile(r'^([-+]?\d+)([wdhm])$')
+KEYWORDS = {"and", "or", "not", "in", "is", "empty", "null"}
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+def parse(jql, versions=None):
+    """
+    :param str jql: A JQL condition without ORDER BY. Several --jira-filter's can be joined with AND.
+    :param versions: Function that returns the VersionIndex of the project(s). Only called if jql
+                     compares fix versions with <, <=, > or >=.
+    :return: The parsed query, to be passed to matches() or FilterIndex.select().
+    :raises UnsupportedQuery: if anything in jql is outside the supported subset.
+    """
+    tokens = _tokenize(jql)
+    query, pos = _parse_or(tokens, 0, versions)
+    if pos != len(tokens):
+        raise UnsupportedQuery(f"Unexpected '{tokens[pos][1]}' in: {jql}")
+    return query
+
+
+def parse_filters(filters, versions=None):
+    """
+    Parse a list of --jira-filter's, which are implicitly joined with AND.
+    """
+    return parse(" AND ".join(f"({f})" for f in filters), versions)
+
+
+def _tokenize(jql):
+    tokens = []
+    pos = 0
+    jql = jql.strip()
+    while pos < len(jql):
+        m = TOKEN.match(jql, pos)
+        if not m or m.end() == pos:
+            raise UnsupportedQuery(f"Can't parse: {jql[pos:]}")
+        if m.group(1) is not None or m.group(2) is not None:
+            value = m.group(1) if m.group(1) is not None else m.group(2)
+            tokens.append(("str", re.sub(r'\\(.)', r'\1', value)))
+        elif m.group(3):
+            tokens.append(("op", m.group(3)))
+        else:
+            word = m.group(4)
+            kind = "kw" if word.lower() in KEYWORDS else "word"
+            tokens.append((kind, word.lower() if kind == "kw" else word))
+        pos = m.end()
+    return tokens
+
+
+def _peek(tokens, pos, kind=None, value=None):
+    if pos >= len(tokens):
+        return False
+    return (kind is None or tokens[pos][0] == kind) and (value is None or tokens[pos][1] == value)
+
+
+def _parse_or(tokens, pos, versions):
+    left, pos = _parse_and(tokens, pos, versions)
+    while _peek(tokens, pos, "kw", "or"):
+        right, pos = _parse_and(tokens, pos + 1, versions)
+        left = ("or", left, right)
+    return left, pos
+
+
+def _parse_and(tokens, pos, versions):
+    left, pos = _parse_not(tokens, pos, versions)
+    while _peek(tokens, pos, "kw", "and"):
+        right, pos = _parse_not(tokens, pos + 1, versions)
+        left = ("and", left, right)
+    return left, pos
+
+
+def _parse_not(tokens, pos, versions):
+    if _peek(tokens, pos, "kw", "not"):
+        query, pos = _parse_not(tokens, pos + 1, versions)
+        return ("not", query), pos
+    if _peek(tokens, pos, "op", "("):
+        query, pos = _parse_or(tokens, pos + 1, versions)
+        if not _peek(tokens, pos, "op", ")"):
+            raise UnsupportedQuery("Missing ')'")
+        return query, pos + 1
+    return _parse_clause(tokens, pos, versions)
+
+
+def _parse_clause(tokens, pos, versions):
+    if not (_peek(tokens, pos, "word") or _peek(tokens, pos, "str")):
+        raise UnsupportedQuery(f"Expected a field name at token {pos}")
+    name = tokens[pos][1]
+    if name.lower() not in FIELDS:
+        raise UnsupportedQuery(f"Field '{name}' isn't supported locally")
+    field, field_type = FIELDS[name.lower()]
+    pos += 1
+
+    if _peek(tokens, pos, "kw", "is"):
+        negate = _peek(tokens, pos + 1, "kw", "not")
+        pos += 2 if negate else 1
+        if not (_peek(tokens, pos, "kw", "empty") or _peek(tokens, pos, "kw", "null")):
+            raise UnsupportedQuery("Expected EMPTY after IS")
+        return ("empty", field, field_type, negate), pos + 1
+
+    negate = _peek(tokens, pos, "kw", "not")
+    if _peek(tokens, pos + (1 if negate else 0), "kw", "in"):
+        pos += 2 if negate else 1
+        if not _peek(tokens, pos, "op", "("):
+            raise UnsupportedQuery("Expected '(' after IN")
+        values = []
+        pos += 1
+        while True:
+            value, pos = _parse_value(tokens, pos, field_type)
+            values.append(value)
+            if _peek(tokens, pos, "op", ")"):
+                break
+            if not _peek(tokens, pos, "op", ","):
+                raise UnsupportedQuery("Expected ',' or ')' in IN list")
+            pos += 1
+        if field_type == "date":
+            raise UnsupportedQuery("IN isn't supported for dates")
+        if field == "resolution" and UNRESOLVED in values:
+            return _unresolved_in(field, field_type, values, negate), pos + 1
+        return ("in", field, field_type, values, negate), pos + 1
+
+    if not _peek(tokens, pos, "op") or tokens[pos][1] in "(),":
+        raise UnsupportedQuery(f"Expected an operator after '{name}'")
+    op = tokens[pos][1]
+    value, pos = _parse_value(tokens, pos + 1, field_type)
+    if field_type == "date" and op in ("=", "!="):
+        raise UnsupportedQuery("Only <, <=, >, >= are supported for dates")
+    if field == "all_fixVersions" and op not in ("=", "!="):
+        return _version_range(field, op, value, versions), pos
+    if field_type != "date" and op not in ("=", "!="):
+        raise UnsupportedQuery(f"'{op}' is only supported for dates and fix versions")
+    if field == "resolution" and value == UNRESOLVED:
+        return ("empty", field, field_type, op == "!="), pos
+    return ("cmp", field, field_type, op, value), pos
+
+
+def _unresolved_in(field, field_type, values, negate):
+    """
+    :return: The query for resolution [NOT] IN (Unresolved, ...). Unresolved means the resolution is
+             empty, and NOT IN never matches an empty field anyway.
+    """
+    resolutions = [value for value in values if value != UNRESOLVED]
+    if not resolutions:
+        return ("empty", field, field_type, negate)
+    if negate:
+        return ("in", field, field_type, resolutions, True)
+    return ("or", ("empty", field, field_type, False), ("in", field, field_type, resolutions, False))
+
+
+def _version_range(field, op, value, versions):
+    """
+    :return: An IN query over the versions before or after the casefolded version name value.
+    """
+    if versions is None:
+        raise UnsupportedQuery("Comparing fix versions needs the versions of the project(s)")
+    names = versions().range(value, op)
+    if names is None:
+        raise UnsupportedQuery(f"Unknown fix version '{value}'")
+    return ("in", field, "list", names, False)
+
+
+def _parse_value(tokens, pos, field_type):
+    if not (_peek(tokens, pos, "word") or _peek(tokens, pos, "str")):
+        raise UnsupportedQuery(f"Expected a value at token {pos}")
+    # A function call, like currentUser() or startOfWeek()
+    if tokens[pos][0] == "word" and _peek(tokens, pos + 1, "op", "("):
+        raise UnsupportedQuery(f"Function {tokens[pos][1]}() isn't supported locally")
+    value = tokens[pos][1]
+    if field_type == "date":
+        return parse_date_value(value), pos + 1
+    return value.casefold(), pos + 1
+
+
+def parse_date_value(value, now=None):
+    """
+    Parse a JQL date: "2024-01-31", "2024/01/31 13:00" or relative like "-2w", "-7d", "-4h".
+    """
+    now = now if now else datetime.datetime.now().astimezone()
+    m = RELATIVE_DATE.match(value)
+    if m:
+        unit = {"w": "weeks", "d": "days", "h": "hours", "m": "minutes"}[m.group(2)]
+        return now + datetime.timedelta(**{unit: int(m.group(1))})
+    for fmt in ("%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M", "%Y-%m-%d", "%Y/%m/%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt).astimezone()
+        except ValueError:
+            continue
+    raise UnsupportedQuery(f"Can't parse date '{value}'")
+
+
+def _values(obj, field, field_type):
+    """
+    :return: list of casefolded values of field in obj. Empty list if the field is empty.
+    """
+    value = obj.get(field)
+    if field_type == "list":
+        return [v.casefold() for v in value] if value else []
+    if field_type == "user":
+        ids = [value, obj.get("assignee_id")]
+        return [v.casefold() for v in ids if v not in EMPTY_VALUES]
+    return [] if value in EMPTY_VALUES else [value.casefold()]
+
+
+def matches(query, obj):
+    """
+    :return: True if the normalized issue obj matches the parsed query.
+    """
+    op = query[0]
+    if op == "and":
+        return matches(query[1], obj) and matches(query[2], obj)
+    if op == "or":
+        return matches(query[1], obj) or matches(query[2], obj)
+    if op == "not":
+        return not matches(query[1], obj)
+
+    field, field_type = query[1], query[2]
+    if op == "empty":
+        empty = obj.get(field) is None if field_type == "date" else not _values(obj, field, field_type)
+        return empty != query[3]
+    if field_type == "date":
+        return _compare_date(obj.get(field), query[3], query[4])
+
+    values = _values(obj, field, field_type)
+    wanted = [query[4]] if op == "cmp" else query[3]
+    negate = query[3] == "!=" if op == "cmp" else query[4]
+    found = any(v in wanted for v in values)
+    # Like in Jira, != and NOT IN never match an empty field
+    return bool(values) and not found if negate else found
+
+
+def _compare_date(date, op, value):
+    if date is None:
+        return False
+    return {"<": date < value, "<=": date <= value, ">": date > value, ">=": date >= value}[op]
+
+
+class FilterIndex:
+    """
+    Inverted index over normalized issues, to evaluate many filters on the same issues quickly.
+
+    Equality and IN are set lookups, date comparisons are a binary search. The index can be kept
+    up to date with update() as issues change.
+    """
+    def __init__(self, objs=None):
+        self.objs = {}
+        # field -> casefolded value -> set of keys
+        self.postings = {}
+        # field -> set of keys where the field isn't empty
+        self.nonempty = {}
+        # date field -> sorted list of (timestamp, key), rebuilt when dirty
+        self._dates = {}
+        for key, obj in (objs or {}).items():
+            self.update(key, obj)
+
+    def update(self, key, obj):
+        """
+        Add, replace, or with obj=None remove, an issue.
+        """
+        old = self.objs.pop(key, None)
+        if old is not None:
+            self._index(key, old, remove=True)
+        if obj is not None:
+            self.objs[key] = obj
+            self._index(key, obj)
+        self._dates = {}
+
+    def _index(self, key, obj, remove=False):
+        for field, field_type in set(FIELDS.values()):
+            if field_type == "date":
+                continue
+            values = _values(obj, field, field_type)
+            nonempty = self.nonempty.setdefault(field, set())
+            postings = self.postings.setdefault(field, {})
+            for value in values:
+                if remove:
+                    postings[value].discard(key)
+                else:
+                    postings.setdefault(value, set()).add(key)
+            if remove:
+                nonempty.discard(key)
+            elif values:
+                nonempty.add(key)
+
+    def _sorted_dates(self, field):
+        if field not in self._dates:
+            dates = [(obj[field].timestamp(), key) for key, obj in self.objs.items() if obj.get(field)]
+            dates.sort()
+            self._dates[field] = dates
+        return self._dates[field]
+
+    def select(self, query):
+        """
+        :return: set of keys of the issues matching the parsed query.
+        """
+        op = query[0]
+        if op == "and":
+            return self.select(query[1]) & self.select(query[2])
+        if op == "or":
+            return self.select(query[1]) | self.select(query[2])
+        if op == "not":
+            return set(self.objs) - self.select(query[1])
+
+        field, field_type = query[1], query[2]
+        if field_type == "date":
+            dates = self._sorted_dates(field)
+            if op == "empty":
+                nonempty = {key for ts, key in dates}
+                return nonempty if query[3] else set(self.objs) - nonempty
+            cmp, ts = query[3], query[4].timestamp()
+            if cmp in ("<", "<="):
+                end = bisect.bisect_left(dates, (ts,)) if cmp == "<" else bisect.bisect_right(dates, (ts, "\uffff"))
+                return {key for t, key in dates[:end]}
+            start = bisect.bisect_right(dates, (ts, "\uffff")) if cmp == ">" else bisect.bisect_left(dates, (ts,))
+            return {key for t, key in dates[start:]}
+
+        nonempty = self.nonempty.get(field, set())
+        if op == "empty":
+            return set(nonempty) if query[3] else set(self.objs) - nonempty
+
+        postings = self.postings.get(field, {})
+        wanted = [query[4]] if op == "cmp" else query[3]
+        negate = query[3] == "!=" if op == "cmp" else query[4]
+        found = set()
+        for value in wanted:
+            found |= postings.get(value, set())
+        return nonempty - found if negate else found
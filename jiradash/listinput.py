@@ -5,9 +5,10 @@ TODO:
  * This is very specific and hardcoded to something I needed to do in a Datastax project. Sorry.
 """
 import csv
-from jiradash.jira_client import JiraClient, CUSTOM_FIELD
+from jiradash.jira_client import JiraClient
+from jiradash.metadata import Metadata
+from jiradash.versions import VersionIndex, parse_version
 from requests import HTTPError
-import semver
 import sys
 
 def entry_point(my_config):
@@ -23,6 +24,9 @@ class ListInput:
         self.jira = self.jira_client.jira
 
         self.project = self.conf['jira_project'][0]
+        self.versions = VersionIndex(Metadata(my_config, self.jira_client).versions(self.project))
+        # Parsed once, compared with the parsed fix version of each row
+        self.first_51 = parse_version('5.0.99')
 
         self.output_rows= []
         self.not_found_list = []
@@ -64,8 +68,8 @@ class ListInput:
 
                 fixVersions = issue['fields']['fixVersions']
                 versions = [v['name'] for v in fixVersions]
-                max_ver = _max_semver(versions)
-                if not _51_or_6(max_ver):
+                max_ver = self.versions.latest(versions)
+                if not _51_or_6(self.versions.parse(max_ver), self.first_51):
                     continue
 
                 summary = issue['fields']['summary']
@@ -99,15 +103,5 @@ class ListInput:
                 sys.exit(1)
         return issue
 
-def _max_semver(versions):
-    ver = '0.0.0'
-    for ver2 in versions:
-        try:
-            if semver.compare(ver, ver2) < 0:
-                ver = ver2
-        except ValueError:
-            continue
-    return ver
-
-def _51_or_6(version):
-    return semver.compare('5.0.99', version) < 0
+def _51_or_6(parsed, first_51):
+    return parsed is not None and parsed > first_51
@@ -2,9 +2,14 @@
 Dynamically load a python module based string argument. (Such as cli option)
 """
 from importlib import import_module
+from jiradash.metrics import REGISTRY
 
 def run_command(my_config):
     module_path = "jiradash." + my_config['command'][0]
     module = import_module(module_path, package="jiradash")
     func = getattr(module, 'entry_point')
-    func(my_config)
+    try:
+        func(my_config)
+    finally:
+        if my_config['metrics_file']:
+            REGISTRY.write_textfile(my_config['metrics_file'])
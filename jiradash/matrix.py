@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+"""
+Draw several reports, for every combination of command, --groupby and filter, from one load of
+the issues.
+
+    ./JiraDash.py matrix --matrix-command grid --matrix-command gantt \
+        --matrix-groupby components --matrix-groupby none \
+        --matrix-filter "fixVersion = 1.0" --matrix-filter "fixVersion = 2.0"
+
+The model is loaded once, then the reports are drawn by a pool of --jobs processes. Where fork is
+available the workers share the loaded model with the parent, so nothing is pickled or loaded
+again. Otherwise each worker loads the model from the cache snapshot with --offline. Filters are
+added to --jira-filter and evaluated locally (see jiradash.jql) when possible, else the worker
+queries them from Jira, or the cache, itself.
+
+"""
+from importlib import import_module
+from itertools import product
+import multiprocessing
+from jiradash.jira_model import ModelView, create_model
+from jiradash.jql import FilterIndex, UnsupportedQuery, parse_filters
+from jiradash.util import ConfigOverride
+
+# command -> (class, method that draws the report)
+REPORTS = {
+    "grid": ("Grid", "get_and_draw"),
+    "gantt": ("Gantt", "get_and_draw"),
+    "dependencies": ("Dependencies", "get_and_draw"),
+    "burnup": ("Burnup", "get_and_draw"),
+    "export": ("Export", "run"),
+}
+DEFAULT_COMMANDS = ["grid", "gantt", "dependencies", "burnup"]
+
+# Shared with the worker processes. Set before the pool forks, or by _init_worker().
+_model = None
+_index = {}
+
+
+def entry_point(my_config):
+    print(f"Drawing a matrix of reports for project(s): {my_config['jira_project']}")
+    matrix = Matrix(my_config)
+    matrix.run()
+
+
+class Matrix:
+    def __init__(self, my_config):
+        self.conf = my_config
+
+    def variants(self):
+        """
+        :return: list of (command, groupby, filter), filter is None for no additional filter.
+        """
+        commands = self.conf['matrix_command'] or DEFAULT_COMMANDS
+        groupbys = [None if g == "none" else g for g in self.conf['matrix_groupby'] or ["none", "components", "fixVersions"]]
+        filters = self.conf['matrix_filter'] or [None]
+        return list(product(commands, groupbys, filters))
+
+    def run(self):
+        global _model, _index
+        variants = self.variants()
+        # A picklable copy, without the argument parser
+        conf = ConfigOverride(self.conf)
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            _model = create_model(conf)
+            _model.get_epics()
+            _model.get_issues()
+            _model.get_versions()
+            if any(f is not None for _, _, f in variants):
+                _index = {'issues': FilterIndex(_model.get_issues()), 'epics': FilterIndex(_model.get_epics())}
+            context = multiprocessing.get_context("fork")
+            initializer, initargs = None, ()
+        else:
+            # Load once, so that the workers find a fresh cache snapshot
+            create_model(conf).get_issues()
+            context = multiprocessing.get_context()
+            initializer, initargs = _init_worker, (conf,)
+
+        print(f"Drawing {len(variants)} reports with {self.conf['jobs']} processes")
+        with context.Pool(self.conf['jobs'], initializer=initializer, initargs=initargs) as pool:
+            for variant in pool.imap_unordered(_draw, [(conf, variant) for variant in variants]):
+                print(f"Done: {variant}")
+
+
+def _init_worker(conf):
+    global _model, _index
+    _model = create_model(ConfigOverride(conf, offline=True))
+    _model.get_epics()
+    _model.get_issues()
+    _index = {'issues': FilterIndex(_model.get_issues()), 'epics': FilterIndex(_model.get_epics())}
+
+
+def _draw(task):
+    conf, variant = task
+    command, groupby, jira_filter = variant
+    filters = list(conf['jira_filter'] or [])
+    if jira_filter is not None:
+        filters.append(jira_filter)
+    report_conf = ConfigOverride(conf, command=[command], groupby=groupby, jira_filter=filters or None)
+
+    model = None
+    keys = None
+    if jira_filter is not None:
+        try:
+            query = parse_filters([jira_filter], versions=_model.get_version_index)
+        except UnsupportedQuery as e:
+            print(f"Letting Jira evaluate '{jira_filter}': {e}")
+            model = create_model(report_conf)
+        else:
+            keys = {kind: index.select(query) for kind, index in _index.items()}
+    if model is None:
+        model = ModelView(_model, report_conf, keys)
+
+    class_name, method = REPORTS[command]
+    report = getattr(import_module(f"jiradash.{command}"), class_name)(report_conf, model=model)
+    getattr(report, method)()
+    return variant
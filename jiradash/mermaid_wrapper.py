@@ -2,9 +2,13 @@
 Utility to execute mermaid-cli.
 """
 
-from .io import Writer, mkdir_p
+from .io import Writer
+from .metrics import REGISTRY
+import hashlib
+import html
 import os
 import subprocess
+import time
 
 
 class Mermaid(Writer):
@@ -12,6 +16,27 @@ class Mermaid(Writer):
         markup_file = self.write_file(markup, extension="mermaid")
 
         svg_file = os.path.splitext(markup_file)[0] + ".svg"
+        source = hashlib.sha256(markup.encode("utf-8")).hexdigest()
+        manifest = self.manifest()
+        if manifest.is_current(svg_file, source):
+            print(f"Unchanged {svg_file}")
+            REGISTRY.inc("jiradash_render_skipped", renderer="mmdc")
+            return
         cmd = ["mmdc", "--input", markup_file, "--output", svg_file]
         print(cmd)
-        subprocess.run(cmd)
+        start = time.monotonic()
+        returncode = subprocess.run(cmd).returncode
+        REGISTRY.observe("jiradash_render_seconds", time.monotonic() - start, renderer="mmdc")
+        if returncode == 0 and os.path.exists(svg_file):
+            manifest.update(svg_file, source=source)
+
+    def mermaid_html(self, markup, title):
+        """
+        Wrap markup in a html page that renders it in the browser with mermaid.js. No mmdc needed.
+        """
+        head = f"<html>\n<head><title>{html.escape(title)}</title>\n"
+        script = """<script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
+"""
+        body = f"<pre class=\"mermaid\">\n{html.escape(markup)}</pre>\n"
+        body += "<script>mermaid.initialize({startOnLoad: true, securityLevel: 'loose'});</script>\n"
+        return head + script + "</head>\n<body>\n" + body + "</body>\n</html>"
@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+"""
+Jira metadata that rarely changes: custom field ids, versions, components, issue link types, the
+category of each status, and the boards and sprints of the Agile API.
+
+Custom fields are looked up by name via the /field endpoint, so JiraDash works on Jira instances
+where for example "Story Points" has a different customfield id than ours. Versions and components
+are fetched for all projects in parallel. Everything is cached on disk for --metadata-ttl seconds,
+so most runs don't spend any round trips on metadata.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import time
+from jiradash.cache import Cache
+from jiradash.jira_client import CUSTOM_FIELD
+from jiradash.metrics import REGISTRY
+from jiradash.sprints import sprint_info
+
+# Logical name -> Names the field can have in Jira. First match wins.
+FIELD_NAMES = {
+    "Epic": ["Epic Link"],
+    "Epic Name": ["Epic Name"],
+    "Story Points": ["Story Points", "Story point estimate"],
+    "Sprint": ["Sprint"],
+}
+
+METADATA_FILE = "metadata.json"
+
+
+class Metadata:
+    def __init__(self, my_config, jira_client):
+        self.conf = my_config
+        self.jira_client = jira_client
+        self.cache = None if my_config['no_cache'] else Cache(my_config)
+        self._data = None
+
+    def _get(self):
+        if self._data is not None:
+            return self._data
+
+        projects = sorted(self.conf['jira_project'] or [])
+        cached = self.cache.load_json(METADATA_FILE) if self.cache else None
+        fresh = cached and (time.time() - cached['fetched_at'] < self.conf['metadata_ttl'] or self.conf['offline'])
+        if fresh and set(projects) <= set(cached['versions']) and 'sprints' in cached and 'statuses' in cached:
+            REGISTRY.inc("jiradash_cache_lookups", kind="metadata", result="json")
+            self._data = cached
+            return self._data
+        REGISTRY.inc("jiradash_cache_lookups", kind="metadata", result="miss")
+
+        if self.conf['offline']:
+            if not cached:
+                print("No cached Jira metadata and --offline was given. Using default custom field ids.")
+            self._data = cached or {'fields': dict(CUSTOM_FIELD), 'versions': {}, 'components': {}, 'link_types': [],
+                                    'sprints': {}, 'statuses': {}}
+            return self._data
+
+        self._data = self.fetch(projects)
+        if fresh:
+            # Keep other projects that share this cache, for example other --federate members
+            for name in ('versions', 'components', 'sprints'):
+                self._data[name] = {**cached.get(name, {}), **self._data[name]}
+            self._data['fetched_at'] = min(cached['fetched_at'], self._data['fetched_at'])
+        if self.cache:
+            self.cache.save_json(METADATA_FILE, self._data)
+        return self._data
+
+    def fetch(self, projects):
+        """
+        Query all metadata from Jira. Requests run in parallel, --jobs at a time.
+        """
+        jira = self.jira_client.connection()
+        print(f"Fetching Jira metadata for {projects}")
+        with ThreadPoolExecutor(max_workers=self.conf['jobs']) as pool:
+            all_fields = pool.submit(jira.get_all_fields)
+            link_types = pool.submit(jira.get_issue_link_types)
+            statuses = pool.submit(jira.get_all_statuses)
+            versions = {p: pool.submit(jira.get_project_versions, p) for p in projects}
+            components = {p: pool.submit(jira.get_project_components, p) for p in projects}
+            boards = {p: pool.submit(_boards, jira, p) for p in projects}
+            board_ids = sorted({board for f in boards.values() for board in f.result()})
+            sprints = [pool.submit(_sprints, jira, board) for board in board_ids]
+
+            return {
+                'fetched_at': time.time(),
+                'fields': _custom_field_ids(all_fields.result()),
+                'link_types': [link_type['name'] for link_type in link_types.result()],
+                'statuses': {status['name']: status['statusCategory']['name'] for status in statuses.result()},
+                'versions': {p: [_version(v) for v in f.result()] for p, f in versions.items()},
+                'components': {p: [c['name'] for c in f.result()] for p, f in components.items()},
+                'sprints': {sprint_id: info for f in sprints for sprint_id, info in f.result().items()},
+            }
+
+    def fields(self):
+        """
+        :return: dict of logical field name (see FIELD_NAMES) -> field id, like CUSTOM_FIELD.
+        """
+        return self._get()['fields']
+
+    def versions(self, project=None):
+        """
+        :return: list of {'name', 'releaseDate', 'released'} dicts, for one or all projects, in
+                 the order Jira returns them.
+        """
+        versions = self._get()['versions']
+        projects = [project] if project else self.conf['jira_project']
+        return [v for p in projects for v in versions.get(p, [])]
+
+    def components(self, project=None):
+        components = self._get()['components']
+        projects = [project] if project else self.conf['jira_project']
+        return [c for p in projects for c in components.get(p, [])]
+
+    def link_types(self):
+        return self._get()['link_types']
+
+    def sprints(self):
+        """
+        :return: dict of sprint id -> {'name', 'state', 'board', 'start', 'end', 'complete'}, for
+                 the sprints of all scrum boards of the projects. Dates are ISO strings.
+        """
+        return self._get().get('sprints', {})
+
+    def status_categories(self):
+        """
+        :return: dict of status name -> name of its status category, like "To Do", for all
+                 statuses of the Jira server.
+        """
+        return self._get().get('statuses', {})
+
+
+def _custom_field_ids(all_fields):
+    by_name = {}
+    for field in all_fields:
+        by_name.setdefault(field['name'], field['id'])
+
+    ids = dict(CUSTOM_FIELD)
+    for name, candidates in FIELD_NAMES.items():
+        for candidate in candidates:
+            if candidate in by_name:
+                ids[name] = by_name[candidate]
+                break
+    return ids
+
+
+def _pages(call, *args):
+    """
+    All values of a paginated Agile API call.
+    """
+    start = 0
+    while True:
+        page = call(*args, start=start, limit=50) or {}
+        values = page.get('values', [])
+        yield from values
+        start += len(values)
+        if page.get('isLast', True) or not values:
+            return
+
+
+def _boards(jira, project):
+    """
+    :return: ids of the scrum boards of project, none if the Agile API isn't available.
+    """
+    from requests import HTTPError
+
+    try:
+        return [board['id'] for board in _pages(jira.get_all_agile_boards, None, project, "scrum")]
+    except HTTPError as e:
+        print(f"Not using sprints of {project}, no access to its boards: {e}")
+        return []
+
+
+def _sprints(jira, board):
+    from requests import HTTPError
+
+    try:
+        return {str(sprint['id']): sprint_info(sprint, board) for sprint in _pages(jira.get_all_sprints_from_board, board)}
+    except HTTPError as e:
+        print(f"Not using sprints of board {board}: {e}")
+        return {}
+
+
+def _version(version):
+    return {
+        'name': version['name'],
+        'releaseDate': version.get('releaseDate'),
+        'released': version.get('released', False),
+    }
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+"""
+Counters, gauges and histograms about what JiraDash did, in Prometheus / OpenMetrics text format.
+
+With --metrics-file they are written when a command finishes, for the node_exporter textfile
+collector. serve also has them at /metrics, and rewrites --metrics-file after every refresh.
+
+Metrics are process wide, in REGISTRY:
+
+    from jiradash.metrics import REGISTRY
+    REGISTRY.inc("jiradash_cache_lookups", kind="issues", result="snapshot")
+
+"""
+import bisect
+import threading
+from jiradash.io import atomic_write
+
+# name -> (type, help). Counter names are without the _total suffix.
+METRICS = {
+    "jiradash_issues_loaded": ("gauge", "Issues (or epics) in the loaded model, per project"),
+    "jiradash_dead_links_pruned": ("counter", "Dependency links dropped because they point outside the loaded issues"),
+    "jiradash_cache_lookups": ("counter", "Loads of issues, epics or metadata, by where they came from: snapshot, json, fresh or miss"),
+    "jiradash_jira_requests": ("counter", "Jira API calls, per endpoint and outcome: ok, error, throttled or retry"),
+    "jiradash_jira_request_seconds": ("histogram", "Duration of Jira API calls, per endpoint, including retries"),
+    "jiradash_jira_retries": ("counter", "Jira API calls that were retried, after 429, 5xx or a connection error"),
+    "jiradash_jira_throttled": ("counter", "Jira API calls that got 429 Too Many Requests"),
+    "jiradash_render_seconds": ("histogram", "Duration of mermaid-cli (mmdc) runs"),
+    "jiradash_render_skipped": ("counter", "mmdc runs skipped, because the SVG was up to date"),
+}
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> {labels tuple: value}. For histograms value is [bucket counts..., count, sum].
+        self.values = {name: {} for name in METRICS}
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values[name]
+            if key not in series:
+                series[key] = [0] * len(BUCKETS) + [0, 0.0]
+            h = series[key]
+            bucket = bisect.bisect_left(BUCKETS, seconds)
+            if bucket < len(BUCKETS):
+                h[bucket] += 1
+            h[-2] += 1
+            h[-1] += seconds
+
+    def render(self, openmetrics=True):
+        """
+        :param bool openmetrics: OpenMetrics 1.0, or else the Prometheus text format 0.0.4 that
+                                 node_exporter's textfile collector reads.
+        """
+        lines = []
+        with self.lock:
+            for name, (metric_type, help_text) in METRICS.items():
+                series = self.values[name]
+                family = name if openmetrics or metric_type != "counter" else f"{name}_total"
+                lines.append(f"# TYPE {family} {metric_type}")
+                lines.append(f"# HELP {family} {help_text}")
+                for key, value in sorted(series.items()):
+                    if metric_type == "counter":
+                        lines.append(f"{name}_total{_labels(key)} {_number(value)}")
+                    elif metric_type == "gauge":
+                        lines.append(f"{name}{_labels(key)} {_number(value)}")
+                    else:
+                        cumulative = 0
+                        for le, n in zip(BUCKETS, value):
+                            cumulative += n
+                            lines.append(f"{name}_bucket{_labels(key + (('le', str(le)),))} {cumulative}")
+                        lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {value[-2]}")
+                        lines.append(f"{name}_count{_labels(key)} {value[-2]}")
+                        lines.append(f"{name}_sum{_labels(key)} {_number(value[-1])}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, file_name):
+        print(f"Writing metrics to {file_name}")
+        atomic_write(file_name, self.render(openmetrics=False).encode("utf-8"))
+
+
+def _labels(key):
+    if not key:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f"{name}=\"{escape(value)}\"" for name, value in key) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
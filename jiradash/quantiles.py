@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+"""
+Streaming quantiles with a merging t-digest.
+
+A TDigest summarizes any number of values in at most a few hundred centroids, so percentiles of
+hundreds of thousands of issues are computed in one pass with bounded memory. Quantiles near 0 and
+1 are the most accurate, the median is within a fraction of a percent. Digests of different
+projects or different days can be merged, and saved as json with to_dict() to merge later.
+
+    digest = TDigest()
+    for days in lead_times:
+        digest.add(days)
+    digest.merge(TDigest.from_dict(saved))
+    digest.quantile(0.85)
+
+See Dunning & Ertl, "Computing extremely accurate quantiles using t-digests".
+
+"""
+import math
+
+# Relative size of the buffer of values that aren't merged into centroids yet
+BUFFER_FACTOR = 5
+
+
+class TDigest:
+    def __init__(self, compression=100):
+        """
+        :param int compression: Roughly the maximum number of centroids. Higher is more accurate.
+        """
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self._buffer = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, weight=1):
+        self._buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= BUFFER_FACTOR * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        """
+        Add all values of another digest to this one.
+        """
+        if not other.count:
+            return self
+        other._compress()
+        self._buffer += zip(other.means, other.weights)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q):
+        # k1 scale function: small centroids at the tails, large ones around the median
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        centroids = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in centroids)
+
+        means, weights = [], []
+        mean, weight = centroids[0]
+        done = 0
+        limit = total * self._q(self._k(0) + 1)
+        for m, w in centroids[1:]:
+            if done + weight + w <= limit:
+                mean += (m - mean) * w / (weight + w)
+                weight += w
+            else:
+                means.append(mean)
+                weights.append(weight)
+                done += weight
+                limit = total * self._q(min(self._k(done / total) + 1, self.compression / 4))
+                mean, weight = m, w
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q):
+        """
+        :param float q: 0 to 1
+        :return: Estimated value at quantile q, or None if no values were added.
+        """
+        if not self.count:
+            return None
+        self._compress()
+        means, weights = self.means, self.weights
+        if len(means) == 1:
+            return means[0]
+
+        index = q * self.count
+        # Between the minimum and the center of the first centroid
+        if index < weights[0] / 2:
+            return self.min + (means[0] - self.min) * index / (weights[0] / 2)
+        center = weights[0] / 2
+        for i in range(len(means) - 1):
+            step = (weights[i] + weights[i + 1]) / 2
+            if center + step > index:
+                return means[i] + (means[i + 1] - means[i]) * (index - center) / step
+            center += step
+        # Between the center of the last centroid and the maximum
+        rest = weights[-1] / 2
+        return means[-1] + (self.max - means[-1]) * min((index - center) / rest, 1)
+
+    def to_dict(self):
+        self._compress()
+        return {
+            'compression': self.compression,
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'centroids': [[m, w] for m, w in zip(self.means, self.weights)],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls(data['compression'])
+        if data['count']:
+            digest.means = [m for m, _ in data['centroids']]
+            digest.weights = [w for _, w in data['centroids']]
+            digest.count = data['count']
+            digest.min = data['min']
+            digest.max = data['max']
+        return digest
@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+"""
+Transitive "Depends on" reachability, over epics and issues together.
+
+The dependency graph is condensed into its strongly connected components (Tarjan's algorithm), so
+that dependency cycles become single nodes of a DAG. The transitive closure of that DAG is then
+computed in one pass each way, as bitsets: Python ints with a bit per component. Components are
+numbered in the order Tarjan finishes them, dependencies before their dependents, so the closure
+of a component only has bits below its own number and the ints stay as small as they can be.
+
+After that, "what does X transitively wait on", "what is transitively blocked by X" and "does X
+wait on Y" are a lookup and a bit test, and decoding the result. Keys without any links are not
+in the index at all.
+
+"""
+
+
+class Reachability:
+    def __init__(self, objs):
+        """
+        :param dict objs: key -> normalized issue or epic. Links to keys that aren't in objs are
+                          ignored.
+        """
+        self.objs = objs
+        edges = {}
+        for key, obj in objs.items():
+            deps = [dep for dep in obj['all_deps'] if dep in objs]
+            if deps:
+                edges[key] = deps
+                for dep in deps:
+                    edges.setdefault(dep, [])
+
+        # key -> component number, component number -> keys
+        self.component = {}
+        self.members = []
+        self._strongly_connected(edges)
+        n = len(self.members)
+
+        successors = [set() for _ in range(n)]
+        for key, deps in edges.items():
+            c = self.component[key]
+            successors[c].update(self.component[dep] for dep in deps)
+        # Components that reach themselves: cycles, and links of an issue to itself
+        self.cyclic = {c for c in range(n) if c in successors[c]}
+
+        # Components each component waits on. Successors have lower numbers, so they are done first.
+        self._waits_on = [0] * n
+        for c in range(n):
+            bits = 0
+            for d in successors[c]:
+                if d != c:
+                    bits |= self._waits_on[d] | (1 << d)
+            self._waits_on[c] = bits | (1 << c if c in self.cyclic else 0)
+
+        # Components each component blocks, numbered backwards (bit n - 1 - c for component c),
+        # so that these ints stay small too.
+        predecessors = [[] for _ in range(n)]
+        for c in range(n):
+            for d in successors[c]:
+                if d != c:
+                    predecessors[d].append(c)
+        self._blocks = [0] * n
+        for c in reversed(range(n)):
+            bits = 0
+            for p in predecessors[c]:
+                bits |= self._blocks[p] | (1 << (n - 1 - p))
+            self._blocks[c] = bits | (1 << (n - 1 - c) if c in self.cyclic else 0)
+
+    def _strongly_connected(self, edges):
+        """
+        Tarjan's algorithm, iterative because dependency chains can be longer than the recursion
+        limit. Fills self.component and self.members.
+        """
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        for root in sorted(edges):
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(edges[root]))]
+            while work:
+                key, deps = work[-1]
+                for dep in deps:
+                    if dep not in index:
+                        index[dep] = low[dep] = len(index)
+                        stack.append(dep)
+                        on_stack.add(dep)
+                        work.append((dep, iter(edges[dep])))
+                        break
+                    if dep in on_stack:
+                        low[key] = min(low[key], index[dep])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[key])
+                    if low[key] == index[key]:
+                        members = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            self.component[member] = len(self.members)
+                            members.append(member)
+                            if member == key:
+                                break
+                        self.members.append(sorted(members))
+
+    def _keys(self, bits, backwards=False):
+        n = len(self.members)
+        keys = []
+        # Scanning the binary string is much faster than shifting a big int bit by bit
+        digits = bin(bits)[:1:-1]
+        bit = digits.find("1")
+        while bit >= 0:
+            keys += self.members[n - 1 - bit if backwards else bit]
+            bit = digits.find("1", bit + 1)
+        return keys
+
+    def waits_on(self, key):
+        """
+        :return: list of the keys that key transitively depends on. Includes key itself only if it
+                 is part of a dependency cycle.
+        """
+        c = self.component.get(key)
+        return [] if c is None else self._keys(self._waits_on[c])
+
+    def blocks(self, key):
+        """
+        :return: list of the keys that transitively depend on key.
+        """
+        c = self.component.get(key)
+        return [] if c is None else self._keys(self._blocks[c], backwards=True)
+
+    def depends(self, key, other):
+        """
+        :return: True if key transitively depends on other.
+        """
+        c, d = self.component.get(key), self.component.get(other)
+        if c is None or d is None:
+            return False
+        return bool(self._waits_on[c] >> d & 1)
+
+    def in_cycle(self, key):
+        return self.component.get(key) in self.cyclic
+
+    def blocked(self):
+        """
+        :return: dict of key -> number of unfinished keys it transitively waits on, for every key
+                 that isn't Done and waits on something that isn't Done either.
+        """
+        return self._unfinished(self._waits_on)
+
+    def blocking(self):
+        """
+        :return: dict of key -> number of unfinished keys that transitively wait on it, for every
+                 key that isn't Done and blocks something that isn't Done either.
+        """
+        return self._unfinished(self._blocks, backwards=True)
+
+    def _unfinished(self, closures, backwards=False):
+        open_counts = [sum(1 for key in members if self.objs[key]['statusCategory'] != "Done") for members in self.members]
+        bits = open_counts if backwards else list(reversed(open_counts))
+        unfinished = int("0" + "".join("1" if n else "0" for n in bits), 2)
+        # Components with more than one unfinished key, where a bit stands for several keys
+        n = len(self.members)
+        extra = {(n - 1 - c if backwards else c): count - 1 for c, count in enumerate(open_counts) if count > 1}
+        found = {}
+        for c, members in enumerate(self.members):
+            reached = closures[c] & unfinished
+            if not reached:
+                continue
+            count = bin(reached).count("1") + sum(e for bit, e in extra.items() if reached >> bit & 1)
+            # Within a cycle, a key reaches itself
+            count -= 1 if c in self.cyclic else 0
+            for key in members:
+                if self.objs[key]['statusCategory'] != "Done" and count > 0:
+                    found[key] = count
+        return found
@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+"""
+Apply Jira webhook payloads saved by `serve --webhook-dir` to the cached model.
+
+This is the same code path serve uses for webhooks it receives, so recorded payloads can be
+replayed locally, for example together with --offline:
+
+    ./JiraDash.py replay --offline --webhook-dir recorded/
+    ./JiraDash.py grid --offline
+
+"""
+import glob
+import json
+import os
+from jiradash.jira_model import create_model
+
+def entry_point(my_config):
+    print(f"Replaying webhook payloads from {my_config['webhook_dir']} on project(s): {my_config['jira_project']}")
+    replay = Replay(my_config)
+    replay.run()
+
+class Replay:
+    def __init__(self, my_config, model=None):
+        self.conf = my_config
+        self.model = model if model else create_model(my_config)
+
+    def run(self):
+        assert self.conf['webhook_dir'], "replay needs --webhook-dir"
+        self.model.get_epics()
+        self.model.get_issues()
+
+        changed = 0
+        paths = sorted(glob.glob(os.path.join(self.conf['webhook_dir'], "*.json")))
+        for path in paths:
+            with open(path) as f:
+                payload = json.load(f)
+            try:
+                applied = self.model.apply_webhook(payload)
+            except ValueError as e:
+                print(f"{os.path.basename(path)}: skipped, {e}")
+                continue
+            if applied:
+                changed += 1
+                print(f"{os.path.basename(path)}: {payload['webhookEvent']} {payload['issue']['key']}")
+
+        print(f"{changed} of {len(paths)} payloads changed the model")
+        self.model.save_cache()
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Per epic totals over the epic's child issues.
+
+Computed in one pass over all issues, then kept up to date as a JiraModel listener, so grid and
+gantt can use them on every render without walking the issues again.
+"""
+from collections import Counter
+
+
+class EpicRollups:
+    """
+    For each epic key: child issues per statusCategory, total and remaining story points, earliest
+    start date, latest resolution date and the assignees of the children. Issues without an epic
+    are under "No Epic".
+    """
+    def __init__(self):
+        # epic key -> {issue key: issue}
+        self.members = {}
+        # epic key -> rollup dict, see get()
+        self._rollups = {}
+        # Epics whose dates must be recomputed, because an issue that was removed may have had them
+        self._stale_dates = set()
+
+    def rebuild(self, issues):
+        self.members = {}
+        self._rollups = {}
+        self._stale_dates = set()
+        for key, obj in issues.items():
+            self.add(key, obj)
+
+    def _rollup(self, epic):
+        if epic not in self._rollups:
+            self._rollups[epic] = {
+                'count': 0,
+                'counts': Counter(),
+                'points': 0.0,
+                'remaining_points': 0.0,
+                'start_date': None,
+                'resolution_date': None,
+                'assignees': Counter(),
+            }
+        return self._rollups[epic]
+
+    def add(self, key, obj):
+        epic = obj['epic']
+        self.members.setdefault(epic, {})[key] = obj
+        rollup = self._rollup(epic)
+        rollup['count'] += 1
+        rollup['counts'][obj['statusCategory']] += 1
+        rollup['points'] += obj['points']
+        if obj['statusCategory'] != "Done":
+            rollup['remaining_points'] += obj['points']
+        if obj['assignee']:
+            rollup['assignees'][obj['assignee']] += 1
+        if obj['start_date'] and (rollup['start_date'] is None or obj['start_date'] < rollup['start_date']):
+            rollup['start_date'] = obj['start_date']
+        if obj['resolution_date'] and (rollup['resolution_date'] is None or obj['resolution_date'] > rollup['resolution_date']):
+            rollup['resolution_date'] = obj['resolution_date']
+
+    def remove(self, key, obj):
+        epic = obj['epic']
+        if self.members.get(epic, {}).pop(key, None) is None:
+            return
+        rollup = self._rollups[epic]
+        rollup['count'] -= 1
+        rollup['counts'][obj['statusCategory']] -= 1
+        rollup['points'] -= obj['points']
+        if obj['statusCategory'] != "Done":
+            rollup['remaining_points'] -= obj['points']
+        if obj['assignee']:
+            rollup['assignees'][obj['assignee']] -= 1
+        # Min and max can't be subtracted
+        self._stale_dates.add(epic)
+        if not self.members[epic]:
+            del self.members[epic]
+            del self._rollups[epic]
+            self._stale_dates.discard(epic)
+
+    def update(self, kind, key, old, new):
+        if kind != 'issues':
+            return
+        if old is not None:
+            self.remove(key, old)
+        if new is not None:
+            self.add(key, new)
+
+    def get(self, epic):
+        """
+        :return: dict with 'count', 'counts' (statusCategory -> n), 'points', 'remaining_points',
+                 'start_date', 'resolution_date', 'assignees' (set), or None if epic has no issues.
+        """
+        if epic not in self._rollups:
+            return None
+        rollup = self._rollups[epic]
+        if epic in self._stale_dates:
+            children = self.members[epic].values()
+            rollup['start_date'] = min([i['start_date'] for i in children if i['start_date']], default=None)
+            rollup['resolution_date'] = max([i['resolution_date'] for i in children if i['resolution_date']], default=None)
+            self._stale_dates.discard(epic)
+        result = dict(rollup)
+        result['counts'] = {status: n for status, n in rollup['counts'].items() if n}
+        result['assignees'] = {name for name, n in rollup['assignees'].items() if n}
+        return result
+
+    def progress(self, epic):
+        """
+        :return: Share of the epic that is done, 0.0 - 1.0, by story points if the children are
+                 estimated, otherwise by number of issues. None if the epic has no issues.
+        """
+        rollup = self._rollups.get(epic)
+        if not rollup or not rollup['count']:
+            return None
+        if rollup['points']:
+            return 1.0 - rollup['remaining_points'] / rollup['points']
+        return rollup['counts']["Done"] / rollup['count']
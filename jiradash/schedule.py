@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+"""
+Schedule epics along their "Depends on" links, instead of leaving it to the mermaid layout.
+
+critical_path() is the classic critical path method: one pass over the epics in topological order
+(Kahn's algorithm) gives the earliest start of each epic, one pass backwards gives the latest start
+that doesn't delay the last epic. The difference is the slack, epics without slack are the
+critical path. Epics that are part of, or depend on, a dependency cycle can't be ordered. They are
+flagged and scheduled as if the links closing the cycle didn't exist.
+
+Times are in days relative to today. Done epics are placed where they actually were, In Progress
+epics start on the day they were started and end today at the earliest.
+
+resource_schedule() additionally limits how many epics each component (or assignee) can work on
+at the same time, so the end dates account for the team not being infinitely parallel.
+
+"""
+from collections import deque
+import datetime
+import heapq
+
+# Estimated calendar days per story point
+DAYS_PER_POINT = 30
+
+
+def duration(obj, remaining=None):
+    """
+    :param remaining: Story points left to do, if known better than the epic's own estimate.
+    :return: Estimated duration in days. Done epics have their actual duration.
+    """
+    if obj['statusCategory'] == "Done" and obj['start_date'] and obj['resolution_date']:
+        return (obj['resolution_date'].date() - obj['start_date'].date()).days
+    points = obj['points'] if remaining is None else remaining
+    return int(points * DAYS_PER_POINT)
+
+
+def topological_order(objs):
+    """
+    Kahn's algorithm over obj['deps'].
+
+    :return: tuple (keys in dependency order, set of keys that couldn't be ordered because of cycles)
+    """
+    indegree = {key: 0 for key in objs}
+    dependents = {key: [] for key in objs}
+    for key, obj in objs.items():
+        for dep in obj['deps']:
+            indegree[key] += 1
+            dependents[dep].append(key)
+
+    ready = deque(sorted(key for key, n in indegree.items() if n == 0))
+    order = []
+    while ready:
+        key = ready.popleft()
+        order.append(key)
+        for dependent in dependents[key]:
+            indegree[dependent] -= 1
+            if indegree[dependent] == 0:
+                ready.append(dependent)
+
+    cyclic = {key for key, n in indegree.items() if n > 0}
+    # Schedule them anyway, in key order, so every epic ends up in the chart
+    order += sorted(cyclic)
+    return order, cyclic
+
+
+def critical_path(objs, today=None, remaining=None):
+    """
+    :param dict objs: key -> normalized epic (or issue), deps already pruned to keys in objs.
+    :param datetime.date today: Day 0 of the schedule. Default is today.
+    :param dict remaining: key -> story points left, for example from the epic's child issues.
+                           In Progress epics then end when the remaining work is done.
+    :return: dict key -> {'start', 'end' (datetime.date), 'earliest_start', 'latest_start',
+             'slack', 'duration' (days), 'critical', 'cycle' (bool)}
+    """
+    today = today if today else datetime.date.today()
+    remaining = remaining if remaining else {}
+    order, cyclic = topological_order(objs)
+
+    schedule = {}
+    for key in order:
+        obj = objs[key]
+        days = duration(obj, remaining.get(key))
+        deps_end = max([schedule[dep]['end_day'] for dep in obj['deps'] if dep in schedule], default=0)
+        if obj['statusCategory'] == "Done" and obj['resolution_date']:
+            end = (obj['resolution_date'].date() - today).days
+            start = end - days
+        elif obj['statusCategory'] == "In Progress" and obj['start_date']:
+            start = (obj['start_date'].date() - today).days
+            if key in remaining:
+                end = days
+            else:
+                # Not done, so it ends today at the earliest
+                end = max(start + days, 0)
+            days = end - start
+        else:
+            start = deps_end
+            end = start + days
+        schedule[key] = {'start_day': start, 'end_day': end, 'duration': days, 'cycle': key in cyclic}
+
+    # Backwards: latest finish is the earliest latest start of anything depending on this
+    project_end = max([s['end_day'] for s in schedule.values()], default=0)
+    latest_end = {key: project_end for key in objs}
+    for key in reversed(order):
+        s = schedule[key]
+        s['latest_start_day'] = latest_end[key] - s['duration']
+        for dep in objs[key]['deps']:
+            if dep in latest_end and not (key in cyclic and dep in cyclic):
+                latest_end[dep] = min(latest_end[dep], s['latest_start_day'])
+
+    for key, s in schedule.items():
+        done = objs[key]['statusCategory'] == "Done"
+        s['slack'] = 0 if done else max(s['latest_start_day'] - s['start_day'], 0)
+        s['critical'] = s['slack'] == 0 and not done
+        s['earliest_start'] = s['start'] = today + datetime.timedelta(days=s.pop('start_day'))
+        s['end'] = today + datetime.timedelta(days=s.pop('end_day'))
+        s['latest_start'] = today + datetime.timedelta(days=s.pop('latest_start_day'))
+    return schedule
+
+
+def resource(obj, resources_by):
+    """
+    :return: Name of the team or person that works on obj.
+    """
+    if resources_by == "assignee":
+        return obj['assignee'] if obj['assignee'] else "Unassigned"
+    return obj[resources_by]
+
+
+def historical_capacity(issues, resources_by, today=None, days=90):
+    """
+    Estimate how many epics each resource can work on in parallel. For components this is the
+    number of people that resolved issues of that component in the last `days` days. A person
+    works on one epic at a time.
+
+    :param dict issues: key -> normalized issue
+    :return: dict resource name -> capacity
+    """
+    if resources_by == "assignee":
+        return {}
+    today = today if today else datetime.date.today()
+    since = today - datetime.timedelta(days=days)
+    people = {}
+    for issue in issues.values():
+        if issue['resolution_date'] and issue['assignee'] and issue['resolution_date'].date() >= since:
+            people.setdefault(resource(issue, resources_by), set()).add(issue['assignee'])
+    return {name: len(assignees) for name, assignees in people.items()}
+
+
+def resource_schedule(objs, resources_by, capacity=None, today=None, remaining=None):
+    """
+    List scheduling with limited capacity. Epics are started in order of their latest start in the
+    critical path schedule, as soon as their dependencies are done and their resource has a free
+    slot. Done and In Progress epics keep their critical path placement, the latter keep a slot
+    busy until they end.
+
+    Runs in O((V+E) log V): one heap of ready epics, one heap of slot free times per resource.
+
+    :param str resources_by: "components" or "assignee"
+    :param dict capacity: resource name -> parallel epics. Default 1.
+    :param dict remaining: See critical_path()
+    :return: dict like critical_path(), where start and end are the resource constrained ones,
+             and 'resource' names the resource and slot that works on the epic.
+    """
+    capacity = capacity if capacity else {}
+    today = today if today else datetime.date.today()
+    schedule = critical_path(objs, today, remaining)
+    order, cyclic = topological_order(objs)
+    position = {key: i for i, key in enumerate(order)}
+    # Links closing a cycle are ignored, like in critical_path()
+    deps = {key: [dep for dep in objs[key]['deps'] if position[dep] < position[key]] for key in order}
+
+    dependents = {key: [] for key in objs}
+    waiting = {}
+    for key in order:
+        waiting[key] = len(deps[key])
+        for dep in deps[key]:
+            dependents[dep].append(key)
+
+    # resource -> heap of (day the slot is free, slot number)
+    slots = {}
+    def free_slots(name):
+        if name not in slots:
+            slots[name] = [(0, i + 1) for i in range(max(capacity.get(name, 1), 1))]
+        return slots[name]
+
+    end_day = {}
+    ready = []
+    for key in order:
+        obj = objs[key]
+        s = schedule[key]
+        name = resource(obj, resources_by)
+        s['resource'] = name
+        if obj['statusCategory'] == "Done" or (obj['statusCategory'] == "In Progress" and obj['start_date']):
+            end_day[key] = (s['end'] - today).days
+            if obj['statusCategory'] == "In Progress":
+                slot = heapq.heappop(free_slots(name))
+                heapq.heappush(free_slots(name), (max(slot[0], end_day[key]), slot[1]))
+                s['resource'] = f"{name} #{slot[1]}"
+        if waiting[key] == 0:
+            heapq.heappush(ready, ((s['latest_start'] - today).days, key))
+
+    while ready:
+        priority, key = heapq.heappop(ready)
+        s = schedule[key]
+        if key not in end_day:
+            name = s['resource']
+            free_day, slot = heapq.heappop(free_slots(name))
+            start = max([end_day[dep] for dep in deps[key]] + [free_day, 0])
+            end_day[key] = start + s['duration']
+            heapq.heappush(free_slots(name), (end_day[key], slot))
+            s['start'] = today + datetime.timedelta(days=start)
+            s['end'] = today + datetime.timedelta(days=end_day[key])
+            s['resource'] = f"{name} #{slot}"
+        for dependent in dependents[key]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                heapq.heappush(ready, ((schedule[dependent]['latest_start'] - today).days, dependent))
+    return schedule
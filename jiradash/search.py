@@ -0,0 +1,318 @@
+#!/usr/bin/python3
+"""
+Full-text search over the issues and epics of the model, without asking Jira.
+
+    ./JiraDash.py search --offline --search 'login timeout component:Core status:"In Progress"'
+
+Words are looked up in the key, summary, epic name, components, fix versions and assignee of each
+issue, and results are ranked with BM25, matches in the key, components, fix versions and assignee
+weighing more than matches in the summary. A word ending in * matches every word starting with it.
+field:value terms only filter, see FILTERS.
+
+The inverted index is saved in the cache next to the issues, and is only valid for the state of
+the cache it was built from. It is registered as a JiraModel listener before the issues are
+loaded, so the issues that were synced from Jira since it was saved are applied to it instead of
+rebuilding it. serve keeps it up to date the same way, and answers /search?q=...
+
+"""
+import bisect
+import html
+import math
+import re
+from jiradash.io import Writer
+from jiradash.jira_model import create_model
+
+# Field -> weight of a word found in it
+FIELDS = {"key": 3.0, "summary": 1.0, "epic_name": 1.0, "all_components": 2.0, "all_fixVersions": 2.0, "assignee": 2.0}
+# Name in a query -> field. Values match whole, like "in progress", or any word of them, like "alice".
+FILTERS = {
+    "key": "key",
+    "project": "project",
+    "component": "all_components",
+    "fixversion": "all_fixVersions",
+    "assignee": "assignee",
+    "status": "status",
+    "category": "statusCategory",
+    "type": "issuetype",
+    "epic": "epic",
+}
+KINDS = ('issues', 'epics')
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Bumped when the saved format changes
+FORMAT = 1
+
+WORD = re.compile(r"\w+(?:[.\-]\w+)*")
+QUERY = re.compile(r'(\w+):"([^"]*)"|(\w+):(\S+)|"([^"]*)"|(\S+)')
+
+
+def entry_point(my_config):
+    print(f"Searching issues of project(s): {my_config['jira_project']}")
+    search = Search(my_config)
+    search.get_and_draw()
+
+
+def words(value):
+    """
+    :return: list of the casefolded words in value. Words like "WID-12" or "2.0" are kept whole,
+             and their parts are added too.
+    """
+    found = []
+    for word in WORD.findall((value or "").casefold()):
+        found.append(word)
+        parts = re.split(r"[.\-]", word)
+        if len(parts) > 1:
+            found += parts
+    return found
+
+
+def _values(obj, field):
+    value = obj.get(field)
+    return [v for v in value if v] if isinstance(value, list) else ([value] if value else [])
+
+
+class SearchIndex:
+    def __init__(self):
+        # word -> {key: weighted count}
+        self.postings = {}
+        # field -> casefolded value or word -> set of keys
+        self.filters = {field: {} for field in set(FILTERS.values())}
+        # key -> weighted number of words
+        self.lengths = {}
+        self.total_length = 0.0
+        self._sorted_words = None
+
+    def terms(self, obj):
+        """
+        :return: dict of word -> weighted count of it in obj.
+        """
+        terms = {}
+        for field, weight in FIELDS.items():
+            for value in _values(obj, field):
+                for word in words(value):
+                    terms[word] = terms.get(word, 0.0) + weight
+        return terms
+
+    def filter_values(self, obj, field):
+        values = set()
+        for value in _values(obj, field):
+            values.add(value.casefold())
+            values.update(words(value))
+        return values
+
+    def add(self, key, obj):
+        terms = self.terms(obj)
+        for word, weight in terms.items():
+            if word not in self.postings:
+                self._sorted_words = None
+            self.postings.setdefault(word, {})[key] = weight
+        for field, index in self.filters.items():
+            for value in self.filter_values(obj, field):
+                index.setdefault(value, set()).add(key)
+        self.lengths[key] = sum(terms.values())
+        self.total_length += self.lengths[key]
+
+    def remove(self, key, obj):
+        if key not in self.lengths:
+            return
+        for word in self.terms(obj):
+            posting = self.postings.get(word, {})
+            posting.pop(key, None)
+            if not posting:
+                self.postings.pop(word, None)
+                self._sorted_words = None
+        for field, index in self.filters.items():
+            for value in self.filter_values(obj, field):
+                keys = index.get(value, set())
+                keys.discard(key)
+                if not keys:
+                    index.pop(value, None)
+        self.total_length -= self.lengths.pop(key)
+
+    def rebuild(self, objs):
+        self.__init__()
+        for key, obj in objs.items():
+            self.add(key, obj)
+
+    def update(self, kind, key, old, new):
+        if old is not None:
+            self.remove(key, old)
+        if new is not None:
+            self.add(key, new)
+
+    def _matching_words(self, word):
+        if not word.endswith("*"):
+            return [word] if word in self.postings else []
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self.postings)
+        prefix = word[:-1]
+        start = bisect.bisect_left(self._sorted_words, prefix)
+        end = bisect.bisect_left(self._sorted_words, prefix + "\uffff")
+        return self._sorted_words[start:end]
+
+    def search(self, query):
+        """
+        :param str query: Words and field:value filters.
+        :return: list of (key, score), best first. Without words, every key that passes the
+                 filters, in key order, with score 0.
+        """
+        terms, filters = parse_query(query)
+        keys = None
+        for field, value in filters:
+            found = self.filters[field].get(value, set())
+            keys = set(found) if keys is None else keys & found
+
+        if not terms:
+            return [(key, 0.0) for key in sorted(keys if keys is not None else self.lengths)]
+
+        n = len(self.lengths)
+        average = self.total_length / n if n else 1.0
+        scores = {}
+        for term in terms:
+            for word in self._matching_words(term):
+                posting = self.postings[word]
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for key, tf in posting.items():
+                    if keys is not None and key not in keys:
+                        continue
+                    norm = K1 * (1 - B + B * self.lengths[key] / average)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def to_dict(self):
+        return {
+            'postings': self.postings,
+            'filters': {field: {value: sorted(keys) for value, keys in index.items()}
+                        for field, index in self.filters.items()},
+            'lengths': self.lengths,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.postings = data['postings']
+        index.filters.update({field: {value: set(keys) for value, keys in values.items()}
+                              for field, values in data['filters'].items()})
+        index.lengths = data['lengths']
+        index.total_length = sum(index.lengths.values())
+        return index
+
+
+def parse_query(query):
+    """
+    :return: tuple (list of words, list of (field, casefolded value) filters)
+    """
+    terms = []
+    filters = []
+    for m in QUERY.finditer(query or ""):
+        name, value = (m.group(1), m.group(2)) if m.group(1) else (m.group(3), m.group(4))
+        if name and name.casefold() in FILTERS:
+            filters.append((FILTERS[name.casefold()], value.casefold()))
+            continue
+        text = m.group(5) if m.group(5) is not None else m.group(0)
+        for word in WORD.findall(text.casefold()):
+            # Keep a trailing * for prefix matching
+            terms.append(word + "*" if text.endswith("*") and text.casefold().endswith(word + "*") else word)
+    return terms, filters
+
+
+class Search:
+    def __init__(self, my_config, model=None):
+        self.conf = my_config
+        self.model = model if model else create_model(my_config)
+        self.writer = Writer(my_config)
+        self.project = self.writer.project
+        self.index = None
+        self.synced_at = None
+
+    def cache_name(self):
+        return self.model.cache_file('issues', suffix='search')
+
+    def load_index(self):
+        """
+        Load the saved index, and keep it up to date with the model from now on. It is rebuilt if
+        it wasn't saved from the state of the cache the model was loaded from.
+        """
+        model = self.model
+        # Changes the model already applied before this can't be replayed
+        loaded_before = model.version > 0
+        saved = model.cache.load_json(self.cache_name()) if model.cache and not loaded_before else None
+        if saved and saved.get('format') != FORMAT:
+            saved = None
+        self.index = SearchIndex.from_dict(saved) if saved else SearchIndex()
+        model.listeners.append(self.index.update)
+
+        objs = {**model.get_epics(), **model.get_issues()}
+        cached_synced_at = {kind: model.cached_synced_at.get(kind) for kind in KINDS}
+        if saved and None not in cached_synced_at.values() and saved['synced_at'] == cached_synced_at:
+            print(f"Using search index of {len(self.index.lengths)} issues from {model.cache.dir}")
+            self.synced_at = saved['synced_at']
+        else:
+            print(f"Building search index of {len(objs)} issues")
+            self.index.rebuild(objs)
+        self.save_index()
+        return self.index
+
+    def save_index(self):
+        synced_at = {kind: self.model.synced_at.get(kind) for kind in KINDS}
+        if not self.model.cache or None in synced_at.values() or synced_at == self.synced_at:
+            return
+        data = dict(self.index.to_dict(), format=FORMAT, synced_at=synced_at)
+        self.model.cache.save_json(self.cache_name(), data)
+        self.synced_at = synced_at
+
+    def get_and_draw(self):
+        self.load_index()
+        query = self.conf['search'] or ""
+        results = self.results(query)
+        for key, score, obj in results:
+            print(f"{key}\t{obj['statusCategory']}\t{obj['summary']}\t{obj['url']}")
+        print(f"{len(results)} results for: {query}")
+        self.writer.csv(self.search_csv(results, query))
+        self.writer.html(self.search_html(results, query))
+
+    def results(self, query):
+        """
+        :return: list of (key, score, issue or epic), at most --search-limit.
+        """
+        objs = self.model.get_epics()
+        issues = self.model.get_issues()
+        results = []
+        for key, score in self.index.search(query):
+            obj = objs.get(key) or issues.get(key)
+            if obj is not None:
+                results.append((key, score, obj))
+            if len(results) >= self.conf['search_limit']:
+                break
+        return results
+
+    def search_csv(self, results, query):
+        csv = f"{self.project}\tScore\tStatus\tSummary\tComponents\tFix versions\tAssignee\tURL\n"
+        for key, score, obj in results:
+            csv += (f"{key}\t{score:.2f}\t{obj['status']}\t{obj['summary']}\t{', '.join(obj['all_components'])}\t"
+                    f"{', '.join(obj['all_fixVersions'])}\t{obj['assignee']}\t{obj['url']}\n")
+        return csv
+
+    def search_html(self, results, query):
+        title = html.escape(f"{self.project} search: {query}")
+        rows = ""
+        for key, score, obj in results:
+            css_class = obj['statusCategory'].replace(" ", "")
+            rows += (f"<tr><td><a href=\"{html.escape(obj['url'])}\" class=\"{css_class}\">{html.escape(key)}</a></td>"
+                     f"<td>{html.escape(obj['summary'])}</td><td>{html.escape(obj['status'])}</td>"
+                     f"<td>{html.escape(', '.join(obj['all_components']))}</td>"
+                     f"<td>{html.escape(', '.join(obj['all_fixVersions']))}</td><td>{html.escape(obj['assignee'])}</td></tr>\n")
+        style = """<style type="text/css">
+    body {font-family: sans-serif;}
+    table {border-collapse: collapse;}
+    td, th {padding: 3px 8px; border-top: 1px solid #ddd; text-align: left;}
+    a.ToDo {color: #666;}
+    a.InProgress {color: #090;}
+    a.Done {text-decoration: line-through; color: #333;}
+</style>
+"""
+        form = f"<form action=\"/search\"><input name=\"q\" size=\"60\" value=\"{html.escape(query)}\"></form>\n"
+        return (f"<html>\n<head><title>{title}</title>\n{style}</head>\n<body>\n<h1>{title}</h1>\n{form}"
+                f"<table>\n<tr><th>Key</th><th>Summary</th><th>Status</th><th>Components</th><th>Fix versions</th>"
+                f"<th>Assignee</th></tr>\n{rows}</table>\n<p>{len(results)} results</p>\n</body>\n</html>")
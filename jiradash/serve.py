@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+"""
+Serve the dashboards over http from a JiraModel that stays in memory.
+
+The model is loaded once and then refreshed in the background by querying only issues that were
+updated since the previous refresh. Rendered pages are cached until the model version changes, so
+most page loads don't touch the model at all.
+
+Jira webhooks (issue created, updated, deleted) can be pointed to /webhook. They are applied to the
+model directly, so with webhooks configured the polling interval can be long.
+
+/metrics has the counters of jiradash.metrics, for Prometheus to scrape. /search?q=... searches the
+issues with the index of jiradash.search, which is kept up to date with the model.
+
+    ./JiraDash.py serve --port 8080 --refresh-interval 300
+
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+from jiradash.burnup import Burnup, BurnupCounters
+from jiradash.dependencies import Dependencies
+from jiradash.gantt import Gantt
+from jiradash.grid import Grid
+from jiradash.jira_model import create_model
+from jiradash.metrics import REGISTRY
+from jiradash.search import Search
+
+
+def entry_point(my_config):
+    print(f"Serving dashboards of project(s): {my_config['jira_project']}")
+    server = DashboardServer(my_config)
+    server.serve_forever()
+
+
+class DashboardServer:
+    pages = {
+        "/grid.html": "text/html",
+        "/grid.csv": "text/plain",
+        "/burnup.html": "text/html",
+        "/burnup.csv": "text/plain",
+        "/gantt.html": "text/html",
+        "/gantt.csv": "text/plain",
+        "/gantt.mermaid": "text/plain",
+        "/gantt.svg": "image/svg+xml",
+        "/dependencies.html": "text/html",
+        "/dependencies.mermaid": "text/plain",
+        "/dependencies.svg": "image/svg+xml",
+    }
+
+    def __init__(self, my_config, model=None):
+        self.conf = my_config
+        self.model = model if model else create_model(my_config)
+        self.interval = my_config['refresh_interval']
+
+        # Held while rendering or while applying a refresh to the model
+        self.lock = threading.RLock()
+        # path -> (model version, content)
+        self._cache = {}
+        self.burnup_counters = BurnupCounters()
+        self.search = Search(my_config, model=self.model)
+
+    def serve_forever(self):
+        # Before the model is loaded, so that the saved search index can be used
+        self.search.load_index()
+        self.model.get_epics()
+        self.burnup_counters.rebuild(self.model.get_issues())
+        self.model.listeners.append(self.burnup_counters.update)
+
+        refresher = threading.Thread(target=self.refresh_loop, daemon=True)
+        refresher.start()
+
+        httpd = ThreadingHTTPServer((self.conf['bind'], self.conf['port']), DashboardHandler)
+        httpd.dashboard = self
+        print(f"Listening on http://{self.conf['bind']}:{self.conf['port']}/")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        httpd.server_close()
+        self.model.save_cache()
+        self.search.save_index()
+
+    def refresh_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the data we have. Next round will try again.
+                print(f"Refresh failed: {e}")
+
+    def refresh(self):
+        # Network round trips happen outside the lock, so pages can still be served meanwhile
+        changes = self.model.fetch_changes()
+        with self.lock:
+            if self.model.apply_changes(changes):
+                print(f"Model updated to version {self.model.version}")
+            self.model.save_cache()
+            self.search.save_index()
+        if self.conf['metrics_file']:
+            REGISTRY.write_textfile(self.conf['metrics_file'])
+
+    def webhook(self, payload):
+        """
+        Apply a Jira webhook payload to the model.
+
+        :return: True if the model changed.
+        :raises ValueError: if the payload is malformed, see JiraModel.apply_webhook().
+        """
+        with self.lock:
+            changed = self.model.apply_webhook(payload)
+
+        if self.conf['webhook_dir']:
+            # Saved so that it can be replayed later with the replay command
+            event = str(payload.get('webhookEvent', "unknown")).replace(":", "_")
+            name = f"{time.time_ns()}-{event}.json"
+            os.makedirs(self.conf['webhook_dir'], exist_ok=True)
+            with open(os.path.join(self.conf['webhook_dir'], name), "w") as f:
+                json.dump(payload, f)
+        if changed:
+            print(f"Webhook {payload.get('webhookEvent')} updated model to version {self.model.version}")
+        return changed
+
+    def get_page(self, path):
+        """
+        :return: The rendered page, or None if path isn't one of self.pages.
+        """
+        if path == "/":
+            return self.index_html()
+        if path not in self.pages:
+            return None
+
+        cached = self._cache.get(path)
+        if cached and cached[0] == self.model.version:
+            return cached[1]
+
+        with self.lock:
+            version = self.model.version
+            content = self.render(path)
+            self._cache[path] = (version, content)
+        return content
+
+    def render(self, path):
+        if path.startswith("/grid."):
+            grid = Grid(self.conf, model=self.model)
+            obj = grid.grid_obj(self.model.get_epics(), grid.project)
+            if path.endswith(".csv"):
+                return grid.grid_csv(obj, grid.project)
+            return grid.grid_html(obj, self.model.get_issues_per_epic(), grid.project)
+
+        if path.startswith("/burnup."):
+            burnup = Burnup(self.conf, model=self.model)
+            series, date_range = self.burnup_counters.series()
+            if path.endswith(".csv"):
+                return burnup.burnup_csv(series, date_range, burnup.project)
+            return burnup.burnup_html(series, date_range, burnup.project)
+
+        if path.startswith("/gantt."):
+            gantt = Gantt(self.conf, model=self.model)
+            epics = self.model.get_epics()
+            if path.endswith(".csv"):
+                return gantt.gantt_csv(epics, gantt.project)
+            if path.endswith(".svg"):
+                return gantt.draw_svg(epics, gantt.project)
+            markup = gantt.draw_group(epics, gantt.project)
+            if path.endswith(".mermaid"):
+                return markup
+            return gantt.mermaid.mermaid_html(markup, gantt.project)
+
+        if path.startswith("/dependencies."):
+            deps = Dependencies(self.conf, model=self.model)
+            if path.endswith(".svg"):
+                return deps.svg.dependencies(self.model.get_epics(), self.conf.args.groupby, deps.blocked())
+            markup = deps.draw_group(self.model.get_epics())
+            if path.endswith(".mermaid"):
+                return markup
+            return deps.mermaid.mermaid_html(markup, deps.project)
+
+    def search_html(self, query):
+        """
+        :return: Page with the issues matching query, see jiradash.search.
+        """
+        with self.lock:
+            return self.search.search_html(self.search.results(query), query)
+
+    def index_html(self):
+        links = "".join(f"<li><a href=\"{path}\">{path[1:]}</a></li>\n" for path in [*self.pages, "/search", "/metrics"])
+        return (f"<html>\n<head><title>JiraDash</title></head>\n<body>\n<ul>\n{links}</ul>\n"
+                f"<p>Model version {self.model.version}</p>\n</body>\n</html>")
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        dashboard = self.server.dashboard
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self.send_metrics()
+            return
+        try:
+            if path == "/search":
+                content = dashboard.search_html(parse_qs(urlparse(self.path).query).get("q", [""])[0])
+            else:
+                content = dashboard.get_page(path)
+        except Exception as e:
+            self.send_error(500, str(e))
+            raise
+
+        if content is None:
+            self.send_error(404)
+            return
+
+        content_type = dashboard.pages.get(path, "text/html")
+        body = content.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_metrics(self):
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        if openmetrics:
+            content_type = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+        else:
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        body = REGISTRY.render(openmetrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        dashboard = self.server.dashboard
+        url = urlparse(self.path)
+        if url.path != "/webhook":
+            self.send_error(404)
+            return
+        secret = dashboard.conf['webhook_secret']
+        if secret and parse_qs(url.query).get("secret") != [secret]:
+            self.send_error(403)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length))
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            self.send_error(400, "Expected a json object")
+            return
+
+        try:
+            dashboard.webhook(payload)
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        self.send_response(204)
+        self.end_headers()
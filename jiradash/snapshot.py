@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+"""
+Binary snapshot of normalized issues, read through mmap.
+
+Loading the json cache means parsing all raw Jira records and normalizing them again, which for
+100k issues takes seconds, mostly spent parsing dates. A snapshot stores the normalized issues
+instead, as columns:
+
+    magic       8 bytes "JDSNAP01"
+    synced_at   float64, fixed width so that it can be updated in place with set_synced_at()
+    header      uint32 length + json: row count, column layout and whatever the caller stores
+    strings     uint32 offsets (count + 1), then the utf-8 bytes of all distinct strings
+    columns     per column, 8 byte aligned, one of:
+                str    uint32 string index per row, NONE for None
+                float  float64 per row
+                date   float64 timestamp per row, NaN for None, then int32 utc offset seconds
+                list   CSR: uint32 indptr (rows + 1), then uint32 string indices
+    hashes      optional, uint64 per row, given by the caller
+
+Dependencies are a list column, so they are an adjacency array over the string table.
+
+Fixed width columns are read straight from the mapped pages with memoryview.cast(), nothing is
+copied before the issue dicts are built. Each distinct string is decoded only once.
+
+"""
+from datetime import datetime, timedelta, timezone
+import json
+import math
+import mmap
+import struct
+
+MAGIC = b"JDSNAP01"
+HEADER_OFFSET = len(MAGIC) + 8 + 4
+NONE = 0xFFFFFFFF
+
+# Normalized issue field -> column type. Fields missing from an issue, like epic_name for issues,
+# are stored as None.
+COLUMNS = {
+    "key": "str",
+    "url": "str",
+    "summary": "str",
+    "statusCategory": "str",
+    "components": "str",
+    "points": "float",
+    "fixVersions": "str",
+    "start_date": "date",
+    "created_date": "date",
+    "statuscategorychangedate": "date",
+    "resolution_date": "date",
+    "assignee": "str",
+    "project": "str",
+    "status": "str",
+    "issuetype": "str",
+    "resolution": "str",
+    "assignee_id": "str",
+    "all_components": "list",
+    "all_fixVersions": "list",
+    "all_deps": "list",
+    "sprints": "list",
+    "epic": "str",
+    "epic_name": "str",
+}
+
+
+def dump(objs, synced_at, hashes=None, **header):
+    """
+    :param dict objs: key -> normalized issue, as JiraModel has them. deps is not stored, it is
+                      derived from all_deps.
+    :param float synced_at: Time of the last sync with Jira.
+    :param dict hashes: Optional key -> 64 bit int to store with each issue, see Snapshot.hashes().
+    :param header: Anything json serializable to store in the header.
+    :return: The snapshot as bytes, or None if the issues have fields COLUMNS doesn't know.
+    """
+    rows = list(objs.values())
+    unknown = {name for obj in rows for name in obj} - set(COLUMNS) - {"deps"}
+    if unknown:
+        print(f"Not writing snapshot, no column for {sorted(unknown)}")
+        return None
+
+    strings = {}
+    def index(s):
+        if s is None:
+            return NONE
+        return strings.setdefault(s, len(strings))
+
+    sections = []
+    layout = {}
+    offset = 0
+    def add(name, data):
+        nonlocal offset
+        data += b"\0" * (-len(data) % 8)
+        layout[name] = offset
+        sections.append(data)
+        offset += len(data)
+
+    for name, column_type in COLUMNS.items():
+        values = [obj.get(name) for obj in rows]
+        if column_type == "str":
+            add(name, struct.pack(f"{len(rows)}I", *[index(v) for v in values]))
+        elif column_type == "float":
+            add(name, struct.pack(f"{len(rows)}d", *[math.nan if v is None else v for v in values]))
+        elif column_type == "date":
+            add(name, struct.pack(f"{len(rows)}d", *[math.nan if v is None else v.timestamp() for v in values]))
+            offsets = [0 if v is None else int(v.utcoffset().total_seconds()) for v in values]
+            add(name + ".tz", struct.pack(f"{len(rows)}i", *offsets))
+        else:
+            indptr = [0]
+            indices = []
+            for v in values:
+                indices += [index(s) for s in v or []]
+                indptr.append(len(indices))
+            add(name + ".indptr", struct.pack(f"{len(indptr)}I", *indptr))
+            add(name, struct.pack(f"{len(indices)}I", *indices))
+    if hashes is not None:
+        add("hashes", struct.pack(f"{len(rows)}Q", *[hashes[obj['key']] for obj in rows]))
+
+    encoded = [s.encode("utf-8") for s in strings]
+    string_offsets = [0]
+    for s in encoded:
+        string_offsets.append(string_offsets[-1] + len(s))
+
+    header = dict(header, rows=len(rows), strings=len(encoded), columns=COLUMNS, layout=layout)
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(HEADER_OFFSET + len(header_bytes)) % 8)
+    string_table = struct.pack(f"{len(string_offsets)}I", *string_offsets) + b"".join(encoded)
+    string_table += b"\0" * (-len(string_table) % 8)
+    return b"".join([MAGIC, struct.pack("dI", synced_at, len(header_bytes)), header_bytes, string_table] + sections)
+
+
+def set_synced_at(path, synced_at):
+    """
+    Update the sync time of a snapshot whose issues didn't change, without rewriting it.
+    """
+    with open(path, "r+b") as f:
+        f.seek(len(MAGIC))
+        f.write(struct.pack("d", synced_at))
+
+
+class Snapshot:
+    """
+    Read only view of a snapshot file. Use as a context manager, the file stays mapped until exit.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if bytes(self._view[:len(MAGIC)]) != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a JiraDash snapshot")
+
+        synced_at, header_len = struct.unpack_from("dI", self._mmap, len(MAGIC))
+        self.header = json.loads(bytes(self._view[HEADER_OFFSET:HEADER_OFFSET + header_len]))
+        self.header['synced_at'] = synced_at
+        self._strings_offset = HEADER_OFFSET + header_len
+        string_count = self.header['strings']
+        self._string_offsets = self._cast(self._strings_offset, "I", string_count + 1)
+        string_table_len = 4 * (string_count + 1) + self._string_offsets[-1]
+        self._data_offset = self._strings_offset + string_table_len + (-string_table_len % 8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Views into the map must be released before it can be closed
+        self._string_offsets = None
+        self._view.release()
+        self._mmap.close()
+
+    def _cast(self, offset, fmt, count):
+        return self._view[offset:offset + struct.calcsize(fmt) * count].cast(fmt)
+
+    def column(self, name, fmt, count=None):
+        """
+        :return: memoryview of a fixed width column, straight from the mapped file.
+        """
+        count = self.header['rows'] if count is None else count
+        return self._cast(self._data_offset + self.header['layout'][name], fmt, count)
+
+    def strings(self):
+        data = self._strings_offset + 4 * len(self._string_offsets)
+        offsets = self._string_offsets
+        view = self._view
+        return [str(view[data + offsets[i]:data + offsets[i + 1]], "utf-8") for i in range(len(offsets) - 1)]
+
+    def objs(self, strict=True):
+        """
+        :param bool strict: Refuse snapshots written with different COLUMNS. Otherwise fields the
+                            snapshot has no column for are left out, for reading old archived
+                            snapshots.
+        :return: dict of key -> normalized issue, with deps equal to all_deps.
+        """
+        if strict and self.header['columns'] != COLUMNS:
+            raise ValueError("Snapshot was written with different columns")
+        rows = self.header['rows']
+        strings = self.strings()
+
+        names = []
+        columns = []
+        for name, column_type in COLUMNS.items():
+            if self.header['columns'].get(name) != column_type:
+                continue
+            names.append(name)
+            if column_type == "str":
+                columns.append([strings[i] if i != NONE else None for i in self.column(name, "I")])
+            elif column_type == "float":
+                columns.append([None if math.isnan(v) else v for v in self.column(name, "d")])
+            elif column_type == "date":
+                columns.append(_dates(self.column(name, "d"), self.column(name + ".tz", "i")))
+            else:
+                indptr = self.column(name + ".indptr", "I", rows + 1)
+                indices = self.column(name, "I", indptr[rows]).tolist()
+                columns.append([[strings[i] for i in indices[indptr[r]:indptr[r + 1]]] for r in range(rows)])
+
+        objs = {}
+        for row in zip(*columns):
+            obj = dict(zip(names, row))
+            # Only issues have an epic, only epics have an epic_name
+            for name in ("epic", "epic_name"):
+                if name in obj and obj[name] is None:
+                    del obj[name]
+            obj["deps"] = list(obj["all_deps"])
+            objs[obj["key"]] = obj
+        return objs
+
+    def hashes(self):
+        """
+        :return: dict of key -> the hash given to dump(), or None if the snapshot has no hashes.
+        """
+        if "hashes" not in self.header['layout']:
+            return None
+        keys = [self.strings()[i] for i in self.column("key", "I")]
+        return dict(zip(keys, self.column("hashes", "Q").tolist()))
+
+
+def _dates(timestamps, offsets):
+    zones = {}
+    dates = []
+    for ts, offset in zip(timestamps, offsets):
+        if math.isnan(ts):
+            dates.append(None)
+            continue
+        if offset not in zones:
+            zones[offset] = timezone(timedelta(seconds=offset))
+        dates.append(datetime.fromtimestamp(ts, zones[offset]))
+    return dates
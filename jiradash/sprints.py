@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+"""
+Sprints, and the issues in each of them.
+
+Sprint names, boards and dates come from the Agile API, and are fetched and cached together with
+the rest of jiradash.metadata. Which sprints an issue was in comes with the issue itself, in the
+Sprint custom field, so no query per sprint is needed.
+
+SprintIndex maps each sprint to its issues. It is built in one pass over the issues and then kept
+up to date as a JiraModel listener, like EpicRollups, so velocity, the sprint bucket of burnup and
+the sprint columns of gantt are all computed from it without walking every issue again.
+
+"""
+import datetime
+import re
+from statistics import median
+from jiradash.util import parse_date
+
+# Sprints on older Jira servers are strings like
+# "com.atlassian.greenhopper.service.sprint.Sprint@1f3[id=12,rapidViewId=3,state=CLOSED,name=...]"
+SPRINT_ID = re.compile(r"\bid=(\d+)")
+
+# Length of sprints to extrapolate, when no closed sprints are known
+DEFAULT_SPRINT_DAYS = 14
+
+
+def sprint_ids(value):
+    """
+    :param value: Value of the Sprint custom field of an issue.
+    :return: list of the ids of the sprints the issue was in, as strings.
+    """
+    ids = []
+    for sprint in value or []:
+        if isinstance(sprint, dict):
+            ids.append(str(sprint['id']))
+        else:
+            found = SPRINT_ID.search(str(sprint))
+            if found:
+                ids.append(found.group(1))
+    return ids
+
+
+def sprint_info(sprint, board):
+    """
+    The fields of an Agile API sprint that the metadata cache keeps.
+    """
+    return {
+        'name': sprint['name'],
+        'state': sprint.get('state', "future"),
+        'board': board,
+        'start': sprint.get('startDate'),
+        'end': sprint.get('endDate'),
+        'complete': sprint.get('completeDate'),
+    }
+
+
+class SprintIndex:
+    """
+    Issues per sprint, and the committed, added and completed work of each sprint.
+
+    Without the issue changelogs it isn't known when an issue was added to a sprint. An issue
+    counts as committed if it was created before the sprint started, else as added during it.
+    """
+    def __init__(self, sprints):
+        """
+        :param dict sprints: sprint id -> sprint_info(), with dates as strings
+        """
+        self.sprints = {}
+        for sprint_id, info in sprints.items():
+            info = dict(info)
+            for name in ('start', 'end', 'complete'):
+                info[name] = parse_date(info[name]).date() if info[name] else None
+            self.sprints[sprint_id] = info
+        # sprint id -> {issue key: issue}
+        self.members = {}
+
+    def rebuild(self, issues):
+        self.members = {}
+        for key, obj in issues.items():
+            self.add(key, obj)
+
+    def add(self, key, obj):
+        for sprint_id in obj['sprints']:
+            self.members.setdefault(sprint_id, {})[key] = obj
+
+    def remove(self, key, obj):
+        for sprint_id in obj['sprints']:
+            members = self.members.get(sprint_id, {})
+            members.pop(key, None)
+            if not members:
+                self.members.pop(sprint_id, None)
+
+    def update(self, kind, key, old, new):
+        if kind != 'issues':
+            return
+        if old is not None:
+            self.remove(key, old)
+        if new is not None:
+            self.add(key, new)
+
+    def main_board(self):
+        """
+        :return: The board whose sprints have the most issues. Sprints of different boards
+                 overlap, so bucketing by sprint uses the sprints of one board.
+        """
+        issues = {}
+        for sprint_id, members in self.members.items():
+            board = self.sprints.get(sprint_id, {}).get('board')
+            if board is not None:
+                issues[board] = issues.get(board, 0) + len(members)
+        return max(issues, key=lambda board: (issues[board], str(board))) if issues else None
+
+    def started(self, board=None):
+        """
+        :return: list of (sprint id, info) of the sprints that have started, by start date.
+        """
+        sprints = [(sprint_id, info) for sprint_id, info in self.sprints.items()
+                   if info['start'] and info['state'] != "future" and (board is None or info['board'] == board)]
+        return sorted(sprints, key=lambda s: (s[1]['start'], s[0]))
+
+    def end(self, info):
+        return info['complete'] or info['end']
+
+    def velocity(self, sprint_id):
+        """
+        :return: dict with 'committed', 'added' and 'completed' issue counts, and the same with
+                 '_points' appended in story points.
+        """
+        info = self.sprints[sprint_id]
+        start, end = info['start'], self.end(info)
+        result = {'committed': 0, 'committed_points': 0.0, 'added': 0, 'added_points': 0.0,
+                  'completed': 0, 'completed_points': 0.0}
+        for obj in self.members.get(sprint_id, {}).values():
+            scope = "committed" if obj['created_date'] and obj['created_date'].date() <= start else "added"
+            result[scope] += 1
+            result[f"{scope}_points"] += obj['points']
+            resolved = obj['resolution_date'].date() if obj['resolution_date'] else None
+            if resolved and start <= resolved <= (end or datetime.date.max):
+                result['completed'] += 1
+                result['completed_points'] += obj['points']
+        return result
+
+    def windows(self, today=None):
+        """
+        :return: list of (name, start, end) dates of the started sprints of the main board. The
+                 end of the active sprint is today.
+        """
+        today = today if today else datetime.date.today()
+        windows = []
+        for sprint_id, info in self.started(self.main_board()):
+            end = today if info['state'] == "active" else self.end(info)
+            windows.append((info['name'], info['start'], min(end or today, today)))
+        return windows
+
+    def plan(self, until, today=None):
+        """
+        The active and future sprints of the main board, followed by sprints of the usual length
+        until the one that contains until.
+
+        :return: list of (name, start, end) dates
+        """
+        today = today if today else datetime.date.today()
+        board = self.main_board()
+        closed = [info for _, info in self.started(board) if info['state'] == "closed" and self.end(info)]
+        lengths = [((info['end'] or self.end(info)) - info['start']).days for info in closed]
+        length = datetime.timedelta(days=int(median(lengths)) if lengths else DEFAULT_SPRINT_DAYS)
+
+        coming = [info for info in self.sprints.values()
+                  if info['board'] == board and info['state'] in ("active", "future")]
+        coming.sort(key=lambda info: (info['start'] or datetime.date.max, info['name']))
+        plan = []
+        start = closed[-1]['end'] if closed and closed[-1]['end'] else today
+        # Keep the cadence of the last sprint, but don't plan sprints that are already over
+        while not coming and start + length <= today:
+            start += length
+        for info in coming:
+            start = info['start'] or start
+            end = info['end'] or start + length
+            plan.append((info['name'], start, end))
+            start = end
+        n = 1
+        while start <= until:
+            plan.append((f"Sprint +{n}", start, start + length))
+            start += length
+            n += 1
+        return plan
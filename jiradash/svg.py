@@ -0,0 +1,139 @@
+"""
+Draw gantt charts and dependency graphs as SVG directly, without mermaid-cli.
+
+Selected with `--renderer svg`. Bars of the gantt chart are placed at the dates computed by
+jiradash.schedule. The dependency graph uses a layered layout: an epic is placed one column to the
+right of the furthest of its dependencies, and epics within a column are ordered by the average
+position of their dependencies, which avoids most crossing edges.
+"""
+
+from .io import Writer
+from .schedule import topological_order
+import datetime
+from html import escape
+
+# statusCategory -> (fill, stroke, text color), the same as the mermaid classDefs
+COLORS = {
+    "To Do": ("#fff", "#999", "#777"),
+    "In Progress": ("#7a7", "#060", "#000"),
+    "Done": ("#999", "#222", "#000"),
+}
+CRITICAL_STROKE = "#c00"
+FONT = 'font-family="sans-serif" font-size="12"'
+
+
+class Svg(Writer):
+    row_height = 22
+    label_width = 360
+    day_width = 3
+
+    def gantt(self, sections, graph, schedule, title):
+        """
+        :param sections: list of (section name, list of keys), in drawing order
+        :param dict graph: key -> epic
+        :param dict schedule: key -> {'start', 'end', 'critical'}, see jiradash.schedule
+        """
+        keys = [key for _, section_keys in sections for key in section_keys]
+        first = min([schedule[key]['start'] for key in keys], default=datetime.date.today())
+        last = max([schedule[key]['end'] for key in keys], default=first)
+        days = (last - first).days + 1
+        width = self.label_width + days * self.day_width + 20
+        height = (len(keys) + 2 * len(sections) + 3) * self.row_height
+
+        x = lambda date: self.label_width + (date - first).days * self.day_width
+        out = [_svg_head(width, height, title)]
+
+        # Month ticks
+        month = datetime.date(first.year, first.month, 1)
+        while month <= last:
+            if month >= first:
+                out.append(f'<line x1="{x(month)}" y1="{self.row_height}" x2="{x(month)}" y2="{height}" stroke="#ddd"/>')
+                out.append(f'<text x="{x(month) + 2}" y="{self.row_height * 2 - 6}" {FONT} fill="#555">{month:%Y-%m}</text>')
+            month = datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        today = datetime.date.today()
+        if first <= today <= last:
+            out.append(f'<line x1="{x(today)}" y1="{self.row_height}" x2="{x(today)}" y2="{height}" stroke="#c00" stroke-dasharray="4"/>')
+
+        y = self.row_height * 2
+        for section, section_keys in sections:
+            y += self.row_height
+            out.append(f'<text x="4" y="{y + 15}" {FONT} font-weight="bold">{escape(str(section))}</text>')
+            y += self.row_height
+            for key in section_keys:
+                obj = graph[key]
+                s = schedule[key]
+                fill, stroke, color = COLORS.get(obj['statusCategory'], COLORS["To Do"])
+                stroke = CRITICAL_STROKE if s['critical'] else stroke
+                bar_width = max((s['end'] - s['start']).days * self.day_width, 2)
+                out.append(f'<a href="{escape(obj["url"])}" target="_blank"><title>{escape(obj["summary"])}</title>')
+                out.append(f'<text x="12" y="{y + 15}" {FONT} fill="#000">{escape(key)} {escape(obj["epic_name"])}</text>')
+                out.append(f'<rect x="{x(s["start"])}" y="{y + 3}" width="{bar_width}" height="{self.row_height - 6}" '
+                           f'fill="{fill}" stroke="{stroke}" stroke-width="2"/></a>')
+                y += self.row_height
+
+        out.append("</svg>\n")
+        return "\n".join(out)
+
+    def dependencies(self, graph, groupby=None, blocked=None):
+        """
+        :param dict graph: key -> epic, deps pruned to keys in graph
+        :param blocked: Keys to draw with a dashed red border, see Reachability.blocked()
+        """
+        blocked = blocked or {}
+        node_width, node_height, column_gap, row_gap = 220, 28, 60, 10
+        order, cyclic = topological_order(graph)
+        position = {key: i for i, key in enumerate(order)}
+
+        layer = {}
+        for key in order:
+            deps = [dep for dep in graph[key]['deps'] if position[dep] < position[key]]
+            layer[key] = 1 + max([layer[dep] for dep in deps], default=-1)
+
+        columns = {}
+        for key in order:
+            columns.setdefault(layer[key], []).append(key)
+        row = {}
+        for column in sorted(columns):
+            def barycenter(key):
+                rows = [row[dep] for dep in graph[key]['deps'] if dep in row]
+                return sum(rows) / len(rows) if rows else 0
+            group = lambda key: str(graph[key][groupby]) if groupby else ""
+            columns[column].sort(key=lambda k: (group(k), barycenter(k), k))
+            for i, key in enumerate(columns[column]):
+                row[key] = i
+
+        xy = {key: (20 + layer[key] * (node_width + column_gap), 40 + row[key] * (node_height + row_gap))
+              for key in graph}
+        width = 40 + (max(columns, default=0) + 1) * (node_width + column_gap)
+        height = 60 + max([len(keys) for keys in columns.values()], default=0) * (node_height + row_gap)
+
+        out = [_svg_head(width, height, self.project)]
+        out.append('<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" '
+                   'markerHeight="8" orient="auto"><path d="M0,0 L10,5 L0,10 z" fill="#666"/></marker></defs>')
+        for key, obj in graph.items():
+            x1, y1 = xy[key]
+            for dep in obj['deps']:
+                x2, y2 = xy[dep]
+                color = CRITICAL_STROKE if key in cyclic and dep in cyclic else "#666"
+                out.append(f'<line x1="{x1}" y1="{y1 + node_height / 2}" x2="{x2 + node_width}" '
+                           f'y2="{y2 + node_height / 2}" stroke="{color}" marker-end="url(#arrow)"/>')
+        for key, obj in graph.items():
+            x, y = xy[key]
+            fill, stroke, color = COLORS.get(obj['statusCategory'], COLORS["To Do"])
+            label = f"{key} {obj['epic_name']}"
+            label = label if len(label) <= 32 else label[:31] + "…"
+            out.append(f'<a href="{escape(obj["url"])}" target="_blank"><title>{escape(obj["summary"])}</title>')
+            dash = ' stroke-dasharray="5"' if key in blocked else ""
+            stroke = CRITICAL_STROKE if key in blocked else stroke
+            out.append(f'<rect x="{x}" y="{y}" width="{node_width}" height="{node_height}" rx="4" fill="{fill}" '
+                       f'stroke="{stroke}" stroke-width="2"{dash}/>')
+            out.append(f'<text x="{x + 6}" y="{y + 18}" {FONT} fill="{color}">{escape(label)}</text></a>')
+
+        out.append("</svg>\n")
+        return "\n".join(out)
+
+
+def _svg_head(width, height, title):
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">\n<rect width="100%" height="100%" fill="#fff"/>\n'
+            f'<text x="4" y="16" {FONT} font-weight="bold">{escape(title)}</text>')
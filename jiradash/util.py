@@ -0,0 +1,36 @@
+"""
+Small helpers shared by the other modules.
+
+Keep this module free of heavy imports. It is imported by pretty much everything, including
+commands that never talk to Jira.
+"""
+import argparse
+import re
+
+
+def safe_chars(string):
+    return re.sub(r'\W', " ", string)
+
+
+def parse_date(string):
+    """
+    Parse a Jira timestamp. Returns None for empty values.
+
+    dateutil is only imported the first time a date is actually parsed.
+    """
+    if not string:
+        return None
+    import dateutil.parser
+    return dateutil.parser.parse(string)
+
+
+class ConfigOverride:
+    """
+    A copy of a config with some options replaced. Reads like the original: conf['option'] or
+    conf.args.option.
+    """
+    def __init__(self, my_config, **overrides):
+        self.args = argparse.Namespace(**{**vars(my_config.args), **overrides})
+
+    def __getitem__(self, key):
+        return vars(self.args)[key]
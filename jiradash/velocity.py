@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""
+Committed and completed issues and story points per sprint.
+
+    ./JiraDash.py velocity
+
+Uses the sprints of the scrum boards of the project(s) and the Sprint field of the issues, see
+jiradash.sprints. Issues created after the sprint started count as added during the sprint.
+Completed means resolved between the start and the end of the sprint.
+
+"""
+import html
+from jiradash.io import Writer
+from jiradash.jira_model import create_model
+
+# Number of closed sprints to average velocity over
+AVERAGE_OVER = 3
+
+COLUMNS = [
+    ("committed", "Committed"), ("committed_points", "Committed points"),
+    ("added", "Added"), ("added_points", "Added points"),
+    ("completed", "Completed"), ("completed_points", "Completed points"),
+]
+
+def entry_point(my_config):
+    print(f"Listing velocity per sprint in project(s): {my_config['jira_project']}")
+    velocity = Velocity(my_config)
+    velocity.get_and_draw()
+
+class Velocity:
+    def __init__(self, my_config, model=None):
+        self.conf = my_config
+        self.model = model if model else create_model(my_config)
+        self.writer = Writer(my_config)
+        self.project = self.writer.project
+
+    def get_and_draw(self):
+        rows = self.velocity_rows()
+        if not rows:
+            print("No sprints found. Sprints are read from the scrum boards of the project(s).")
+        self.writer.csv(self.velocity_csv(rows))
+        self.writer.html(self.velocity_html(rows))
+
+    def velocity_rows(self):
+        """
+        :return: list of (sprint info, velocity dict) of the started sprints that have issues here.
+        """
+        sprints = self.model.get_sprints()
+        return [(info, sprints.velocity(sprint_id)) for sprint_id, info in sprints.started()
+                if sprint_id in sprints.members]
+
+    def average(self, rows):
+        """
+        :return: Average completed points of the last AVERAGE_OVER closed sprints, or None.
+        """
+        closed = [v['completed_points'] for info, v in rows if info['state'] == "closed"][-AVERAGE_OVER:]
+        return sum(closed) / len(closed) if closed else None
+
+    def velocity_csv(self, rows):
+        csv = f"{self.project}\tBoard\tState\tStart\tEnd\t" + "\t".join(label for _, label in COLUMNS) + "\n"
+        for info, v in rows:
+            csv += f"{info['name']}\t{info['board']}\t{info['state']}\t{info['start']}\t{info['end'] or ''}\t"
+            csv += "\t".join(str(v[name]) for name, _ in COLUMNS) + "\n"
+        average = self.average(rows)
+        if average is not None:
+            csv += f"\nAverage completed points, last {AVERAGE_OVER} closed sprints\t{average:g}\n"
+        return csv
+
+    def velocity_html(self, rows):
+        title = html.escape(f"{self.project} velocity")
+        head = "<tr><th>Sprint</th><th>Board</th><th>State</th><th>Start</th><th>End</th>"
+        head += "".join(f"<th>{label}</th>" for _, label in COLUMNS) + "<th></th></tr>\n"
+        most = max([max(v['committed_points'] + v['added_points'], v['completed_points']) for _, v in rows], default=0) or 1
+        body = ""
+        for info, v in rows:
+            scope = v['committed_points'] + v['added_points']
+            bars = (f"<div class=\"scope\" style=\"width: {100 * scope / most:.1f}%\"></div>"
+                    f"<div class=\"done\" style=\"width: {100 * v['completed_points'] / most:.1f}%\"></div>")
+            body += (f"<tr><td>{html.escape(info['name'])}</td><td>{info['board']}</td><td>{info['state']}</td>"
+                     f"<td>{info['start']}</td><td>{info['end'] or ''}</td>"
+                     + "".join(f"<td>{v[name]:g}</td>" for name, _ in COLUMNS)
+                     + f"<td class=\"bars\">{bars}</td></tr>\n")
+        average = self.average(rows)
+        footer = f"<p>Average completed points, last {AVERAGE_OVER} closed sprints: {average:g}</p>\n" if average is not None else ""
+
+        style = """<style type="text/css">
+    table {border-collapse: collapse; font-family: sans-serif;}
+    td, th {padding: 3px 8px; border-top: 1px solid #ddd; text-align: left;}
+    td.bars {width: 20em;}
+    td.bars div {height: 6px; margin: 1px 0;}
+    div.scope {background-color: #bbb;}
+    div.done {background-color: #090;}
+</style>
+"""
+        return (f"<html>\n<head><title>{title}</title>\n{style}</head>\n<body>\n<h1>{title}</h1>\n"
+                f"<table>\n{head}{body}</table>\n{footer}</body>\n</html>")
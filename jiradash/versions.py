@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+"""
+Order of fix versions.
+
+VersionIndex gives every version of the project(s) an integer rank, once per run, from the version
+metadata (see jiradash.metadata). Versions with a release date are in the order of their dates.
+Versions without a date go just before the first dated version with a higher version number, or to
+the end, released ones before unreleased ones. Versions whose name has no number, like "Backlog",
+come last, in the order Jira has them. This release order is used for grid columns and for the
+latest fix version.
+
+Version ranges, like fixVersion >= "2.0", follow the version sequence of each project in Jira
+instead, which is what Jira itself compares. That is the order Metadata.versions() returns.
+
+Version numbers are parsed tolerantly, see parse_version(), so "v2.1", "DSP 5.1.2" and "2.0-rc1"
+all work. Each name is parsed once, after that "latest fix version", version ranges and sorting are
+integer comparisons.
+
+"""
+import re
+
+NUMBER = re.compile(r"\d+(?:\.\d+)*")
+
+
+def parse_version(name):
+    """
+    :return: A tuple that sorts like semantic versions, 1.0 < 1.0.1 < 1.1-rc1 < 1.1, or None if
+             name has no version number in it.
+    """
+    found = NUMBER.search(name or "")
+    if not found:
+        return None
+    numbers = [int(n) for n in found.group(0).split(".")]
+    while len(numbers) > 1 and numbers[-1] == 0:
+        numbers.pop()
+    # "+build" metadata doesn't change the order
+    suffix = name[found.end():].split("+")[0].strip(" -.~_")
+    if not suffix:
+        return (tuple(numbers), (1,))
+    parts = tuple((0, int(p), "") if p.isdigit() else (1, 0, p.casefold()) for p in re.split(r"[.\-_ ]+", suffix) if p)
+    return (tuple(numbers), (0,) + parts)
+
+
+class VersionIndex:
+    def __init__(self, versions, sequences=None):
+        """
+        :param list versions: {'name', 'releaseDate', 'released'} dicts, as Metadata.versions()
+                              returns them. The first of versions with the same name is used.
+        :param list sequences: Lists of version names, one per project, in the order of
+                               Metadata.versions(project). Default is versions as one project.
+        """
+        unique = {}
+        for v in versions:
+            unique.setdefault(v['name'], v)
+        if sequences is None:
+            sequences = [[v['name'] for v in versions]]
+        # casefolded name -> list of (sequence, position) of the projects that have the version
+        self._positions = {}
+        self._sequences = [[name.casefold() for name in sequence] for sequence in sequences]
+        for i, sequence in enumerate(self._sequences):
+            for position, name in enumerate(sequence):
+                self._positions.setdefault(name, []).append((i, position))
+        # name -> parse_version(name)
+        self.parsed = {}
+
+        dated = []
+        undated = []
+        unnumbered = []
+        for v in unique.values():
+            parsed = self.parse(v['name'])
+            if parsed is None:
+                unnumbered.append(v['name'])
+            elif v.get('releaseDate'):
+                dated.append((v['releaseDate'], parsed, v['name']))
+            else:
+                undated.append((parsed, 0 if v.get('released') else 1, v['name']))
+        dated.sort()
+        undated.sort()
+
+        numbered = []
+        for date, parsed, name in dated:
+            while undated and undated[0][0] < parsed:
+                numbered.append(undated.pop(0)[2])
+            numbered.append(name)
+        numbered += [name for parsed, released, name in undated]
+
+        # Version names from first to last
+        self.names = numbered + unnumbered
+        self.ranks = {name: rank for rank, name in enumerate(self.names)}
+        # Ranks from here on are names without a version number
+        self.numbered = len(numbered)
+
+    def rank(self, name):
+        """
+        :return: Position of the version, from 0. -1 for names that aren't versions of the project(s).
+        """
+        return self.ranks.get(name, -1)
+
+    def parse(self, name):
+        """
+        :return: parse_version(name), parsed only once per name.
+        """
+        if name not in self.parsed:
+            self.parsed[name] = parse_version(name)
+        return self.parsed[name]
+
+    def latest(self, names):
+        """
+        :return: The last of the version names, preferring names with a version number, or None if
+                 names is empty.
+        """
+        return max(names, key=lambda name: (self.rank(name) < self.numbered, self.rank(name)), default=None)
+
+    def range(self, name, op):
+        """
+        :param str name: Casefolded version name.
+        :param str op: One of <, <=, >, >=
+        :return: list of the casefolded names before or after name in the version sequence of
+                 each project that has it, like Jira compares them. None if no project has name.
+        """
+        if name not in self._positions:
+            return None
+        found = []
+        for i, position in self._positions[name]:
+            sequence = self._sequences[i]
+            low, high = {"<": (0, position), "<=": (0, position + 1),
+                         ">": (position + 1, None), ">=": (position, None)}[op]
+            found += [n for n in sequence[low:high] if n not in found]
+        return found